@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class Where2GoConfig(AppConfig):
+    name = 'where2go'
+
+    def ready(self):
+        from .services import enable_sqlite_pragmas
+
+        enable_sqlite_pragmas()
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'where2go.settings')
+# Serve the poll and weather reads with the async views (see urls.py)
+os.environ.setdefault('WHERE2GO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
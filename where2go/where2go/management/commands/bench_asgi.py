@@ -0,0 +1,204 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from .weather_stub import make_stub_server
+
+ENDPOINTS = {
+    'weather': '/weather/data/',
+    'food': '/food-poll/data/',
+    'presence': '/presence-poll/data/',
+}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """A WSGI server with a fixed pool of worker threads, like a gunicorn gthread worker"""
+    request_queue_size = 1024
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def start_bench_server(mode, port, stub_port, wsgi_threads=8, cached=False):
+    """Start a WSGI (thread pool) or ASGI (uvicorn) server in a child process, using the stub for weather"""
+    env = dict(
+        os.environ,
+        WHERE2GO_ASYNC_VIEWS='1' if mode == 'asgi' else '0',
+        WHERE2GO_WEATHER_API_URL=f'http://127.0.0.1:{stub_port}/v1/forecast',
+    )
+    command = [
+        sys.executable, sys.argv[0], 'bench_asgi', '--serve', mode,
+        '--port', str(port), '--wsgi-threads', str(wsgi_threads),
+    ]
+    if cached:
+        command.append('--cached')
+    child = subprocess.Popen(command, env=env)
+
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if child.poll() is not None:
+            raise CommandError(f'The {mode} server exited with status {child.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return child
+        except OSError:
+            time.sleep(0.1)
+    child.terminate()
+    raise CommandError(f'The {mode} server did not start on port {port}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare how many concurrent connections the read endpoints sustain under WSGI '
+        '(fixed thread pool) and ASGI (uvicorn, async views), with a local stub in place '
+        'of Open-Meteo. Creates and removes its own user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='weather')
+        parser.add_argument('--concurrency', default='8,32,128', help='Comma-separated client connection counts')
+        parser.add_argument('--requests', type=int, default=256, help='Requests per run')
+        parser.add_argument('--wsgi-threads', type=int, default=8, help='Worker threads of the WSGI server')
+        parser.add_argument('--stub-delay', type=float, default=0.25, help='Seconds the weather stub takes to answer')
+        parser.add_argument('--cached', action='store_true', help='Keep the weather cache on (off by default, so every request reaches the stub)')
+        parser.add_argument('--port', type=int, default=8780, help='First of the three ports used (stub, WSGI, ASGI)')
+        # Internal: run one of the servers in a child process
+        parser.add_argument('--serve', choices=('wsgi', 'asgi'), help='Run a single server (used by the benchmark itself)')
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            return self.serve(options)
+
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('The ASGI run needs uvicorn: pip install uvicorn')
+
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma-separated list of integers')
+
+        stub_port, wsgi_port, asgi_port = options['port'], options['port'] + 1, options['port'] + 2
+        stub_calls = []
+        stub = make_stub_server('127.0.0.1', stub_port, options['stub_delay'], log=stub_calls.append)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        user = User.objects.create(username='bench_asgi_user', password=make_password(None))
+        session = self.create_session(user)
+        children = []
+        try:
+            for mode, port in (('wsgi', wsgi_port), ('asgi', asgi_port)):
+                children.append(start_bench_server(mode, port, stub_port, options['wsgi_threads'], options['cached']))
+
+            path = ENDPOINTS[options['endpoint']]
+            self.stdout.write(
+                f"{path}: {options['requests']} requests per run, stub delay {options['stub_delay']}s, "
+                f"WSGI with {options['wsgi_threads']} threads, weather cache {'on' if options['cached'] else 'off'}"
+            )
+            self.stdout.write(f"{'server':<6} {'conns':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'errors':>7} {'stub':>6}")
+            for concurrency in levels:
+                for mode, port in (('wsgi', wsgi_port), ('asgi', asgi_port)):
+                    del stub_calls[:]
+                    result = self.run_load(f'http://127.0.0.1:{port}{path}', session, concurrency, options['requests'])
+                    self.stdout.write(
+                        f"{mode:<6} {concurrency:>6} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+                        f"{result['p95']:>9.1f} {result['max']:>9.1f} {result['errors']:>7} {len(stub_calls):>6}"
+                    )
+        finally:
+            for child in children:
+                child.terminate()
+                child.wait()
+            stub.shutdown()
+            user.delete()
+
+    def create_session(self, user):
+        """A logged-in session for `user`, as the login view would create it"""
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        return store.session_key
+
+    def run_load(self, url, session_key, concurrency, total):
+        local = threading.local()
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def fetch(_):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.cookies.set(settings.SESSION_COOKIE_NAME, session_key)
+            started = time.monotonic()
+            try:
+                response = local.session.get(url, timeout=60)
+                ok = response.status_code == 200 and response.json().get('success')
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = (time.monotonic() - started) * 1000
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(fetch, range(total)))
+        wall = time.monotonic() - started
+
+        latencies.sort()
+        return {
+            'rps': len(latencies) / wall if wall else 0.0,
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+            'max': latencies[-1] if latencies else 0.0,
+            'errors': len(errors),
+        }
+
+    def serve(self, options):
+        if not options['cached']:
+            from django.test import override_settings
+            override_settings(
+                CACHES={**settings.CACHES, 'bench': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                WEATHER_CACHE_ALIAS='bench',
+            ).enable()
+
+        if options['serve'] == 'asgi':
+            import uvicorn
+            from django.core.asgi import get_asgi_application
+            uvicorn.run(get_asgi_application(), host='127.0.0.1', port=options['port'], log_level='warning', lifespan='off')
+        else:
+            from django.core.wsgi import get_wsgi_application
+            server = PooledWSGIServer(('127.0.0.1', options['port']), options['wsgi_threads'])
+            server.set_app(get_wsgi_application())
+            server.serve_forever()
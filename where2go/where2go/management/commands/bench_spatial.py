@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from where2go.services import GridIndex, haversine_km
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the restaurant grid index on synthetic venues (in memory, the database is not touched): '
+        'build time, k-nearest and radius query latency against a linear haversine scan, '
+        'and a check that both return the same results.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--radius', type=float, default=1.0, help='Radius of the radius queries, in km')
+        parser.add_argument('--categories', type=int, default=30)
+        parser.add_argument('--cell', type=float, default=0.01, help='Grid cell side in degrees')
+        parser.add_argument('--spread', type=float, default=0.5, help='Half side in degrees of the area around Reggio Emilia')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        center_lat, center_lon, spread = 44.6983, 10.6312, options['spread']
+        k, radius, categories = options['k'], options['radius'], options['categories']
+
+        # Venues clustered around a few town centres, like real restaurants
+        towns = [
+            (center_lat + rng.uniform(-spread, spread), center_lon + rng.uniform(-spread, spread))
+            for _ in range(20)
+        ]
+        venues = []
+        for venue_id in range(options['venues']):
+            town_lat, town_lon = rng.choice(towns)
+            venues.append((
+                venue_id,
+                town_lat + rng.gauss(0, spread / 10),
+                town_lon + rng.gauss(0, spread / 10),
+                rng.randrange(categories),
+            ))
+
+        started = time.perf_counter()
+        index = GridIndex(options['cell'])
+        for venue_id, lat, lon, category in venues:
+            index.insert(venue_id, lat, lon, category)
+        build = time.perf_counter() - started
+        self.stdout.write(f'Built index of {len(index)} venues in {len(index.cells)} cells in {build:.2f}s')
+
+        queries = [
+            (center_lat + rng.uniform(-spread, spread), center_lon + rng.uniform(-spread, spread),
+             rng.randrange(categories) if rng.random() < 0.5 else None)
+            for _ in range(options['queries'])
+        ]
+
+        def linear_nearest(lat, lon, category):
+            distances = sorted(
+                (haversine_km(lat, lon, v_lat, v_lon), venue_id)
+                for venue_id, v_lat, v_lon, v_category in venues if category is None or v_category == category
+            )
+            return distances[:k]
+
+        def linear_within(lat, lon, category):
+            return sorted(
+                (distance, venue_id) for venue_id, v_lat, v_lon, v_category in venues
+                if (category is None or v_category == category)
+                and (distance := haversine_km(lat, lon, v_lat, v_lon)) <= radius
+            )
+
+        # The linear scan is slow: compare on a sample of the queries
+        sample = queries[:max(1, min(len(queries), 50))]
+        rows = [
+            ('k-nearest', lambda q: index.nearest(q[0], q[1], k, tag=q[2]), linear_nearest),
+            (f'within {radius:g} km', lambda q: index.within(q[0], q[1], radius, tag=q[2]), linear_within),
+        ]
+        mismatches = 0
+        for label, indexed, linear in rows:
+            index_times = []
+            for query in queries:
+                started = time.perf_counter()
+                indexed(query)
+                index_times.append((time.perf_counter() - started) * 1000)
+
+            linear_times = []
+            for query in sample:
+                started = time.perf_counter()
+                expected = linear(*query)
+                linear_times.append((time.perf_counter() - started) * 1000)
+                result = indexed(query)
+                if [venue_id for _, venue_id in result] != [venue_id for _, venue_id in expected]:
+                    # Equal distances may come back in a different order: compare the distances too
+                    if [round(d, 9) for d, _ in result] != [round(d, 9) for d, _ in expected]:
+                        mismatches += 1
+
+            index_times.sort()
+            self.stdout.write(
+                f'{label:<16} grid p50 {statistics.median(index_times):8.3f} ms  '
+                f'p95 {index_times[int(len(index_times) * 0.95) - 1]:8.3f} ms  |  '
+                f'linear p50 {statistics.median(linear_times):8.3f} ms  '
+                f'({statistics.median(linear_times) / max(statistics.median(index_times), 1e-9):.0f}x)'
+            )
+
+        if mismatches:
+            raise CommandError(f'{mismatches} queries returned different results from the linear scan')
+        self.stdout.write(self.style.SUCCESS(f'Grid results match the linear scan on {len(sample)} queries per kind'))
@@ -0,0 +1,243 @@
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signals
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+
+from where2go.models import Categories
+from where2go.services import (
+    build_food_poll_snapshot, build_presence_poll_data, get_sqlite_pragmas, get_user_food_vote_ids,
+    toggle_food_poll_vote,
+)
+
+MODES = ('default', 'tuned')
+
+# SQLite and Django defaults: rollback journal, deferred transactions, a new connection per request
+DEFAULT_CONFIG = {'pragmas': {}, 'transaction_mode': None, 'conn_max_age': 0}
+
+
+def mode_config(mode):
+    """PRAGMAs, transaction mode and CONN_MAX_AGE of a mode; 'tuned' is what settings.py configures"""
+    if mode == 'default':
+        return DEFAULT_CONFIG
+    database = settings.DATABASES['default']
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', None) or {})
+    # The benchmark databases are throwaway copies: WAL is measured even when WHERE2GO_SQLITE_WAL is off
+    if pragmas:
+        pragmas.setdefault('journal_mode', 'WAL')
+    return {
+        'pragmas': pragmas,
+        'transaction_mode': database.get('OPTIONS', {}).get('transaction_mode'),
+        'conn_max_age': database.get('CONN_MAX_AGE') or 60,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark mixed read/write throughput on a copy of a seeded SQLite database, with the old '
+        'default configuration and with the tuned one (WAL, busy_timeout, synchronous=NORMAL, cache, '
+        'mmap, IMMEDIATE transactions, persistent connections). Several worker processes read the '
+        'poll snapshots and toggle food votes, each operation wrapped like a request. The real '
+        'database is not touched.'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='default,tuned', help=f"Comma-separated, from: {', '.join(MODES)}")
+        parser.add_argument('--workers', type=int, default=8, help='Worker processes, like gunicorn workers')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds each mode runs')
+        parser.add_argument('--write-share', type=float, default=0.2, help='Fraction of operations that are vote toggles')
+        parser.add_argument('--users', type=int, default=2000, help='Users seeded in the benchmark database')
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the temporary databases')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        # Internal: run one worker process (or prepare the database) against --database
+        parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+        parser.add_argument('--prepare', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--database', help=argparse.SUPPRESS)
+        parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['prepare']:
+            return self.prepare(options)
+        if options['worker']:
+            return self.run_worker(options)
+
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only applies to SQLite')
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = sorted(set(modes) - set(MODES))
+        if unknown or not modes:
+            raise CommandError(f"Unknown modes: {', '.join(unknown) or '(none)'}")
+        if options['workers'] < 1 or options['duration'] <= 0 or not 0 <= options['write_share'] <= 1:
+            raise CommandError('--workers and --duration must be positive, --write-share between 0 and 1')
+
+        directory = tempfile.mkdtemp(prefix='where2go-bench-sqlite-')
+        try:
+            template = os.path.join(directory, 'template.sqlite3')
+            self.stdout.write(f"Preparing {template} ({options['users']} users, {options['categories']} categories)...")
+            prepared = self.spawn(['--prepare', '--database', template], options)
+            if prepared.returncode:
+                raise CommandError(f'Preparing the database failed:\n{prepared.stderr[-2000:]}')
+
+            report = {'options': {key: options[key] for key in ('workers', 'duration', 'write_share', 'users', 'categories')}}
+            for mode in modes:
+                database = os.path.join(directory, f'{mode}.sqlite3')
+                # Same starting data for every mode; the template is still in rollback journal mode
+                shutil.copyfile(template, database)
+                report[mode] = self.run_mode(mode, database, options)
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Databases kept in {directory}')
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        self.print_report(report, modes)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+                file.write('\n')
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def spawn(self, arguments, options, wait=True):
+        command = [sys.executable, sys.argv[0], 'bench_sqlite', *arguments, '--seed', str(options['seed'])]
+        command += ['--users', str(options['users']), '--categories', str(options['categories'])]
+        if wait:
+            return subprocess.run(command, capture_output=True, text=True)
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def run_mode(self, mode, database, options):
+        self.stdout.write(f"Running '{mode}': {options['workers']} workers for {options['duration']:g}s...")
+        start_at = time.time() + 2
+        workers = [
+            self.spawn([
+                '--worker', mode, '--database', database, '--duration', str(options['duration']),
+                '--write-share', str(options['write_share']), '--seed', str(options['seed'] + index),
+                '--start-at', str(start_at),
+            ], options, wait=False)
+            for index in range(options['workers'])
+        ]
+        results = []
+        for worker in workers:
+            stdout, stderr = worker.communicate()
+            if worker.returncode:
+                raise CommandError(f"Worker for '{mode}' failed:\n{stderr[-2000:]}")
+            results.append(json.loads(stdout.strip().splitlines()[-1]))
+
+        summary = {'pragmas': results[0]['pragmas'], 'errors': {}}
+        for kind in ('read', 'write'):
+            latencies = sorted(latency for result in results for latency in result[f'{kind}_ms'])
+            summary[kind] = {
+                'ops': len(latencies),
+                'per_second': round(len(latencies) / options['duration'], 1),
+                'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+                'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 2) if latencies else None,
+            }
+        for result in results:
+            for message, count in result['errors'].items():
+                summary['errors'][message] = summary['errors'].get(message, 0) + count
+        summary['connections'] = sum(result['connections'] for result in results)
+        return summary
+
+    def print_report(self, report, modes):
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'mode':<10} {'reads/s':>9} {'p50':>8} {'p95':>8} {'writes/s':>9} {'p50':>8} {'p95':>8} "
+            f"{'errors':>7} {'conns':>7}"
+        )
+        for mode in modes:
+            result = report[mode]
+            read, write = result['read'], result['write']
+            self.stdout.write(
+                f"{mode:<10} {read['per_second']:>9} {read['p50_ms'] or '-':>8} {read['p95_ms'] or '-':>8} "
+                f"{write['per_second']:>9} {write['p50_ms'] or '-':>8} {write['p95_ms'] or '-':>8} "
+                f"{sum(result['errors'].values()):>7} {result['connections']:>7}"
+            )
+        for mode in modes:
+            self.stdout.write(f"{mode}: {report[mode]['pragmas']}")
+            for message, count in sorted(report[mode]['errors'].items(), key=lambda item: -item[1]):
+                self.stdout.write(f'  {count} x {message}')
+
+    def use_database(self, path, config):
+        """Point the default connection at `path` with the given mode, before it is first opened"""
+        connection.close()
+        connection.settings_dict['NAME'] = path
+        connection.settings_dict['CONN_MAX_AGE'] = config['conn_max_age']
+        connection.settings_dict['OPTIONS'] = {
+            key: value for key, value in connection.settings_dict.get('OPTIONS', {}).items() if key != 'transaction_mode'
+        }
+        if config['transaction_mode']:
+            connection.settings_dict['OPTIONS']['transaction_mode'] = config['transaction_mode']
+        settings.SQLITE_PRAGMAS = config['pragmas']
+
+    def prepare(self, options):
+        self.use_database(options['database'], DEFAULT_CONFIG)
+        call_command('migrate', interactive=False, verbosity=0)
+        call_command(
+            'seed_data', seed=options['seed'], users=options['users'], categories=options['categories'],
+            restaurants=options['categories'] * 10, reviews=options['users'], prefix='bench_', stdout=io.StringIO(),
+        )
+        connection.close()
+
+    def run_worker(self, options):
+        config = mode_config(options['worker'])
+        self.use_database(options['database'], config)
+        opened = []
+
+        def count_connection(sender, **kwargs):
+            opened.append(sender)
+
+        connection_created.connect(count_connection)
+
+        rng = random.Random(options['seed'])
+        users = list(User.objects.filter(username__startswith='bench_').only('id', 'username'))
+        category_ids = list(Categories.objects.values_list('id', flat=True))
+        pragmas = get_sqlite_pragmas(connection, list(config['pragmas']) or ['journal_mode', 'synchronous', 'busy_timeout'])
+        connection.close()
+        opened.clear()
+
+        # All workers start together
+        time.sleep(max(0, options['start_at'] - time.time()))
+        read_ms, write_ms, errors = [], [], {}
+        deadline = time.perf_counter() + options['duration']
+        while time.perf_counter() < deadline:
+            user = rng.choice(users)
+            write = rng.random() < options['write_share']
+            # Like a request: close_old_connections runs on request_started and request_finished
+            signals.request_started.send(sender=self.__class__)
+            started = time.perf_counter()
+            try:
+                if write:
+                    toggle_food_poll_vote(user, rng.choice(category_ids))
+                else:
+                    # What the dashboard polls: both snapshots and the user's own votes
+                    build_food_poll_snapshot()
+                    build_presence_poll_data()
+                    get_user_food_vote_ids(user)
+            except OperationalError as e:
+                errors[str(e)] = errors.get(str(e), 0) + 1
+            else:
+                (write_ms if write else read_ms).append(round((time.perf_counter() - started) * 1000, 3))
+            finally:
+                signals.request_finished.send(sender=self.__class__)
+        connection.close()
+
+        self.stdout.write(json.dumps({
+            'read_ms': read_ms, 'write_ms': write_ms, 'errors': errors,
+            'connections': len(opened), 'pragmas': pragmas,
+        }))
@@ -0,0 +1,152 @@
+import json
+import logging
+import statistics
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from where2go.tests.query_budgets import (
+    HOT_ENDPOINTS, QUERY_BUDGETS, client_for, endpoint_requests, measure_queries, seed_dataset, send,
+    unbudgeted_url_names,
+)
+
+from .weather_stub import make_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Query-budget and timing report: seeds a throwaway test database at each --sizes voter count, '
+        'calls every named URL in where2go/urls.py and fails if an endpoint runs more queries than its '
+        'budget or if its query count changes with the data size. Also times the hottest endpoints; '
+        'with --baseline, fails when they got slower than the tolerance allows. The budgets live in '
+        'where2go/tests/query_budgets.py and are also checked by manage.py test (test_query_budgets).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000', help='Comma-separated voter counts to seed and compare')
+        parser.add_argument('--timing-runs', type=int, default=20, help='Requests per hot endpoint for the timings (0 to skip)')
+        parser.add_argument('--baseline', help='JSON report of an earlier run to compare the timings with')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed slowdown over the baseline median (0.5 = +50%%)')
+        parser.add_argument('--slack-ms', type=float, default=2.0, help='Absolute slowdown always allowed, for sub-millisecond jitter')
+        parser.add_argument('--output', help='Write the JSON report to this file (usable as the next --baseline)')
+        parser.add_argument('--stub-port', type=int, default=8799, help='Port of the local weather stub')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+        if not sizes or min(sizes) < 1:
+            raise CommandError('--sizes needs at least one positive voter count')
+
+        missing = unbudgeted_url_names()
+        if missing:
+            raise CommandError(f"No query budget for: {', '.join(missing)} (add them to QUERY_BUDGETS)")
+
+        stub = make_stub_server('127.0.0.1', options['stub_port'])
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        # Expected 4xx/5xx answers (e.g. /metrics when disabled) would otherwise be logged for every call
+        request_logger = logging.getLogger('django.request')
+        request_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(
+                # Every cache lookup misses, so the counts are the worst case and do not depend on run order
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                WEATHER_API_URL=f"http://127.0.0.1:{options['stub_port']}/v1/forecast",
+                # Votes are budgeted on the synchronous write path, not on the write-behind queue
+                VOTE_QUEUE='',
+            ):
+                report = {'sizes': {}}
+                for size in sizes:
+                    report['sizes'][str(size)] = self.measure(size, options['timing_runs'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            stub.shutdown()
+            request_logger.setLevel(request_level)
+
+        failures = self.find_failures(report, sizes, options)
+        self.print_report(report, sizes)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+                file.write('\n')
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if failures:
+            for failure in failures:
+                self.stderr.write(failure)
+            raise CommandError(f'{len(failures)} query budget check(s) failed')
+        self.stdout.write(self.style.SUCCESS('All endpoints within their query budgets'))
+
+    def measure(self, size, timing_runs):
+        call_command('flush', interactive=False, verbosity=0)
+        fixtures = seed_dataset(size)
+        queries = measure_queries(fixtures)
+
+        requests = endpoint_requests(fixtures)
+        timings = {}
+        for name in HOT_ENDPOINTS if timing_runs else ():
+            method, kwargs, data, body, anonymous, mutates = requests[name]
+            path = reverse(name, kwargs=kwargs)
+            elapsed = []
+            for _ in range(timing_runs):
+                with transaction.atomic():
+                    client = client_for(fixtures['staff'], anonymous)
+                    started = time.perf_counter()
+                    send(client, method, path, data, body)
+                    elapsed.append((time.perf_counter() - started) * 1000)
+                    transaction.set_rollback(True)
+            elapsed.sort()
+            timings[name] = {
+                'median_ms': round(statistics.median(elapsed), 2),
+                'p95_ms': round(elapsed[max(0, int(len(elapsed) * 0.95) - 1)], 2),
+            }
+        return {'queries': queries, 'timings': timings}
+
+    def find_failures(self, report, sizes, options):
+        failures = []
+        smallest = report['sizes'][str(sizes[0])]['queries']
+        for size in sizes:
+            for name, count in sorted(report['sizes'][str(size)]['queries'].items()):
+                if count > QUERY_BUDGETS[name]:
+                    failures.append(f'{name}: {count} queries with {size} voters, budget {QUERY_BUDGETS[name]}')
+                if count != smallest[name]:
+                    failures.append(f'{name}: {smallest[name]} queries with {sizes[0]} voters but {count} with {size}')
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            for size in sizes:
+                previous = baseline.get('sizes', {}).get(str(size), {}).get('timings', {})
+                for name, timing in report['sizes'][str(size)]['timings'].items():
+                    limit = previous.get(name, {}).get('median_ms')
+                    if limit is not None and timing['median_ms'] > limit * (1 + options['tolerance']) + options['slack_ms']:
+                        failures.append(
+                            f"{name}: median {timing['median_ms']} ms with {size} voters, baseline {limit} ms"
+                        )
+        return failures
+
+    def print_report(self, report, sizes):
+        header = f"{'endpoint':<34} {'budget':>6}" + ''.join(f' {size:>8}q' for size in sizes)
+        header += ''.join(f' {size:>8}ms' for size in sizes)
+        self.stdout.write(header)
+        for name in sorted(QUERY_BUDGETS):
+            line = f'{name:<34} {QUERY_BUDGETS[name]:>6}'
+            line += ''.join(f" {report['sizes'][str(size)]['queries'].get(name, '-'):>9}" for size in sizes)
+            for size in sizes:
+                timing = report['sizes'][str(size)]['timings'].get(name)
+                line += f" {timing['median_ms'] if timing else '':>10}"
+            self.stdout.write(line)
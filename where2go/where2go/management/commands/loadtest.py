@@ -0,0 +1,331 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from where2go.models import Categories, FoodPoll
+from where2go.services import notify_poll_change, remove_food_poll_votes_from_tallies
+
+from .bench_asgi import start_bench_server
+from .weather_stub import make_stub_server
+
+USERNAME_PREFIX = 'loadtest_user_'
+
+# Endpoints hit once per user while logging in, before the polling phase starts
+LOGIN_ENDPOINTS = ('auth_page', 'login', 'dashboard', 'weather_data')
+
+
+class EndpointStats:
+    """Latencies and outcomes of one endpoint, shared by all client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, status, seconds, ok):
+        with self.lock:
+            self.latencies.append(seconds * 1000)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not ok:
+                self.errors += 1
+
+    def report(self, duration):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            count = len(latencies)
+            return {
+                'requests': count,
+                'errors': self.errors,
+                'error_rate': round(self.errors / count, 4) if count else 0.0,
+                'throughput_rps': round(count / duration, 2) if duration else 0.0,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+                'statuses': {str(status): total for status, total in sorted(self.statuses.items(), key=lambda item: str(item[0]))},
+            }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return round(sorted_values[int(rank) - 1], 2)
+
+
+class DashboardClient:
+    """
+    One synthetic user: logs in through the auth page, then polls the poll
+    endpoints like the dashboard does (compact format, ?since=, ETags and
+    the name dictionary tokens).
+    """
+
+    def __init__(self, base_url, username, password, stats):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.session = requests.Session()
+        self.session.headers['X-Requested-With'] = 'XMLHttpRequest'
+        self.etags = {}
+        self.food_version = None
+        self.tokens = {}
+
+    def call(self, name, method, path, ok_statuses=(200,), json_success=True, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.stats[name].record('error', time.perf_counter() - started, False)
+            return None
+        elapsed = time.perf_counter() - started
+
+        ok = response.status_code in ok_statuses
+        if ok and json_success and response.status_code == 200:
+            try:
+                ok = bool(response.json().get('success'))
+            except ValueError:
+                ok = False
+        self.stats[name].record(response.status_code, elapsed, ok)
+        return response if ok else None
+
+    def login(self):
+        if self.call('auth_page', 'GET', '/', json_success=False) is None:
+            return False
+        response = self.call(
+            'login', 'POST', '/', ok_statuses=(302,), json_success=False, allow_redirects=False,
+            data={
+                'form_type': 'login', 'username': self.username, 'password': self.password,
+                'csrfmiddlewaretoken': self.session.cookies.get(settings.CSRF_COOKIE_NAME, ''),
+            },
+            headers={'Referer': self.base_url + '/'},
+        )
+        if response is None:
+            return False
+        self.call('dashboard', 'GET', '/dashboard/', json_success=False)
+        self.call('weather_data', 'GET', '/weather/data/')
+        return True
+
+    def poll_food(self):
+        params = {'format': 'compact'}
+        if self.food_version is not None:
+            params['since'] = self.food_version
+        params.update(self.tokens)
+        response = self.conditional_get('food_poll_data', '/food-poll/data/', params)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            self.food_version = data.get('version')
+            for name in ('categories', 'users'):
+                if f'{name}_token' in data:
+                    self.tokens[name] = data[f'{name}_token']
+
+    def poll_presence(self):
+        params = {'format': 'compact'}
+        if 'users' in self.tokens:
+            params['users'] = self.tokens['users']
+        self.conditional_get('presence_poll_data', '/presence-poll/data/', params)
+
+    def conditional_get(self, name, path, params):
+        headers = {'If-None-Match': self.etags[name]} if name in self.etags else {}
+        response = self.call(name, 'GET', path, ok_statuses=(200, 304), params=params, headers=headers)
+        if response is not None and response.headers.get('ETag'):
+            self.etags[name] = response.headers['ETag']
+        return response
+
+    def vote_food(self, category_id):
+        self.post_json('food_poll_vote', '/food-poll/vote/', {'category_id': category_id})
+
+    def vote_presence(self, presence):
+        self.post_json('presence_poll_vote', '/presence-poll/vote/', {'presence_value': presence})
+
+    def post_json(self, name, path, body):
+        self.call(
+            name, 'POST', path, params={'format': 'compact'}, json=body,
+            headers={'X-CSRFToken': self.session.cookies.get(settings.CSRF_COOKIE_NAME, ''), 'Referer': self.base_url + '/'},
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate a Friday-afternoon voting rush: N synthetic users log in through the auth page, '
+        'poll /food-poll/data/ and /presence-poll/data/ every second like the dashboard and toggle '
+        'votes at a fixed rate. Prints (or writes) a JSON report with throughput, p50/p95/p99 latency '
+        'and error rate per endpoint. Without --url it starts its own server, with a local stub in '
+        'place of Open-Meteo. Creates and removes its own users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Synthetic users logged in at the same time')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of polling after all users logged in')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of each user (the dashboard uses 1)')
+        parser.add_argument('--vote-rate', type=float, default=5.0, help='Vote toggles per second, across all users')
+        parser.add_argument('--presence-share', type=float, default=0.2, help='Fraction of votes cast on the presence poll')
+        parser.add_argument('--url', help='Base URL of a running server (its WHERE2GO_WEATHER_API_URL should point at the stub)')
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi', help='Server started when --url is not given')
+        parser.add_argument('--wsgi-threads', type=int, default=16, help='Worker threads of the WSGI server')
+        parser.add_argument('--port', type=int, default=8790, help='Port of the server started without --url')
+        parser.add_argument('--stub-port', type=int, default=8789, help='Port of the weather stub')
+        parser.add_argument('--stub-delay', type=float, default=0.2, help='Seconds the weather stub takes to answer')
+        parser.add_argument('--seed', type=int, help='Random seed for the vote sequence')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['duration'] <= 0 or options['poll_interval'] <= 0:
+            raise CommandError('--users, --duration and --poll-interval must be positive')
+        rng = random.Random(options['seed'])
+
+        stub = make_stub_server('127.0.0.1', options['stub_port'], options['stub_delay'])
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        password = f'loadtest-{rng.random()}'
+        users, created_categories = self.create_fixtures(options['users'], password)
+        category_ids = list(Categories.objects.values_list('id', flat=True))
+        child = None
+        try:
+            base_url = (options['url'] or '').rstrip('/')
+            if not base_url:
+                child = start_bench_server(
+                    options['server'], options['port'], options['stub_port'], options['wsgi_threads'], cached=True
+                )
+                base_url = f"http://127.0.0.1:{options['port']}"
+            report = self.run(base_url, users, password, category_ids, rng, options)
+        finally:
+            if child is not None:
+                child.terminate()
+                child.wait()
+            stub.shutdown()
+            self.remove_fixtures(users, created_categories)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def create_fixtures(self, count, password):
+        # Hashing once: every synthetic user shares the same password hash
+        hashed = make_password(password)
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{index}', password=hashed) for index in range(count)])
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+
+        created = []
+        if not Categories.objects.exists():
+            created = [Categories.objects.create(name=f'Load test {index}') for index in range(3)]
+            notify_poll_change('food', [category.id for category in created])
+        return users, created
+
+    def remove_fixtures(self, users, created_categories):
+        # Same bookkeeping as deleting users from the admin dashboard
+        with transaction.atomic():
+            voted_category_ids = list(FoodPoll.objects.filter(user__in=users).values_list('category_id', flat=True))
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            remove_food_poll_votes_from_tallies(voted_category_ids)
+            notify_poll_change('food', voted_category_ids)
+            notify_poll_change('presence')
+        for category in created_categories:
+            category.delete()
+            notify_poll_change('food', [category.id])
+
+    def run(self, base_url, users, password, category_ids, rng, options):
+        endpoints = LOGIN_ENDPOINTS + (
+            'food_poll_data', 'presence_poll_data', 'food_poll_vote', 'presence_poll_vote',
+        )
+        stats = {name: EndpointStats() for name in endpoints}
+        clients = [DashboardClient(base_url, user.username, password, stats) for user in users]
+
+        # Log everyone in first (a rush of logins), then start the clock
+        login_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(len(clients), 32)) as executor:
+            logged_in = [client for client, ok in zip(clients, executor.map(DashboardClient.login, clients)) if ok]
+        login_seconds = time.monotonic() - login_started
+        if not logged_in:
+            raise CommandError(f'No synthetic user could log in at {base_url}')
+
+        stop = threading.Event()
+        started = time.monotonic()
+        deadline = started + options['duration']
+
+        def poll_loop(client, offset):
+            # Spread the users over the interval, like browsers opened at different moments
+            stop.wait(offset)
+            next_poll = time.monotonic()
+            while not stop.is_set() and time.monotonic() < deadline:
+                client.poll_food()
+                client.poll_presence()
+                next_poll += options['poll_interval']
+                stop.wait(max(0.0, next_poll - time.monotonic()))
+
+        pollers = [
+            threading.Thread(target=poll_loop, args=(client, rng.uniform(0, options['poll_interval'])), daemon=True)
+            for client in logged_in
+        ]
+        for thread in pollers:
+            thread.start()
+
+        # Open-loop vote injection: votes are fired on schedule whether or not earlier ones have finished
+        votes = 0
+        with ThreadPoolExecutor(max_workers=32) as voters:
+            if options['vote_rate'] > 0:
+                interval = 1 / options['vote_rate']
+                next_vote = time.monotonic()
+                while time.monotonic() < deadline:
+                    client = rng.choice(logged_in)
+                    if category_ids and rng.random() >= options['presence_share']:
+                        voters.submit(client.vote_food, rng.choice(category_ids))
+                    else:
+                        voters.submit(client.vote_presence, rng.choice(('present', 'absent', None)))
+                    votes += 1
+                    next_vote += interval
+                    time.sleep(max(0.0, min(next_vote, deadline) - time.monotonic()))
+            else:
+                stop.wait(max(0.0, deadline - time.monotonic()))
+            stop.set()
+            for thread in pollers:
+                thread.join()
+        duration = time.monotonic() - started
+
+        # Login-phase endpoints are rated over the login phase, the others over the polling phase
+        endpoint_reports = {
+            name: stats[name].report(login_seconds if name in LOGIN_ENDPOINTS else duration) for name in endpoints
+        }
+        total_requests = sum(report['requests'] for report in endpoint_reports.values())
+        total_errors = sum(report['errors'] for report in endpoint_reports.values())
+        return {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'target': base_url,
+            'server': None if options['url'] else options['server'],
+            'config': {
+                'users': len(users),
+                'duration_s': options['duration'],
+                'poll_interval_s': options['poll_interval'],
+                'vote_rate_per_s': options['vote_rate'],
+                'presence_share': options['presence_share'],
+                'stub_delay_s': options['stub_delay'],
+                'seed': options['seed'],
+            },
+            'logged_in': len(logged_in),
+            'login_phase_s': round(login_seconds, 2),
+            'duration_s': round(duration, 2),
+            'votes_fired': votes,
+            'totals': {
+                'requests': total_requests,
+                'errors': total_errors,
+                'error_rate': round(total_errors / total_requests, 4) if total_requests else 0.0,
+            },
+            'endpoints': endpoint_reports,
+        }
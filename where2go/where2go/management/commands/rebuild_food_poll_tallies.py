@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from where2go.services import find_food_poll_tally_mismatches, rebuild_food_poll_tallies, notify_poll_change
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-category food poll vote tallies from FoodPoll and verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only verify the tallies; exit with an error if any category is out of sync',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = find_food_poll_tally_mismatches()
+        for category_id, (stored, actual) in sorted(mismatches.items()):
+            self.stdout.write(f'Category {category_id}: tally {stored}, actual {actual}')
+
+        if options['check']:
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} food poll tallies are out of sync')
+            self.stdout.write(self.style.SUCCESS('All food poll tallies match FoodPoll'))
+            return
+
+        with transaction.atomic():
+            fixed = rebuild_food_poll_tallies()
+            if fixed:
+                notify_poll_change('food', list(mismatches))
+
+        remaining = find_food_poll_tally_mismatches()
+        if remaining:
+            raise CommandError(f'{len(remaining)} food poll tallies still out of sync after rebuild')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {fixed} food poll tallies'))
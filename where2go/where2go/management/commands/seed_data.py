@@ -0,0 +1,189 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from where2go.models import Categories, FoodPoll, PresencePoll, Restaurants, Reviews
+from where2go.services import bump_poll_version, notify_poll_change, rebuild_food_poll_tallies
+from where2go.services.restaurants import RESTAURANTS_VERSION
+from where2go.views.weather_views import LAT, LON
+
+CUISINES = (
+    'Pizza', 'Sushi', 'Burger', 'Kebab', 'Ramen', 'Tacos', 'Poke', 'Piadina', 'Gnocco fritto', 'Tigelle',
+    'Thai', 'Indian', 'Greek', 'Chinese', 'Vegan', 'Steakhouse', 'Seafood', 'Trattoria', 'Gelato', 'Brunch',
+)
+NAME_WORDS = (
+    'Da', 'Bella', 'Vecchia', 'Antica', 'Nuova', 'Casa', 'Osteria', 'Locanda', 'Corte', 'Bottega',
+    'Luna', 'Sole', 'Piazza', 'Ponte', 'Torre', 'Giardino', 'Cantina', 'Forno', 'Angolo', 'Porta',
+)
+REVIEW_WORDS = (
+    'ottimo', 'buono', 'lento', 'veloce', 'caro', 'economico', 'gentili', 'rumoroso', 'tranquillo',
+    'abbondante', 'scarso', 'fresco', 'consigliato', 'da', 'rivedere', 'servizio', 'porzioni', 'prezzo',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a reproducible synthetic dataset for scale testing: users, categories, restaurants '
+        '(around Reggio Emilia), food and presence votes and reviews, generated from --seed and '
+        'written with bulk_create. All users share one precomputed password hash. Reports rows/second '
+        'per table, then rebuilds the food poll tallies and bumps the poll and restaurant versions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Random seed: the same seed gives the same dataset')
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--categories', type=int, default=300)
+        parser.add_argument('--restaurants', type=int, default=5000)
+        parser.add_argument('--votes-per-user', type=float, default=2.0, help='Average food poll votes per user')
+        parser.add_argument('--presence-share', type=float, default=0.6, help='Fraction of users with a presence vote')
+        parser.add_argument('--reviews', type=int, default=100000)
+        parser.add_argument('--radius-km', type=float, default=15.0, help='Restaurants are placed within this distance of the city centre')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch')
+        parser.add_argument('--password', default='where2go-seed', help='Password of every seeded user')
+        parser.add_argument('--prefix', default='seed_', help='Prefix of seeded usernames and category names')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded rows (same --prefix) first')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['categories'] < 1 and (options['restaurants'] or options['votes_per_user']):
+            raise CommandError('Restaurants and food votes need at least one category')
+        if options['restaurants'] < 1 and options['reviews']:
+            raise CommandError('Reviews need at least one restaurant')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.totals = []
+
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f"Seeded users with prefix '{self.prefix}' already exist: use --clear or another --prefix")
+
+        started = time.perf_counter()
+        user_ids = self.seed_users(options['users'], options['password'])
+        category_ids = self.seed_categories(options['categories'])
+        restaurant_ids = self.seed_restaurants(options['restaurants'], category_ids, options['radius_km'])
+        self.seed_food_votes(user_ids, category_ids, options['votes_per_user'])
+        self.seed_presence_votes(user_ids, options['presence_share'])
+        self.seed_reviews(options['reviews'], user_ids, restaurant_ids)
+
+        # The seeded votes bypass the vote views: bring the derived state in line once
+        with transaction.atomic():
+            rebuild_food_poll_tallies()
+            notify_poll_change('food')
+            notify_poll_change('presence')
+            bump_poll_version(RESTAURANTS_VERSION)
+
+        elapsed = time.perf_counter() - started
+        rows = sum(count for _, count, _ in self.totals)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s overall)'
+        ))
+
+    def clear(self):
+        started = time.perf_counter()
+        with transaction.atomic():
+            # Votes and reviews of seeded users and categories go with them (on_delete=CASCADE)
+            users, _ = User.objects.filter(username__startswith=self.prefix).delete()
+            categories, _ = Categories.objects.filter(name__startswith=self.prefix).delete()
+        self.stdout.write(f'Cleared {users + categories} seeded rows in {time.perf_counter() - started:.1f}s')
+
+    def insert(self, label, model, rows):
+        """bulk_create `rows` (any iterable) in batches, each table in one transaction, and report the rate"""
+        started = time.perf_counter()
+        count = 0
+        batch = []
+        with transaction.atomic():
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    model.objects.bulk_create(batch, batch_size=self.batch_size)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                count += len(batch)
+        elapsed = time.perf_counter() - started
+        self.totals.append((label, count, elapsed))
+        self.stdout.write(f'{label:<16} {count:>9} rows in {elapsed:7.2f}s  {count / elapsed if elapsed else 0:>10.0f} rows/s')
+
+    def seed_users(self, count, password):
+        # One PBKDF2 run for the whole dataset instead of one per user
+        hashed = make_password(password)
+        self.insert('users', User, (
+            User(
+                username=f'{self.prefix}user_{index:06d}',
+                email=f'{self.prefix}user_{index:06d}@example.com',
+                first_name=self.rng.choice(NAME_WORDS),
+                password=hashed,
+            )
+            for index in range(count)
+        ))
+        # bulk_create does not return primary keys on every backend: read them back
+        return list(User.objects.filter(username__startswith=self.prefix).order_by('id').values_list('id', flat=True))
+
+    def seed_categories(self, count):
+        self.insert('categories', Categories, (
+            Categories(name=f'{self.prefix}{CUISINES[index % len(CUISINES)]} {index // len(CUISINES) + 1}')
+            for index in range(count)
+        ))
+        return list(Categories.objects.filter(name__startswith=self.prefix).order_by('id').values_list('id', flat=True))
+
+    def seed_restaurants(self, count, category_ids, radius_km):
+        # Degrees per km around the city centre (longitude degrees shrink with latitude)
+        dlat = radius_km / 111.2
+        dlon = radius_km / 78.9
+        first_id = Restaurants.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        self.insert('restaurants', Restaurants, (
+            Restaurants(
+                name=f'{self.rng.choice(NAME_WORDS)} {self.rng.choice(NAME_WORDS)} {index}',
+                category_id=self.rng.choice(category_ids),
+                latitude=round(LAT + self.rng.uniform(-dlat, dlat), 6),
+                longitude=round(LON + self.rng.uniform(-dlon, dlon), 6),
+            )
+            for index in range(count)
+        ))
+        return list(Restaurants.objects.filter(id__gt=first_id).order_by('id').values_list('id', flat=True))
+
+    def seed_food_votes(self, user_ids, category_ids, votes_per_user):
+        if not category_ids:
+            return
+        # Skewed popularity, as in a real poll: a few categories get most of the votes
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(category_ids))))
+        max_votes = min(len(category_ids), max(0, round(votes_per_user * 2)))
+
+        def rows():
+            for user_id in user_ids:
+                chosen = set()
+                for _ in range(self.rng.randint(0, max_votes)):
+                    chosen.add(self.rng.choices(category_ids, cum_weights=cum_weights)[0])
+                for category_id in sorted(chosen):
+                    yield FoodPoll(user_id=user_id, category_id=category_id)
+
+        self.insert('food votes', FoodPoll, rows())
+
+    def seed_presence_votes(self, user_ids, share):
+        self.insert('presence votes', PresencePoll, (
+            PresencePoll(user_id=user_id, presence=self.rng.choice(('present', 'present', 'absent')))
+            for user_id in user_ids if self.rng.random() < share
+        ))
+
+    def seed_reviews(self, count, user_ids, restaurant_ids):
+        if not user_ids or not restaurant_ids:
+            return
+        self.insert('reviews', Reviews, (
+            Reviews(
+                user_id=self.rng.choice(user_ids),
+                restaurant_id=self.rng.choice(restaurant_ids),
+                rating=self.rng.randint(1, 5),
+                comment=' '.join(self.rng.choices(REVIEW_WORDS, k=self.rng.randint(3, 12))).capitalize(),
+            )
+            for _ in range(count)
+        ))
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from where2go.services import REPLICA_ALIAS, get_replica_lag, replica_heartbeat_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the 'replica' one (WHERE2GO_REPLICA_DB) with SQLite's "
+        'online backup API, once or every --interval seconds, then touch the heartbeat file the router '
+        'uses to measure the replica lag. Readers of the replica keep working during the copy. '
+        'For local testing of the read/write routing; a real deployment would use streaming replication.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between copies (0: copy once and exit)')
+        parser.add_argument('--pages', type=int, default=-1, help='Pages copied per backup step (-1: all at once)')
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica configured: set WHERE2GO_REPLICA_DB to the replica file')
+        primary, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[REPLICA_ALIAS]
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('sync_replica only copies SQLite databases')
+        source, target = str(primary['NAME']), str(replica['NAME'])
+        if os.path.abspath(source) == os.path.abspath(target):
+            raise CommandError('The replica must be a different file from the primary')
+
+        while True:
+            started = time.time()
+            self.copy(source, target, options['pages'])
+            self.touch_heartbeat(started)
+            self.stdout.write(f'Replica synced in {(time.time() - started) * 1000:.0f} ms')
+            if not options['interval']:
+                break
+            time.sleep(max(0, options['interval'] - (time.time() - started)))
+
+    def copy(self, source, target, pages):
+        source_connection = sqlite3.connect(source, timeout=30)
+        target_connection = sqlite3.connect(target, timeout=30)
+        try:
+            source_connection.backup(target_connection, pages=pages)
+        finally:
+            target_connection.close()
+            source_connection.close()
+
+    def touch_heartbeat(self, synced_at):
+        # The copy holds everything committed before it started: that is the replica's age
+        path = replica_heartbeat_path()
+        with open(path, 'a'):
+            pass
+        os.utime(path, (synced_at, synced_at))
+        lag = get_replica_lag()
+        if lag is not None and lag > settings.REPLICA_MAX_LAG_SECONDS:
+            self.stderr.write(
+                f'The copy took {lag:.1f}s, more than REPLICA_MAX_LAG_SECONDS: reads stay on the primary'
+            )
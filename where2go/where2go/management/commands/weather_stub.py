@@ -0,0 +1,99 @@
+import json
+import random
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+def build_forecast(latitude, longitude, day):
+    """An Open-Meteo shaped hourly forecast for one day, deterministic per coordinates and day"""
+    rng = random.Random(f'{latitude:.2f}:{longitude:.2f}:{day}')
+    base = rng.uniform(5, 25)
+    hours = range(24)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timezone': 'Europe/Rome',
+        'hourly': {
+            'time': [f'{day}T{hour:02d}:00' for hour in hours],
+            'temperature_2m': [round(base + 5 * (1 - abs(hour - 14) / 14), 1) for hour in hours],
+            'weather_code': [rng.choice((0, 1, 2, 3, 61, 80)) for _ in hours],
+            'relative_humidity_2m': [rng.randint(40, 95) for _ in hours],
+            'wind_speed_10m': [round(rng.uniform(0, 20), 1) for _ in hours],
+            'apparent_temperature': [round(base + 4 * (1 - abs(hour - 14) / 14), 1) for hour in hours],
+        },
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once; the default backlog of 5 would drop them
+    request_queue_size = 1024
+
+
+def make_stub_server(host, port, delay=0.0, error_rate=0.0, log=None):
+    """A threading HTTP server answering like Open-Meteo's /v1/forecast; call serve_forever() on it"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if delay:
+                time.sleep(delay)
+            if random.random() < error_rate:
+                return self.send_json(503, {'error': True, 'reason': 'Stub failure'})
+            if url.path != '/v1/forecast':
+                return self.send_json(404, {'error': True, 'reason': 'Not found'})
+
+            query = parse_qs(url.query)
+            try:
+                latitudes = [float(value) for value in query['latitude'][0].split(',')]
+                longitudes = [float(value) for value in query['longitude'][0].split(',')]
+                day = query.get('start_date', [date.today().isoformat()])[0]
+            except (KeyError, ValueError):
+                return self.send_json(400, {'error': True, 'reason': 'Invalid coordinates'})
+            if len(latitudes) != len(longitudes):
+                return self.send_json(400, {'error': True, 'reason': 'Coordinate count mismatch'})
+
+            # Like Open-Meteo, several coordinates give a list of forecasts
+            forecasts = [build_forecast(lat, lon, day) for lat, lon in zip(latitudes, longitudes)]
+            self.send_json(200, forecasts[0] if len(forecasts) == 1 else forecasts)
+
+        def send_json(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if log is not None:
+                log(f'{self.address_string()} {format % args}')
+
+    return StubServer((host, port), Handler)
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a local stand-in for the Open-Meteo forecast API, with configurable latency and errors. '
+        'Point WHERE2GO_WEATHER_API_URL at http://<host>:<port>/v1/forecast to use it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before each response')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 503')
+
+    def handle(self, *args, **options):
+        server = make_stub_server(
+            options['host'], options['port'], options['delay'], options['error_rate'], log=self.stdout.write
+        )
+        self.stdout.write(f"Weather stub listening on http://{options['host']}:{options['port']}/v1/forecast")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,289 @@
+import cProfile
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.shortcuts import render
+
+from .services import (
+    enable_query_timing, record_request, start_request_timings, stop_request_timings,
+    flame_summary, profile_stats_bytes, top_functions,
+    replica_configured, start_replica_routing, stop_replica_routing, finish_replica_routing,
+)
+
+logger = logging.getLogger('where2go.timing')
+
+
+class ServerTimingMiddleware:
+    """
+    Misura ogni richiesta e aggiunge alla risposta l'header Server-Timing
+    (visibile negli strumenti per sviluppatori del browser, anche senza DEBUG):
+    - db: numero di query e tempo totale sul database;
+    - upstream: chiamate HTTP del client condiviso (Open-Meteo) e loro tempo;
+    - view: dall'inizio della vista alla risposta;
+    - total: l'intera richiesta, middleware compresi.
+    Le richieste oltre SERVER_TIMING_SLOW_MS o SERVER_TIMING_SLOW_QUERIES
+    vengono registrate sul logger 'where2go.timing' come riga JSON.
+    Attivo solo con SERVER_TIMING = True; va messo in cima a MIDDLEWARE.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        enable_query_timing()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timings, token = start_request_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings, token = start_request_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._server_timing_view_started = time.perf_counter()
+
+    def finish(self, request, response, timings, started):
+        now = time.perf_counter()
+        total_ms = (now - started) * 1000
+        view_started = getattr(request, '_server_timing_view_started', None)
+        view_ms = (now - view_started) * 1000 if view_started is not None else None
+        db_ms = timings.db_seconds * 1000
+        upstream_ms = timings.upstream_seconds * 1000
+
+        metrics = [f'db;dur={db_ms:.1f};desc="{timings.queries} queries"']
+        if timings.upstream_calls:
+            metrics.append(f'upstream;dur={upstream_ms:.1f};desc="{timings.upstream_calls} calls"')
+        if view_ms is not None:
+            metrics.append(f'view;dur={view_ms:.1f}')
+        metrics.append(f'total;dur={total_ms:.1f}')
+        response['Server-Timing'] = ', '.join(metrics)
+
+        if (
+            total_ms >= getattr(settings, 'SERVER_TIMING_SLOW_MS', 500)
+            or timings.queries >= getattr(settings, 'SERVER_TIMING_SLOW_QUERIES', 30)
+        ):
+            match = getattr(request, 'resolver_match', None)
+            logger.warning('slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'view_ms': round(view_ms, 1) if view_ms is not None else None,
+                'db_queries': timings.queries,
+                'db_ms': round(db_ms, 1),
+                'upstream_calls': timings.upstream_calls,
+                'upstream_ms': round(upstream_ms, 1),
+            }))
+
+
+class MetricsMiddleware:
+    """
+    Registra per ogni richiesta, con il nome dell'URL in urls.py: conteggio per
+    metodo e status, istogramma della latenza, query e tempo sul database.
+    Le metriche si leggono da /metrics. Attivo solo con METRICS = True.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        enable_query_timing()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timings, token = start_request_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings, token = start_request_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    def finish(self, request, response, timings, started):
+        match = getattr(request, 'resolver_match', None)
+        record_request(
+            match.url_name if match else None, request.method, response.status_code,
+            time.perf_counter() - started, timings.queries, timings.db_seconds
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tiene lo stato di instradamento della richiesta per ReplicaRouter: le viste
+    use_read_replica leggono dalla replica, a meno che la richiesta abbia già
+    scritto, che il client abbia scritto da meno di REPLICA_MAX_LAG_SECONDS
+    (cookie) o che la replica sia più indietro di così. Attivo solo se
+    DATABASES ha l'alias 'replica'.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = start_replica_routing(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_replica_routing(token)
+        finish_replica_routing(state, response)
+        return response
+
+    async def __acall__(self, request):
+        state, token = start_replica_routing(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_replica_routing(token)
+        finish_replica_routing(state, response)
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Profila una singola richiesta con cProfile, solo per lo staff, quando la
+    richiesta ha ?profile (o l'header X-Profile):
+    - ?profile=pstats: scarica il file .prof (pstats, snakeviz, gprof2dot);
+    - ?profile o ?profile=html: pagina con il riepilogo a fiamma, le funzioni
+      più costose e le query SQL eseguite.
+    Senza il parametro la richiesta passa oltre senza altro lavoro. Va messo in
+    fondo a MIDDLEWARE, dopo AuthenticationMiddleware. Nelle viste asincrone
+    viene profilato solo il thread dell'event loop: il tempo nei thread di
+    sync_to_async compare come attesa, ma le query vengono comunque elencate.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+
+        timings, token, profiler = self.start(request)
+        try:
+            response = profiler.runcall(self.get_response, request)
+        finally:
+            stop_request_timings(token)
+        return self.report(request, response, mode, profiler, timings)
+
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        # request.user è lazy e sincrono: nello stack asincrono l'utente va letto con auser()
+        if mode is None or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+
+        timings, token, profiler = self.start(request)
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            stop_request_timings(token)
+        return self.report(request, response, mode, profiler, timings)
+
+    def requested_mode(self, request):
+        """Modalità chiesta con ?profile o X-Profile, None se la richiesta non va profilata"""
+        mode = request.GET.get('profile', request.META.get('HTTP_X_PROFILE'))
+        if mode is None:
+            return None
+        return 'pstats' if mode == 'pstats' else 'html'
+
+    def start(self, request):
+        # Le query vengono raccolte dall'execute wrapper; installato solo alla prima richiesta profilata
+        enable_query_timing()
+        timings, token = start_request_timings()
+        timings.statements = []
+        return timings, token, cProfile.Profile()
+
+    def report(self, request, response, mode, profiler, timings):
+        if response.streaming:
+            # Una risposta in streaming (es. SSE) non finisce mai: la si restituisce com'è
+            return response
+
+        if mode == 'pstats':
+            match = getattr(request, 'resolver_match', None)
+            filename = f"{match.url_name if match else 'request'}-{int(time.time())}.prof"
+            download = HttpResponse(profile_stats_bytes(profiler), content_type='application/octet-stream')
+            download['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return download
+
+        statements = timings.statements
+        flame = flame_summary(profiler)
+        return render(request, 'test/profile.html', {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': sum(row['ms'] for row in flame if row['depth'] == 0),
+            'flame': flame,
+            'functions': top_functions(profiler),
+            'statements': [
+                {'sql': sql, 'params': params, 'ms': seconds * 1000} for sql, params, seconds in statements
+            ],
+            'db_ms': sum(seconds for _, _, seconds in statements) * 1000,
+        })
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:31
+
+from django.db import migrations, models
+
+
+def create_poll_versions(apps, schema_editor):
+    PollVersion = apps.get_model('where2go', 'PollVersion')
+    for name in ('food', 'presence'):
+        PollVersion.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0002_presencepoll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_poll_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0003_pollversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodPollChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(db_index=True)),
+                ('category_id', models.BigIntegerField(null=True)),
+            ],
+        ),
+    ]
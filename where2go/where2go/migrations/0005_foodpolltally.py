@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_tallies(apps, schema_editor):
+    Categories = apps.get_model('where2go', 'Categories')
+    FoodPollTally = apps.get_model('where2go', 'FoodPollTally')
+    FoodPollTally.objects.bulk_create([
+        FoodPollTally(category_id=category_id, votes=votes)
+        for category_id, votes in Categories.objects.annotate(votes=Count('foodpoll')).values_list('id', 'votes')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0004_foodpollchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodPollTally',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='where2go.categories')),
+                ('votes', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_tallies, migrations.RunPython.noop),
+    ]
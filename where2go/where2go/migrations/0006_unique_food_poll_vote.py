@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    FoodPoll = apps.get_model('where2go', 'FoodPoll')
+    FoodPollTally = apps.get_model('where2go', 'FoodPollTally')
+    Categories = apps.get_model('where2go', 'Categories')
+
+    duplicates = (
+        FoodPoll.objects.values('user_id', 'category_id')
+        .annotate(first_id=Min('id'), votes=Count('id'))
+        .filter(votes__gt=1)
+    )
+    for duplicate in duplicates:
+        FoodPoll.objects.filter(
+            user_id=duplicate['user_id'], category_id=duplicate['category_id']
+        ).exclude(id=duplicate['first_id']).delete()
+
+    # Tallies counted the duplicates too: recompute them from scratch
+    for category_id, votes in Categories.objects.annotate(votes=Count('foodpoll')).values_list('id', 'votes'):
+        FoodPollTally.objects.update_or_create(category_id=category_id, defaults={'votes': votes})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0005_foodpolltally'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='foodpoll',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='unique_food_poll_vote'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0006_unique_food_poll_vote'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='presencepoll',
+            name='presence',
+            field=models.CharField(choices=[('present', 'Presente'), ('absent', 'Assente')], db_index=True, max_length=10),
+        ),
+    ]
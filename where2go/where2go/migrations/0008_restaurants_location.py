@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('where2go', '0007_presencepoll_presence_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurants',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurants',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
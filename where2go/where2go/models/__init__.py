@@ -1,3 +1,3 @@
-from .food_model import Categories, FoodPoll, Restaurants, Reviews, PresencePoll
+from .food_model import Categories, FoodPoll, Restaurants, Reviews, PresencePoll, PollVersion, FoodPollChange, FoodPollTally
 
-__all__ = ['Categories', 'FoodPoll', 'Restaurants', 'Reviews', 'PresencePoll']
\ No newline at end of file
+__all__ = ['Categories', 'FoodPoll', 'Restaurants', 'Reviews', 'PresencePoll', 'PollVersion', 'FoodPollChange', 'FoodPollTally']
\ No newline at end of file
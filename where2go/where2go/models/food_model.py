@@ -10,8 +10,9 @@ class Categories(models.Model):
 
 '''
     Restaurant model representing a restaurant in the database.
+    Location is optional (WGS84 degrees); restaurants with coordinates
+    are served by the in-memory spatial index behind /restaurants/nearby/.
     TBA:
-    - Location
     - Price range
     - Cuisine type
     - Reviews
@@ -19,17 +20,25 @@ class Categories(models.Model):
 class Restaurants(models.Model):
     name = models.CharField(max_length=200)
     category = models.ForeignKey(Categories, on_delete=models.CASCADE)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
 
 
 '''
     Contains the votes of users for different categories.
-    Each vote links a user to a category.
+    Each vote links a user to a category, at most once: the
+    (user, category) unique index also serves the per-user lookups.
     After each poll, votes are cleared.
 '''
 class FoodPoll(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Categories, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_food_poll_vote'),
+        ]
+
 
 '''
     Contains presence votes of users.
@@ -43,7 +52,7 @@ class PresencePoll(models.Model):
     ]
     
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    presence = models.CharField(max_length=10, choices=PRESENCE_CHOICES)
+    presence = models.CharField(max_length=10, choices=PRESENCE_CHOICES, db_index=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.get_presence_display()}"
@@ -57,4 +66,38 @@ class Reviews(models.Model):
     restaurant = models.ForeignKey(Restaurants, on_delete=models.CASCADE)
     rating = models.IntegerField()
     comment = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+'''
+    Monotonic version counter of a poll ('food' or 'presence'), or of
+    another shared dataset cached in memory ('restaurants').
+    Every write that changes the state bumps it, so readers can
+    tell whether their copy is still current with a single lookup.
+'''
+class PollVersion(models.Model):
+    name = models.CharField(max_length=20, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+'''
+    Change log of the food poll: one row per category touched by a write,
+    tagged with the poll version it produced. A NULL category means the
+    whole poll changed. Lets clients ask only for what changed since the
+    version they already have; old rows are pruned.
+'''
+class FoodPollChange(models.Model):
+    version = models.PositiveBigIntegerField(db_index=True)
+    category_id = models.BigIntegerField(null=True)
+
+
+'''
+    Running vote count of a category in the food poll.
+    Maintained on every FoodPoll write so reads do not have to
+    recount the vote table; rebuilt by `rebuild_food_poll_tallies`.
+'''
+class FoodPollTally(models.Model):
+    category = models.OneToOneField(Categories, on_delete=models.CASCADE, primary_key=True, related_name='tally')
+    votes = models.IntegerField(default=0)
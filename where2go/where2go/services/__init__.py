@@ -0,0 +1,83 @@
+from .poll_cache import (
+    get_food_poll_data_json, get_presence_poll_data_json,
+    get_food_poll_compact_json, get_presence_poll_compact_json, compact_name_fields,
+    aget_food_poll_data_json, aget_presence_poll_data_json,
+    aget_food_poll_compact_json, aget_presence_poll_compact_json,
+    SerializedJSON, layered_json, layered_json_response,
+)
+from .poll_changes import get_changed_food_categories, aget_changed_food_categories
+from .poll_events import broker, notify_poll_change
+from .poll_snapshot import (
+    build_food_poll_snapshot, get_user_food_vote_ids,
+    build_presence_poll_snapshot, build_presence_poll_data, get_user_presence_vote,
+    aget_user_food_vote_ids, aget_user_presence_vote,
+)
+from .poll_tallies import (
+    adjust_food_poll_tally, remove_food_poll_votes_from_tallies, reset_food_poll_tallies,
+    find_food_poll_tally_mismatches, rebuild_food_poll_tallies, get_food_poll_winner_ids,
+    apply_food_poll_tally_deltas,
+)
+from .poll_votes import toggle_food_poll_vote, apply_food_poll_votes
+from .poll_versions import bump_poll_version, get_poll_version, get_poll_versions, aget_poll_version
+from .replica import (
+    REPLICA_ALIAS, ReplicaRouter, use_read_replica, replica_configured, get_replica_lag, replica_heartbeat_path,
+    start_replica_routing, stop_replica_routing, finish_replica_routing,
+)
+from .restaurants import (
+    parse_coordinates, get_restaurant_index, index_restaurant, unindex_restaurant, find_nearby_restaurants,
+)
+from .metrics import (
+    registry, metrics_enabled, record_request, record_poll_vote, record_upstream_call, record_cache_lookup,
+    collect_metrics, render_metrics,
+)
+from .profiling import profile_stats_bytes, top_functions, flame_summary, describe_function
+from .request_timing import (
+    RequestTimings, start_request_timings, stop_request_timings, record_upstream_time, time_query, install_query_timer,
+    enable_query_timing,
+)
+from .spatial import GridIndex, haversine_km
+from .sqlite_tuning import sqlite_pragma_statements, apply_sqlite_pragmas, get_sqlite_pragmas, enable_sqlite_pragmas
+from .upstream import UpstreamUnavailable, get_upstream_client, get_upstream_stats
+from .vote_queue import (
+    MemoryVoteQueue, CacheVoteQueue, VoteFlusher, vote_queue_enabled, get_vote_flusher,
+    with_pending_food_votes, pending_food_votes, pending_food_votes_token,
+    get_user_food_votes_with_pending, aget_user_food_votes_with_pending, queue_food_poll_toggle, flush_vote_queue,
+)
+from .weather_cache import (
+    get_cached_forecast, peek_cached_forecast, aget_cached_forecast, get_cached_forecasts, refresh_forecast_in_background,
+    weather_cache_key,
+)
+
+__all__ = [
+    'broker', 'notify_poll_change',
+    'bump_poll_version', 'get_poll_version', 'get_poll_versions', 'aget_poll_version',
+    'get_changed_food_categories', 'aget_changed_food_categories',
+    'build_food_poll_snapshot', 'get_user_food_vote_ids',
+    'build_presence_poll_snapshot', 'build_presence_poll_data', 'get_user_presence_vote',
+    'aget_user_food_vote_ids', 'aget_user_presence_vote',
+    'get_food_poll_data_json', 'get_presence_poll_data_json',
+    'get_food_poll_compact_json', 'get_presence_poll_compact_json', 'compact_name_fields',
+    'aget_food_poll_data_json', 'aget_presence_poll_data_json',
+    'aget_food_poll_compact_json', 'aget_presence_poll_compact_json',
+    'SerializedJSON', 'layered_json', 'layered_json_response',
+    'adjust_food_poll_tally', 'remove_food_poll_votes_from_tallies', 'reset_food_poll_tallies',
+    'find_food_poll_tally_mismatches', 'rebuild_food_poll_tallies', 'get_food_poll_winner_ids',
+    'apply_food_poll_tally_deltas',
+    'toggle_food_poll_vote', 'apply_food_poll_votes',
+    'MemoryVoteQueue', 'CacheVoteQueue', 'VoteFlusher', 'vote_queue_enabled', 'get_vote_flusher',
+    'with_pending_food_votes', 'pending_food_votes', 'pending_food_votes_token',
+    'get_user_food_votes_with_pending', 'aget_user_food_votes_with_pending', 'queue_food_poll_toggle', 'flush_vote_queue',
+    'REPLICA_ALIAS', 'ReplicaRouter', 'use_read_replica', 'replica_configured', 'get_replica_lag',
+    'replica_heartbeat_path', 'start_replica_routing', 'stop_replica_routing', 'finish_replica_routing',
+    'parse_coordinates', 'get_restaurant_index', 'index_restaurant', 'unindex_restaurant', 'find_nearby_restaurants',
+    'RequestTimings', 'start_request_timings', 'stop_request_timings', 'record_upstream_time',
+    'time_query', 'install_query_timer', 'enable_query_timing',
+    'registry', 'metrics_enabled', 'record_request', 'record_poll_vote', 'record_upstream_call', 'record_cache_lookup',
+    'collect_metrics', 'render_metrics',
+    'profile_stats_bytes', 'top_functions', 'flame_summary', 'describe_function',
+    'GridIndex', 'haversine_km',
+    'sqlite_pragma_statements', 'apply_sqlite_pragmas', 'get_sqlite_pragmas', 'enable_sqlite_pragmas',
+    'UpstreamUnavailable', 'get_upstream_client', 'get_upstream_stats',
+    'get_cached_forecast', 'peek_cached_forecast', 'aget_cached_forecast', 'get_cached_forecasts', 'refresh_forecast_in_background',
+    'weather_cache_key',
+]
@@ -0,0 +1,198 @@
+import atexit
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+# Limiti dei bucket degli istogrammi di latenza, in secondi (quelli predefiniti di Prometheus)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Metriche esposte da /metrics: nome -> (tipo, descrizione)
+METRICS = {
+    'where2go_http_requests_total': ('counter', 'HTTP requests by URL name, method and status'),
+    'where2go_http_request_duration_seconds': ('histogram', 'HTTP request latency by URL name'),
+    'where2go_db_queries_total': ('counter', 'Database queries run by requests, by URL name'),
+    'where2go_db_query_duration_seconds_total': ('counter', 'Time spent in database queries by requests, by URL name'),
+    'where2go_poll_votes_total': ('counter', 'Poll votes written, by poll'),
+    'where2go_upstream_requests_total': ('counter', 'Upstream HTTP calls by upstream and outcome'),
+    'where2go_upstream_request_duration_seconds': ('histogram', 'Upstream HTTP call latency by upstream'),
+    'where2go_cache_requests_total': ('counter', 'Cache lookups by cache and result (hit, miss, stale)'),
+}
+
+
+class MetricsRegistry:
+    """
+    Contatori e istogrammi di questo processo. Ogni processo scrive i propri
+    valori in un file JSON in METRICS_DIR (al più ogni METRICS_FLUSH_SECONDS),
+    e /metrics li somma: i worker di gunicorn/uvicorn vengono così aggregati
+    senza memoria condivisa. I file di processi terminati restano, così i
+    contatori non tornano indietro; vanno cancellati a ogni deploy.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flush_lock = threading.Lock()
+        self.last_flush = 0.0
+        # pid e istante di avvio: un pid riutilizzato non sovrascrive i contatori di un processo precedente
+        self.process_id = f'{os.getpid()}-{time.time_ns()}'
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Conteggi per bucket (non cumulativi), poi somma e numero di osservazioni
+                histogram = self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 1):
+            self.flush()
+
+    def flush(self):
+        """Scrive i valori di questo processo nel suo file (sostituzione atomica)"""
+        # Un solo thread alla volta scrive; gli altri non aspettano
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_flush = time.monotonic()
+            directory = get_metrics_dir()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{self.process_id}.json')
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            pass
+        finally:
+            self.flush_lock.release()
+
+
+registry = MetricsRegistry()
+atexit.register(lambda: metrics_enabled() and registry.flush())
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS', False)
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'where2go-metrics')
+
+
+def record_request(view_name, method, status, seconds, queries, db_seconds):
+    if not metrics_enabled():
+        return
+    view_name = view_name or 'unmatched'
+    registry.inc('where2go_http_requests_total', {'view': view_name, 'method': method, 'status': str(status)})
+    registry.observe('where2go_http_request_duration_seconds', {'view': view_name}, seconds)
+    if queries:
+        registry.inc('where2go_db_queries_total', {'view': view_name}, queries)
+        registry.inc('where2go_db_query_duration_seconds_total', {'view': view_name}, db_seconds)
+
+
+def record_poll_vote(poll):
+    if metrics_enabled():
+        registry.inc('where2go_poll_votes_total', {'poll': poll})
+
+
+def record_upstream_call(upstream, outcome, seconds):
+    if not metrics_enabled():
+        return
+    registry.inc('where2go_upstream_requests_total', {'upstream': upstream, 'outcome': outcome})
+    if outcome != 'circuit_open':
+        registry.observe('where2go_upstream_request_duration_seconds', {'upstream': upstream}, seconds)
+
+
+def record_cache_lookup(cache_name, result, count=1):
+    """`result` è 'hit', 'miss' o 'stale' (servito scaduto mentre viene aggiornato)"""
+    if metrics_enabled() and count:
+        registry.inc('where2go_cache_requests_total', {'cache': cache_name, 'result': result}, count)
+
+
+def collect_metrics():
+    """Somma i file di tutti i processi: ({(nome, etichette): valore}, {(nome, etichette): istogramma})"""
+    registry.flush()
+    counters, histograms = {}, {}
+    for path in glob.glob(os.path.join(get_metrics_dir(), '*.json')):
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def render_metrics():
+    """Metriche aggregate nel formato testuale di Prometheus (text/plain; version=0.0.4)"""
+    counters, histograms = collect_metrics()
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", repr(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN'
+    return repr(value) if isinstance(value, float) else str(value)
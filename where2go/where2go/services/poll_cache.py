@@ -0,0 +1,262 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .metrics import record_cache_lookup
+from .poll_snapshot import (
+    build_food_poll_snapshot, build_presence_poll_data,
+    build_food_poll_compact_snapshot, build_presence_poll_compact_snapshot,
+    abuild_food_poll_data, abuild_presence_poll_data,
+    abuild_food_poll_compact_snapshot, abuild_presence_poll_compact_snapshot,
+)
+
+# Lock a strisce: le richieste dello stesso processo che mancano la stessa chiave
+# si mettono in fila e solo la prima ricostruisce lo snapshot
+_build_locks = [threading.Lock() for _ in range(32)]
+
+# Equivalente per le viste asincrone: una sola costruzione in corso per chiave e event loop
+_async_builds = {}
+
+
+def get_poll_cache():
+    return caches[getattr(settings, 'POLL_CACHE_ALIAS', 'default')]
+
+
+def get_or_build(key, builder):
+    """
+    Legge `key` dalla cache o la costruisce con `builder()`.
+    Le mancate letture concorrenti vengono accorpate: nello stesso processo
+    tramite lock, tra processi diversi tramite una chiave di lock in cache.
+    Nelle metriche è un 'miss' solo la richiesta che costruisce il valore;
+    chi lo trova in cache, anche dopo aver aspettato, conta come 'hit'.
+    """
+    cache = get_poll_cache()
+    value = cache.get(key)
+    if value is not None:
+        record_cache_lookup('poll', 'hit')
+        return value
+
+    timeout = getattr(settings, 'POLL_CACHE_TIMEOUT', 300)
+    lock_timeout = getattr(settings, 'POLL_CACHE_LOCK_TIMEOUT', 5)
+
+    with _build_locks[zlib.crc32(key.encode()) % len(_build_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            record_cache_lookup('poll', 'hit')
+            return value
+
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        acquired = cache.add(lock_key, token, lock_timeout)
+        if not acquired:
+            # Un altro processo sta già costruendo questa versione: aspetta il suo risultato
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                value = cache.get(key)
+                if value is not None:
+                    record_cache_lookup('poll', 'hit')
+                    return value
+
+        # Il lock scaduto senza risultato (costruzione lenta o processo morto): si costruisce comunque
+        record_cache_lookup('poll', 'miss')
+        try:
+            value = builder()
+            cache.set(key, value, timeout)
+        finally:
+            if acquired:
+                release_cache_lock(cache, lock_key, token)
+        return value
+
+
+def release_cache_lock(cache, lock_key, token):
+    """Toglie il lock solo se è ancora il nostro: scaduto, può essere già di un altro processo"""
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def arelease_cache_lock(cache, lock_key, token):
+    """Come release_cache_lock(), per le viste asincrone"""
+    if await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+async def aget_or_build(key, builder):
+    """Come get_or_build(), per le viste asincrone: `builder` è una coroutine function"""
+    cache = get_poll_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        record_cache_lookup('poll', 'hit')
+        return value
+
+    build_key = (id(asyncio.get_running_loop()), key)
+    task = _async_builds.get(build_key)
+    if task is None:
+        task = _async_builds[build_key] = asyncio.ensure_future(_abuild(cache, key, builder))
+        task.add_done_callback(lambda _: _async_builds.pop(build_key, None))
+    else:
+        # Si aggancia alla costruzione già in corso: il miss è di chi l'ha avviata
+        record_cache_lookup('poll', 'hit')
+    # shield: una richiesta annullata non interrompe la costruzione attesa dalle altre
+    return await asyncio.shield(task)
+
+
+async def _abuild(cache, key, builder):
+    timeout = getattr(settings, 'POLL_CACHE_TIMEOUT', 300)
+    lock_timeout = getattr(settings, 'POLL_CACHE_LOCK_TIMEOUT', 5)
+
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    acquired = await cache.aadd(lock_key, token, lock_timeout)
+    if not acquired:
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            value = await cache.aget(key)
+            if value is not None:
+                record_cache_lookup('poll', 'hit')
+                return value
+
+    record_cache_lookup('poll', 'miss')
+    try:
+        value = await builder()
+        await cache.aset(key, value, timeout)
+    finally:
+        if acquired:
+            await arelease_cache_lock(cache, lock_key, token)
+    return value
+
+
+def get_food_poll_data_json(version):
+    """poll_data del sondaggio cibo alla versione indicata, già serializzato in JSON"""
+    return get_or_build(
+        f'where2go:poll:food:{version}',
+        lambda: json.dumps(build_food_poll_snapshot()[0], cls=DjangoJSONEncoder)
+    )
+
+
+def get_presence_poll_data_json(version):
+    """presence_data del sondaggio presenza alla versione indicata, già serializzato in JSON"""
+    return get_or_build(
+        f'where2go:poll:presence:{version}',
+        lambda: json.dumps(build_presence_poll_data(), cls=DjangoJSONEncoder)
+    )
+
+
+async def aget_food_poll_data_json(version):
+    """Come get_food_poll_data_json(), per le viste asincrone"""
+    async def build():
+        return json.dumps(await abuild_food_poll_data(), cls=DjangoJSONEncoder)
+
+    return await aget_or_build(f'where2go:poll:food:{version}', build)
+
+
+async def aget_presence_poll_data_json(version):
+    """Come get_presence_poll_data_json(), per le viste asincrone"""
+    async def build():
+        return json.dumps(await abuild_presence_poll_data(), cls=DjangoJSONEncoder)
+
+    return await aget_or_build(f'where2go:poll:presence:{version}', build)
+
+
+def _serialize_names(snapshot, name, names):
+    """Aggiunge allo snapshot compatto il dizionario ID -> nome serializzato e il suo token"""
+    snapshot[name] = json.dumps(names, sort_keys=True)
+    snapshot[f'{name}_token'] = format(zlib.crc32(snapshot[name].encode()), '08x')
+
+
+def get_food_poll_compact_json(version):
+    """
+    Snapshot compatto del sondaggio cibo alla versione indicata:
+    {'poll': JSON, 'categories': JSON, 'categories_token': str, 'users': JSON, 'users_token': str}
+    """
+    def build():
+        return _food_poll_compact(*build_food_poll_compact_snapshot())
+
+    return get_or_build(f'where2go:poll:food-compact:{version}', build)
+
+
+async def aget_food_poll_compact_json(version):
+    """Come get_food_poll_compact_json(), per le viste asincrone"""
+    async def build():
+        return _food_poll_compact(*await abuild_food_poll_compact_snapshot())
+
+    return await aget_or_build(f'where2go:poll:food-compact:{version}', build)
+
+
+def _food_poll_compact(poll, categories, users):
+    snapshot = {'poll': json.dumps(poll)}
+    _serialize_names(snapshot, 'categories', categories)
+    _serialize_names(snapshot, 'users', users)
+    return snapshot
+
+
+def get_presence_poll_compact_json(version):
+    """Snapshot compatto del sondaggio presenza: {'presence': JSON, 'users': JSON, 'users_token': str}"""
+    def build():
+        return _presence_poll_compact(*build_presence_poll_compact_snapshot())
+
+    return get_or_build(f'where2go:poll:presence-compact:{version}', build)
+
+
+async def aget_presence_poll_compact_json(version):
+    """Come get_presence_poll_compact_json(), per le viste asincrone"""
+    async def build():
+        return _presence_poll_compact(*await abuild_presence_poll_compact_snapshot())
+
+    return await aget_or_build(f'where2go:poll:presence-compact:{version}', build)
+
+
+def _presence_poll_compact(presence, users):
+    snapshot = {'presence': json.dumps(presence)}
+    _serialize_names(snapshot, 'users', users)
+    return snapshot
+
+
+def compact_name_fields(snapshot, known_tokens):
+    """
+    Campi dei dizionari ID -> nome da aggiungere a una risposta compatta:
+    il token viene sempre inviato, il dizionario solo se il client
+    (tramite `known_tokens`, es. request.GET) non ha già quella versione.
+    """
+    fields = {}
+    for name in ('categories', 'users'):
+        if name not in snapshot:
+            continue
+        token = snapshot[f'{name}_token']
+        fields[f'{name}_token'] = token
+        if known_tokens.get(name) != token:
+            fields[name] = SerializedJSON(snapshot[name])
+    return fields
+
+
+class SerializedJSON:
+    """Valore già serializzato, da inserire così com'è in layered_json()"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def layered_json(fields):
+    """
+    Serializza un oggetto JSON i cui valori possono essere SerializedJSON:
+    lo snapshot condiviso in cache viene copiato senza ricodificarlo e
+    i campi personali (es. user_votes) vengono aggiunti sopra.
+    """
+    parts = []
+    for name, value in fields.items():
+        encoded = value.text if isinstance(value, SerializedJSON) else json.dumps(value, cls=DjangoJSONEncoder)
+        parts.append(f'{json.dumps(name)}: {encoded}')
+    return '{' + ', '.join(parts) + '}'
+
+
+def layered_json_response(fields):
+    return HttpResponse(layered_json(fields), content_type='application/json')
@@ -0,0 +1,62 @@
+from django.conf import settings
+
+from ..models import FoodPollChange
+
+
+def get_delta_window():
+    return getattr(settings, 'FOOD_POLL_DELTA_WINDOW', 500)
+
+
+def record_food_poll_changes(version, category_ids=None):
+    """
+    Registra le categorie modificate dalla versione `version` del sondaggio cibo.
+    Senza categorie l'intero sondaggio è considerato cambiato.
+    """
+    if category_ids is None:
+        changes = [FoodPollChange(version=version, category_id=None)]
+    else:
+        changes = [FoodPollChange(version=version, category_id=category_id) for category_id in set(category_ids)]
+    FoodPollChange.objects.bulk_create(changes)
+
+    # Pulizia periodica delle righe che nessun client può più chiedere
+    if version % 100 == 0:
+        FoodPollChange.objects.filter(version__lte=version - get_delta_window()).delete()
+
+
+def get_changed_food_categories(since, current_version):
+    """
+    Restituisce gli ID delle categorie cambiate dopo la versione `since`,
+    oppure None se serve uno snapshot completo (client troppo indietro o
+    cambiamento dell'intero sondaggio).
+    """
+    changes = food_poll_changes_between(since, current_version)
+    if changes is None:
+        return None
+
+    category_ids = set(changes)
+    if None in category_ids:
+        return None
+    return category_ids
+
+
+async def aget_changed_food_categories(since, current_version):
+    """Come get_changed_food_categories(), con l'ORM asincrono"""
+    changes = food_poll_changes_between(since, current_version)
+    if changes is None:
+        return None
+
+    category_ids = {category_id async for category_id in changes}
+    if None in category_ids:
+        return None
+    return category_ids
+
+
+def food_poll_changes_between(since, current_version):
+    """Query degli ID cambiati tra le due versioni, o None se sono fuori dalla finestra dei delta"""
+    if since > current_version or since < current_version - get_delta_window():
+        return None
+    return (
+        FoodPollChange.objects.filter(version__gt=since, version__lte=current_version)
+        .values_list('category_id', flat=True)
+        .distinct()
+    )
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+from django.db import transaction
+
+from .poll_changes import record_food_poll_changes
+from .poll_versions import bump_poll_version
+
+
+class PollSubscription:
+    """Coda di notifiche di un singolo stream SSE, legata al suo event loop"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def push(self, channel):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, channel)
+        except RuntimeError:
+            # Event loop già chiuso: lo stream verrà rimosso dal suo finally
+            pass
+
+    def drain(self):
+        """Svuota la coda restituendo i canali notificati nel frattempo"""
+        channels = set()
+        while not self.queue.empty():
+            channels.add(self.queue.get_nowait())
+        return channels
+
+
+class PollEventBroker:
+    """
+    Distribuisce le notifiche di cambio stato dei sondaggi agli stream SSE
+    aperti in questo processo. Le viste sincrone pubblicano da un thread,
+    gli stream le ricevono nel proprio event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self):
+        subscription = PollSubscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, channel):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(channel)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+
+broker = PollEventBroker()
+
+
+def notify_poll_change(channel, category_ids=None):
+    """
+    Registra il cambio di stato del sondaggio ('food' o 'presence'):
+    incrementa la sua versione e avvisa gli stream SSE dopo il commit.
+    Per il sondaggio cibo `category_ids` indica le categorie toccate
+    (None = tutte), usate dalle risposte delta.
+    """
+    version = bump_poll_version(channel)
+    if channel == 'food':
+        record_food_poll_changes(version, category_ids)
+    transaction.on_commit(lambda: broker.publish(channel))
+    return version
@@ -0,0 +1,213 @@
+from django.db.models import Count, Q
+
+from ..models import Categories, FoodPoll, PresencePoll
+
+
+def build_food_poll_snapshot(user=None, category_ids=None):
+    """
+    Costruisce lo stato del sondaggio cibo con un numero costante di query,
+    indipendente dal numero di categorie e di votanti: le categorie con il
+    loro conteggio da FoodPollTally (join sulla chiave primaria, nessun
+    aggregato) e una join per i votanti.
+
+    Restituisce (poll_data, user_votes), con la stessa struttura di
+    get_food_poll_data_dict() e get_user_food_votes(); user_votes è None
+    se non viene passato un utente.
+    """
+    categories, votes = food_poll_querysets(category_ids)
+    poll_data, user_votes = assemble_food_poll_data(categories, votes, user)
+
+    if user is None:
+        return poll_data, None
+    if category_ids is not None:
+        # I voti dell'utente vanno restituiti sempre per intero
+        user_votes = get_user_food_vote_ids(user)
+    return poll_data, user_votes
+
+
+async def abuild_food_poll_data():
+    """poll_data di build_food_poll_snapshot(), letto con l'ORM asincrono"""
+    categories, votes = food_poll_querysets()
+    poll_data, _ = assemble_food_poll_data(
+        [row async for row in categories],
+        [row async for row in votes],
+    )
+    return poll_data
+
+
+def food_poll_querysets(category_ids=None):
+    """Le due query dello snapshot del sondaggio cibo: categorie con conteggio e votanti"""
+    categories = Categories.objects.order_by('id')
+    votes = FoodPoll.objects.order_by('id')
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+        votes = votes.filter(category_id__in=category_ids)
+    return (
+        categories.values_list('id', 'name', 'tally__votes'),
+        votes.values_list('category_id', 'user_id', 'user__username'),
+    )
+
+
+def assemble_food_poll_data(category_rows, vote_rows, user=None):
+    poll_data = {}
+    for category_id, name, vote_count in category_rows:
+        poll_data[str(category_id)] = {
+            'count': vote_count or 0,
+            'voters': [],
+            'category_name': name
+        }
+
+    user_id = user.pk if user is not None else None
+    user_votes = []
+    for category_id, voter_id, username in vote_rows:
+        entry = poll_data.get(str(category_id))
+        if entry is not None:
+            entry['voters'].append(username)
+        if voter_id == user_id:
+            user_votes.append(category_id)
+    return poll_data, user_votes
+
+
+def get_user_food_vote_ids(user):
+    """ID delle categorie votate dall'utente, con una sola query"""
+    return list(FoodPoll.objects.filter(user=user).order_by('id').values_list('category_id', flat=True))
+
+
+async def aget_user_food_vote_ids(user):
+    """Come get_user_food_vote_ids(), con l'ORM asincrono"""
+    return [
+        category_id async for category_id in
+        FoodPoll.objects.filter(user=user).order_by('id').values_list('category_id', flat=True)
+    ]
+
+
+def build_presence_poll_snapshot(user=None):
+    """
+    Costruisce lo stato del sondaggio presenza con due query, indipendenti
+    dal numero di votanti: un aggregato condizionale per entrambi i conteggi
+    e una join per entrambe le liste di votanti.
+
+    Restituisce (presence_data, user_vote); user_vote è None se l'utente non
+    ha votato o non viene passato.
+    """
+    counts = PresencePoll.objects.aggregate(**presence_poll_counts())
+    presence_data, user_vote = assemble_presence_poll_data(counts, presence_poll_voters(), user)
+    return presence_data, user_vote
+
+
+async def abuild_presence_poll_data():
+    """presence_data di build_presence_poll_snapshot(), letto con l'ORM asincrono"""
+    counts = await PresencePoll.objects.aaggregate(**presence_poll_counts())
+    presence_data, _ = assemble_presence_poll_data(counts, [row async for row in presence_poll_voters()])
+    return presence_data
+
+
+def presence_poll_counts():
+    """Aggregato condizionale con i conteggi di entrambe le risposte"""
+    return {
+        'present': Count('id', filter=Q(presence='present')),
+        'absent': Count('id', filter=Q(presence='absent')),
+    }
+
+
+def presence_poll_voters():
+    return PresencePoll.objects.order_by('id').values_list('presence', 'user_id', 'user__username')
+
+
+def assemble_presence_poll_data(counts, voter_rows, user=None):
+    presence_data = {
+        'present': {
+            'count': counts['present'],
+            'voters': []
+        },
+        'absent': {
+            'count': counts['absent'],
+            'voters': []
+        }
+    }
+
+    user_id = user.pk if user is not None else None
+    user_vote = None
+    for presence, voter_id, username in voter_rows:
+        if presence in presence_data:
+            presence_data[presence]['voters'].append(username)
+        if voter_id == user_id:
+            user_vote = presence
+
+    return presence_data, user_vote
+
+
+def build_presence_poll_data():
+    """Restituisce un dizionario con i dati del sondaggio presenza"""
+    presence_data, _ = build_presence_poll_snapshot()
+    return presence_data
+
+
+def get_user_presence_vote(user):
+    """Restituisce il voto di presenza dell'utente ('present', 'absent', o None)"""
+    return PresencePoll.objects.filter(user=user).values_list('presence', flat=True).first()
+
+
+async def aget_user_presence_vote(user):
+    """Come get_user_presence_vote(), con l'ORM asincrono"""
+    try:
+        return (await PresencePoll.objects.aget(user=user)).presence
+    except PresencePoll.DoesNotExist:
+        return None
+
+
+def build_food_poll_compact_snapshot():
+    """
+    Come build_food_poll_snapshot(), ma con categorie e votanti riferiti per ID.
+    Restituisce (poll, categories, users): poll è una lista di
+    [category_id, count, [user_id, ...]], categories e users mappano ID -> nome.
+    """
+    categories, votes = food_poll_querysets()
+    return assemble_food_poll_compact(categories, votes)
+
+
+async def abuild_food_poll_compact_snapshot():
+    """Come build_food_poll_compact_snapshot(), con l'ORM asincrono"""
+    categories, votes = food_poll_querysets()
+    return assemble_food_poll_compact([row async for row in categories], [row async for row in votes])
+
+
+def assemble_food_poll_compact(category_rows, vote_rows):
+    poll, categories, users, rows = [], {}, {}, {}
+    for category_id, name, vote_count in category_rows:
+        categories[category_id] = name
+        rows[category_id] = [category_id, vote_count or 0, []]
+        poll.append(rows[category_id])
+
+    for category_id, user_id, username in vote_rows:
+        row = rows.get(category_id)
+        if row is not None:
+            row[2].append(user_id)
+            users[user_id] = username
+
+    return poll, categories, users
+
+
+def build_presence_poll_compact_snapshot():
+    """
+    Come build_presence_poll_snapshot(), ma con i votanti riferiti per ID.
+    Restituisce (presence, users): presence mappa 'present'/'absent' a [count, [user_id, ...]].
+    """
+    counts = PresencePoll.objects.aggregate(**presence_poll_counts())
+    return assemble_presence_poll_compact(counts, presence_poll_voters())
+
+
+async def abuild_presence_poll_compact_snapshot():
+    """Come build_presence_poll_compact_snapshot(), con l'ORM asincrono"""
+    counts = await PresencePoll.objects.aaggregate(**presence_poll_counts())
+    return assemble_presence_poll_compact(counts, [row async for row in presence_poll_voters()])
+
+
+def assemble_presence_poll_compact(counts, voter_rows):
+    presence = {key: [count, []] for key, count in counts.items()}
+    users = {}
+    for presence_value, user_id, username in voter_rows:
+        if presence_value in presence:
+            presence[presence_value][1].append(user_id)
+            users[user_id] = username
+    return presence, users
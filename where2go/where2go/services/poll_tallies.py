@@ -0,0 +1,76 @@
+from collections import Counter
+
+from django.db.models import Count, F
+
+from ..models import Categories, FoodPollTally
+
+
+def adjust_food_poll_tally(category_id, delta):
+    """Aggiorna atomicamente il conteggio della categoria; va chiamata nella stessa transazione del voto"""
+    updated = FoodPollTally.objects.filter(category_id=category_id).update(votes=F('votes') + delta)
+    if not updated:
+        FoodPollTally.objects.get_or_create(category_id=category_id)
+        FoodPollTally.objects.filter(category_id=category_id).update(votes=F('votes') + delta)
+
+
+def apply_food_poll_tally_deltas(deltas):
+    """
+    Applica più variazioni ai conteggi ({category_id: delta}) nella transazione corrente.
+    Un UPDATE per ogni diverso valore di delta, non uno per categoria: il numero
+    di query non dipende da quante categorie vengono toccate.
+    """
+    deltas = {category_id: delta for category_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    FoodPollTally.objects.bulk_create(
+        [FoodPollTally(category_id=category_id) for category_id in deltas], ignore_conflicts=True
+    )
+    categories_by_delta = {}
+    for category_id, delta in deltas.items():
+        categories_by_delta.setdefault(delta, []).append(category_id)
+    for delta, ids in categories_by_delta.items():
+        FoodPollTally.objects.filter(category_id__in=ids).update(votes=F('votes') + delta)
+
+
+def remove_food_poll_votes_from_tallies(category_ids):
+    """Scala i conteggi per i voti eliminati (una voce di `category_ids` per ogni voto)"""
+    apply_food_poll_tally_deltas({category_id: -removed for category_id, removed in Counter(category_ids).items()})
+
+
+def reset_food_poll_tallies():
+    """Azzera tutti i conteggi, dopo la cancellazione di tutti i voti"""
+    FoodPollTally.objects.update(votes=0)
+
+
+def get_food_poll_winner_ids():
+    """ID delle categorie in testa al sondaggio (più di una in caso di parità), vuota se nessuno ha votato"""
+    rows = list(FoodPollTally.objects.filter(votes__gt=0).order_by('-votes').values_list('category_id', 'votes'))
+    if not rows:
+        return []
+    top = rows[0][1]
+    return sorted(category_id for category_id, votes in rows if votes == top)
+
+
+def count_food_poll_votes():
+    """Conteggio reale dei voti per categoria, ricalcolato dalla tabella FoodPoll"""
+    return dict(Categories.objects.annotate(votes=Count('foodpoll')).values_list('id', 'votes'))
+
+
+def find_food_poll_tally_mismatches():
+    """Restituisce {category_id: (conteggio salvato, conteggio reale)} per le categorie non allineate"""
+    stored = dict(FoodPollTally.objects.values_list('category_id', 'votes'))
+    mismatches = {}
+    for category_id, votes in count_food_poll_votes().items():
+        if stored.get(category_id, 0) != votes:
+            mismatches[category_id] = (stored.get(category_id), votes)
+    return mismatches
+
+
+def rebuild_food_poll_tallies():
+    """Ricalcola tutti i conteggi da FoodPoll e restituisce il numero di categorie corrette"""
+    mismatches = find_food_poll_tally_mismatches()
+    missing = [category_id for category_id, (stored, _) in mismatches.items() if stored is None]
+    FoodPollTally.objects.bulk_create([FoodPollTally(category_id=category_id) for category_id in missing])
+    for category_id, (_, votes) in mismatches.items():
+        FoodPollTally.objects.filter(category_id=category_id).update(votes=votes)
+    return len(mismatches)
@@ -0,0 +1,35 @@
+from django.db.models import F
+
+from ..models import PollVersion
+
+POLLS = ('food', 'presence')
+
+
+def bump_poll_version(poll):
+    """Incrementa atomicamente la versione del sondaggio e la restituisce"""
+    updated = PollVersion.objects.filter(name=poll).update(version=F('version') + 1)
+    if not updated:
+        PollVersion.objects.get_or_create(name=poll)
+        PollVersion.objects.filter(name=poll).update(version=F('version') + 1)
+    return get_poll_version(poll)
+
+
+def get_poll_version(poll):
+    """Restituisce la versione corrente del sondaggio (0 se non ancora votato)"""
+    version = PollVersion.objects.filter(name=poll).values_list('version', flat=True).first()
+    return version or 0
+
+
+async def aget_poll_version(poll):
+    """Come get_poll_version(), con l'ORM asincrono"""
+    try:
+        return (await PollVersion.objects.aget(name=poll)).version
+    except PollVersion.DoesNotExist:
+        return 0
+
+
+def get_poll_versions():
+    """Restituisce le versioni di tutti i sondaggi con una sola query"""
+    versions = dict.fromkeys(POLLS, 0)
+    versions.update(PollVersion.objects.filter(name__in=POLLS).values_list('name', 'version'))
+    return versions
@@ -0,0 +1,122 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from ..models import Categories, FoodPoll
+from .metrics import record_poll_vote
+from .poll_events import notify_poll_change
+from .poll_tallies import adjust_food_poll_tally, apply_food_poll_tally_deltas
+
+# Utenti per DELETE, sotto il limite di parametri di SQLite
+DELETE_CHUNK_SIZE = 300
+
+
+def toggle_food_poll_vote(user, category_id):
+    """
+    Aggiunge o toglie il voto dell'utente per la categoria, in modo atomico.
+    Tenta direttamente l'inserimento e, se il vincolo (user, category) segnala
+    che il voto esiste già, lo elimina: nessuna lettura preventiva, quindi due
+    click concorrenti non possono più creare voti doppi.
+    Restituisce la variazione applicata: 1 se il voto è stato aggiunto, -1 se
+    è stato tolto, 0 se un toggle concorrente l'aveva già tolto.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                FoodPoll.objects.create(user=user, category_id=category_id)
+            delta = 1
+        except IntegrityError:
+            deleted, _ = FoodPoll.objects.filter(user=user, category_id=category_id).delete()
+            # Se un toggle concorrente l'ha già tolto non c'è nulla da scalare
+            delta = -deleted
+
+        if delta:
+            adjust_food_poll_tally(category_id, delta)
+        notify_poll_change('food', [category_id])
+    record_poll_vote('food')
+    return delta
+
+
+def apply_food_poll_votes(intents):
+    """
+    Applica in una sola transazione i voti raccolti dalla coda di scrittura:
+    `intents` è {(user_id, category_id): True se l'utente vuole il voto}.
+    Aggiunge i voti mancanti e toglie quelli non più voluti, aggiorna i conteggi
+    e incrementa la versione del sondaggio una sola volta. I voti di utenti o
+    categorie eliminati nel frattempo vengono ignorati.
+    Restituisce il numero di voti effettivamente cambiati.
+    """
+    if not intents:
+        return 0
+    user_ids = {user_id for user_id, _ in intents}
+    category_ids = {category_id for _, category_id in intents}
+    with transaction.atomic():
+        user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        category_ids = set(Categories.objects.filter(id__in=category_ids).values_list('id', flat=True))
+        existing = set(
+            FoodPoll.objects.filter(user_id__in=user_ids, category_id__in=category_ids)
+            .values_list('user_id', 'category_id')
+        )
+        to_add, to_remove = [], []
+        for (user_id, category_id), wanted in intents.items():
+            if user_id not in user_ids or category_id not in category_ids:
+                continue
+            if wanted and (user_id, category_id) not in existing:
+                to_add.append((user_id, category_id))
+            elif not wanted and (user_id, category_id) in existing:
+                to_remove.append((user_id, category_id))
+
+        # Conteggi da ciò che il database ha davvero cambiato, non dalle intenzioni:
+        # un toggle sincrono può aver scritto le stesse righe dopo la lettura di `existing`
+        added = _insert_food_poll_votes(to_add)
+        removed = _delete_food_poll_votes(to_remove)
+        deltas = Counter(added)
+        deltas.subtract(removed)
+        apply_food_poll_tally_deltas(deltas)
+        changed = sorted(set(+added) | set(+removed))
+        if changed:
+            notify_poll_change('food', changed)
+    return sum(added.values()) + sum(removed.values())
+
+
+def _insert_food_poll_votes(pairs):
+    """
+    Inserisce i voti (user_id, category_id) e restituisce quelli inseriti per
+    categoria. Di norma basta un solo INSERT; se una riga esiste già, gli
+    inserimenti vengono ripetuti uno per uno e quelle esistenti non contano.
+    """
+    if not pairs:
+        return Counter()
+    try:
+        with transaction.atomic():
+            FoodPoll.objects.bulk_create([FoodPoll(user_id=user_id, category_id=category_id) for user_id, category_id in pairs])
+        return Counter(category_id for _, category_id in pairs)
+    except IntegrityError:
+        pass
+
+    inserted = Counter()
+    for user_id, category_id in pairs:
+        try:
+            with transaction.atomic():
+                FoodPoll.objects.create(user_id=user_id, category_id=category_id)
+            inserted[category_id] += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def _delete_food_poll_votes(pairs):
+    """Elimina i voti (user_id, category_id) e restituisce quelli eliminati per categoria"""
+    users_by_category = {}
+    for user_id, category_id in pairs:
+        users_by_category.setdefault(category_id, []).append(user_id)
+
+    deleted = Counter()
+    for category_id, user_ids in users_by_category.items():
+        for start in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+            count, _ = FoodPoll.objects.filter(
+                category_id=category_id, user_id__in=user_ids[start:start + DELETE_CHUNK_SIZE]
+            ).delete()
+            deleted[category_id] += count
+    return deleted
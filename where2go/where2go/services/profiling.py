@@ -0,0 +1,91 @@
+import marshal
+import os
+import pstats
+
+from django.conf import settings
+
+# Nodi più piccoli di questa frazione del tempo totale non vengono mostrati nel riepilogo
+FLAME_MIN_FRACTION = 0.01
+FLAME_MAX_DEPTH = 40
+
+
+def profile_stats_bytes(profiler):
+    """Contenuto di un file .prof, apribile con pstats, snakeviz o gprof2dot"""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def top_functions(profiler, limit=40):
+    """Le `limit` funzioni con più tempo cumulativo: lista di dizionari pronti per il template"""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': describe_function(func),
+            'calls': nc,
+            'primitive_calls': cc,
+            'own_ms': tt * 1000,
+            'cumulative_ms': ct * 1000,
+        }
+        for func, (cc, nc, tt, ct, callers) in rows
+    ]
+
+
+def flame_summary(profiler):
+    """
+    Riepilogo a fiamma (icicle) del profilo: righe di
+    {'depth', 'left', 'width' (percentuali), 'label', 'ms'}.
+    cProfile non registra gli stack completi ma solo le coppie chiamante ->
+    chiamato, quindi l'albero è ricostruito dal grafo: il tempo di un nodo è
+    quello dell'arco, sommato su tutti i percorsi che lo attraversano.
+    """
+    stats = pstats.Stats(profiler).stats
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((edge[3], func))
+
+    # Radici: le funzioni che nessun'altra funzione profilata ha chiamato
+    roots = [(ct, func) for func, (cc, nc, tt, ct, callers) in stats.items() if not callers and ct > 0]
+    total = sum(ct for ct, _ in roots)
+    if not total:
+        return []
+
+    rows = []
+
+    def visit(func, seconds, depth, left, path):
+        width = seconds / total * 100
+        rows.append({
+            'depth': depth, 'left': left, 'width': width,
+            'label': describe_function(func), 'ms': seconds * 1000,
+        })
+        if depth >= FLAME_MAX_DEPTH:
+            return
+        offset = left
+        for child_seconds, child in sorted(callees.get(func, ()), key=lambda edge: edge[0], reverse=True):
+            # Un figlio non può superare il padre: gli archi sono somme su tutti i percorsi
+            child_seconds = min(child_seconds, seconds - (offset - left) / 100 * total)
+            if child in path or child_seconds < total * FLAME_MIN_FRACTION:
+                continue
+            visit(child, child_seconds, depth + 1, offset, path | {child})
+            offset += child_seconds / total * 100
+
+    left = 0.0
+    for seconds, func in sorted(roots, key=lambda root: root[0], reverse=True):
+        visit(func, seconds, 0, left, {func})
+        left += seconds / total * 100
+    return rows
+
+
+def describe_function(func):
+    """'nome (file:riga)', con il percorso relativo al progetto quando possibile"""
+    filename, line, name = func
+    if filename == '~':
+        # Funzioni built-in: pstats le registra con il file '~'
+        return name
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        filename = os.path.relpath(filename, base_dir)
+    else:
+        filename = os.path.join(*filename.split(os.sep)[-2:])
+    return f'{name} ({filename}:{line})'
@@ -0,0 +1,169 @@
+import contextvars
+import os
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+
+REPLICA_ALIAS = 'replica'
+
+# Cookie con l'istante (epoch) fino al quale il client legge dal primario dopo una sua scrittura
+PRIMARY_COOKIE = 'w2g_primary_until'
+
+# Scritture che non vincolano il client al primario: le sessioni non vengono mai
+# lette dalla replica e gli utenti sono gestiti da mark_user_written (last_login no)
+UNPINNED_MODELS = ('sessions.Session', settings.AUTH_USER_MODEL)
+
+# Instradamento della richiesta in corso; None fuori da una richiesta (comandi, thread in background)
+_current = contextvars.ContextVar('where2go_replica_routing', default=None)
+
+
+class RoutingState:
+    """
+    Stato di instradamento di una richiesta. È un oggetto mutabile, come
+    RequestTimings: le scritture fatte nei thread di sync_to_async (che lavorano
+    su una copia del contesto) restano visibili alla richiesta.
+    """
+
+    __slots__ = ('pinned_until', 'reading', 'wrote')
+
+    def __init__(self, pinned_until=0.0):
+        self.pinned_until = pinned_until
+        # True solo dentro una vista decorata con use_read_replica che può leggere dalla replica
+        self.reading = False
+        self.wrote = False
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+
+
+def replica_heartbeat_path():
+    """File toccato da sync_replica a ogni copia: la sua data di modifica è l'istante della copia"""
+    return f"{settings.DATABASES[REPLICA_ALIAS]['NAME']}.synced"
+
+
+def get_replica_lag():
+    """Secondi dall'ultima copia della replica, None se non è mai stata sincronizzata"""
+    try:
+        return max(0.0, time.time() - os.stat(replica_heartbeat_path()).st_mtime)
+    except OSError:
+        return None
+
+
+def start_replica_routing(request):
+    """Inizia l'instradamento della richiesta; restituisce (stato, token per stop_replica_routing)"""
+    try:
+        pinned_until = float(request.COOKIES.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0.0
+    state = RoutingState(pinned_until)
+    return state, _current.set(state)
+
+
+def stop_replica_routing(token):
+    _current.reset(token)
+
+
+def finish_replica_routing(state, response):
+    """Dopo una scrittura il client resta sul primario finché la replica può non averla ancora"""
+    if state.wrote:
+        max_lag = replica_max_lag()
+        response.set_cookie(
+            PRIMARY_COOKIE, f'{time.time() + max_lag:.3f}', max_age=max(1, int(max_lag) + 1),
+            httponly=True, samesite='Lax',
+        )
+
+
+def _begin_read(state):
+    """La vista può leggere dalla replica? Non se ha già scritto, se il client è vincolato o se la replica è indietro"""
+    if state is None or state.wrote or state.pinned_until > time.time():
+        return False
+    lag = get_replica_lag()
+    return lag is not None and lag <= replica_max_lag()
+
+
+def use_read_replica(view):
+    """
+    Decoratore per le viste di sola lettura: i modelli di where2go vengono letti
+    dalla replica, finché la richiesta non scrive. Va messo per primo (sopra
+    condition()), così anche l'ETag viene calcolato sulla replica.
+    Senza replica configurata o senza ReplicaRoutingMiddleware non fa nulla.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = _current.get()
+            if not _begin_read(state):
+                return await view(request, *args, **kwargs)
+            state.reading = True
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                state.reading = False
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _current.get()
+            if not _begin_read(state):
+                return view(request, *args, **kwargs)
+            state.reading = True
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                state.reading = False
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Router del database: dentro le viste use_read_replica le letture dei modelli
+    di where2go vanno sulla replica; tutto il resto (utenti, sessioni, scritture
+    e letture dopo una scrittura) resta sul primario. La replica è una copia del
+    primario (sync_replica), quindi non riceve migrazioni.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is not None and state.reading and not state.wrote and model._meta.app_label == 'where2go':
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None and model._meta.label not in UNPINNED_MODELS:
+            state.wrote = True
+        # Esplicito: altrimenti Django salverebbe sul database da cui l'istanza è stata letta
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+def mark_user_written(sender, update_fields=None, **kwargs):
+    """
+    Receiver di post_save/post_delete degli utenti: i nomi compaiono nei dati
+    letti dalla replica, quindi creare, modificare o eliminare un utente vincola
+    il client al primario. Non lo fa il solo aggiornamento di last_login al login.
+    """
+    state = _current.get()
+    if state is not None and not (update_fields and set(update_fields) <= {'last_login'}):
+        state.wrote = True
+
+
+post_save.connect(mark_user_written, sender=settings.AUTH_USER_MODEL, dispatch_uid='where2go-replica-user-saved')
+post_delete.connect(mark_user_written, sender=settings.AUTH_USER_MODEL, dispatch_uid='where2go-replica-user-deleted')
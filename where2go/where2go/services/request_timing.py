@@ -0,0 +1,81 @@
+import contextvars
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Tempi della richiesta in corso; None fuori da una richiesta misurata (comandi, thread in background)
+_current = contextvars.ContextVar('where2go_request_timings', default=None)
+
+
+class RequestTimings:
+    """Query al database e chiamate upstream di una richiesta, con il tempo speso in ciascuna"""
+
+    __slots__ = ('queries', 'db_seconds', 'upstream_calls', 'upstream_seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        # Lista di (sql, parametri, secondi) solo se qualcuno li vuole raccogliere (il profiler)
+        self.statements = None
+
+
+def start_request_timings():
+    """
+    Inizia a misurare la richiesta corrente; restituisce (tempi, token per
+    stop_request_timings). Se un middleware più esterno la sta già misurando
+    restituisce i suoi tempi, così entrambi vedono le stesse query.
+    """
+    timings = _current.get()
+    if timings is not None:
+        return timings, None
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop_request_timings(token):
+    if token is not None:
+        _current.reset(token)
+
+
+def record_upstream_time(seconds):
+    """Registra una chiamata upstream nella richiesta corrente, se misurata"""
+    timings = _current.get()
+    if timings is not None:
+        timings.upstream_calls += 1
+        timings.upstream_seconds += seconds
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Execute wrapper di Django: conta le query e il loro tempo nella richiesta
+    corrente. Sulle connessioni usate fuori da una richiesta misurata costa
+    solo una lettura della contextvar.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.queries += 1
+        timings.db_seconds += elapsed
+        if timings.statements is not None:
+            timings.statements.append((sql, params, elapsed))
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """Receiver di connection_created: aggiunge time_query a ogni nuova connessione"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def enable_query_timing():
+    """Conta le query di ogni connessione, quelle già aperte e quelle future (anche nei thread di sync_to_async)"""
+    connection_created.connect(install_query_timer, dispatch_uid='where2go-query-timer')
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(None, connection)
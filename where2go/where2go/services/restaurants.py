@@ -0,0 +1,89 @@
+import math
+import threading
+
+from django.conf import settings
+
+from ..models import Restaurants
+from .poll_versions import bump_poll_version, get_poll_version
+from .spatial import GridIndex
+
+# Nome della riga di PollVersion che conta le modifiche ai ristoranti
+RESTAURANTS_VERSION = 'restaurants'
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def parse_coordinates(latitude, longitude):
+    """Converte latitudine e longitudine in float, sollevando ValueError se non sono valide"""
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates out of range')
+    return latitude, longitude
+
+
+def build_restaurant_index():
+    """Indice spaziale dei ristoranti con coordinate, con la categoria come tag"""
+    index = GridIndex(getattr(settings, 'RESTAURANT_GRID_CELL_DEGREES', 0.01))
+    rows = (
+        Restaurants.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .values_list('id', 'latitude', 'longitude', 'category_id')
+    )
+    for restaurant_id, latitude, longitude, category_id in rows.iterator(chunk_size=2000):
+        index.insert(restaurant_id, latitude, longitude, category_id)
+    return index
+
+
+def get_restaurant_index():
+    """
+    Indice dei ristoranti di questo processo: costruito alla prima richiesta
+    e ricostruito solo se un altro processo ha modificato i ristoranti
+    (la versione in PollVersion non è più quella dell'indice).
+    """
+    global _index, _index_version
+    version = get_poll_version(RESTAURANTS_VERSION)
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = build_restaurant_index()
+            _index_version = version
+        return _index
+
+
+def index_restaurant(restaurant):
+    """Aggiorna l'indice dopo il salvataggio di un ristorante"""
+    if restaurant.latitude is None or restaurant.longitude is None:
+        _apply_index_change(lambda index: index.remove(restaurant.id))
+    else:
+        _apply_index_change(lambda index: index.insert(
+            restaurant.id, restaurant.latitude, restaurant.longitude, restaurant.category_id
+        ))
+
+
+def unindex_restaurant(restaurant_id):
+    """Aggiorna l'indice dopo l'eliminazione di un ristorante"""
+    _apply_index_change(lambda index: index.remove(restaurant_id))
+
+
+def _apply_index_change(change):
+    global _index_version
+    version = bump_poll_version(RESTAURANTS_VERSION)
+    with _index_lock:
+        # Modifica incrementale solo se nessun altro processo ha cambiato i ristoranti nel frattempo;
+        # altrimenti l'indice verrà ricostruito alla prossima lettura
+        if _index is not None and _index_version == version - 1:
+            change(_index)
+            _index_version = version
+
+
+def find_nearby_restaurants(latitude, longitude, radius_km=None, limit=10, category_id=None):
+    """
+    Ristoranti vicini al punto, ordinati per distanza: lista di (distanza_km, restaurant_id).
+    Con `radius_km` quelli entro il raggio (al più `limit`), altrimenti i `limit` più vicini.
+    """
+    index = get_restaurant_index()
+    if radius_km is not None:
+        if not (math.isfinite(radius_km) and radius_km > 0):
+            raise ValueError('Radius must be positive')
+        return index.within(latitude, longitude, radius_km, tag=category_id, limit=limit)
+    return index.nearest(latitude, longitude, limit, tag=category_id)
@@ -0,0 +1,145 @@
+import heapq
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distanza in km tra due punti sulla superficie terrestre"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Indice spaziale in memoria a griglia uniforme: ogni punto finisce nella
+    cella di `cell_degrees` x `cell_degrees` che lo contiene, e le ricerche
+    visitano solo le celle vicine al punto cercato invece di tutti i punti.
+    Inserimento e rimozione sono O(1); le distanze vengono calcolate con
+    haversine solo sui candidati delle celle visitate.
+    Non gestisce il passaggio dell'antimeridiano (longitudine ±180).
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.positions = {}
+        # Celle estreme mai occupate (non si restringono con le rimozioni): limitano gli anelli di nearest()
+        self.bounds = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def insert(self, item_id, lat, lon, tag=None):
+        """Aggiunge (o sposta) un punto; `tag` è un valore libero usato per filtrare, es. la categoria"""
+        with self.lock:
+            self.remove(item_id)
+            key = self.cell(lat, lon)
+            self.cells.setdefault(key, {})[item_id] = (lat, lon, tag)
+            self.positions[item_id] = key
+            if self.bounds is None:
+                self.bounds = (key[0], key[1], key[0], key[1])
+            else:
+                min_x, min_y, max_x, max_y = self.bounds
+                self.bounds = (min(min_x, key[0]), min(min_y, key[1]), max(max_x, key[0]), max(max_y, key[1]))
+
+    def remove(self, item_id):
+        with self.lock:
+            key = self.positions.pop(item_id, None)
+            if key is None:
+                return False
+            cell = self.cells[key]
+            del cell[item_id]
+            if not cell:
+                del self.cells[key]
+            return True
+
+    def within(self, lat, lon, radius_km, tag=None, limit=None):
+        """Punti entro `radius_km`, ordinati per distanza: lista di (distanza_km, item_id)"""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        min_x, min_y = self.cell(lat - dlat, lon - dlon)
+        max_x, max_y = self.cell(lat + dlat, lon + dlon)
+
+        found = []
+        with self.lock:
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.cells):
+                # Raggio più grande dell'area occupata: conviene scorrere solo le celle non vuote
+                keys = [key for key in self.cells if min_x <= key[0] <= max_x and min_y <= key[1] <= max_y]
+            else:
+                keys = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+            for key in keys:
+                for item_id, (item_lat, item_lon, item_tag) in self.cells.get(key, {}).items():
+                    if tag is not None and item_tag != tag:
+                        continue
+                    distance = haversine_km(lat, lon, item_lat, item_lon)
+                    if distance <= radius_km:
+                        found.append((distance, item_id))
+
+        found.sort()
+        return found[:limit] if limit is not None else found
+
+    def nearest(self, lat, lon, k, tag=None, max_radius_km=None):
+        """
+        I `k` punti più vicini, ordinati per distanza: lista di (distanza_km, item_id).
+        Visita anelli di celle sempre più larghi e si ferma appena nessuna cella
+        non ancora visitata può contenere un punto più vicino del k-esimo trovato.
+        """
+        if k <= 0:
+            return []
+        center_x, center_y = self.cell(lat, lon)
+
+        best = []  # max-heap di (-distanza, item_id)
+        with self.lock:
+            if not self.cells:
+                return []
+            min_x, min_y, max_x, max_y = self.bounds
+            max_ring = max(center_x - min_x, max_x - center_x, center_y - min_y, max_y - center_y)
+
+            ring = 0
+            while ring <= max_ring:
+                for key in self.ring_cells(center_x, center_y, ring):
+                    for item_id, (item_lat, item_lon, item_tag) in self.cells.get(key, {}).items():
+                        if tag is not None and item_tag != tag:
+                            continue
+                        distance = haversine_km(lat, lon, item_lat, item_lon)
+                        if max_radius_km is not None and distance > max_radius_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, item_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, item_id))
+
+                # Ogni punto oltre questo anello dista almeno ring lati di cella; il lato
+                # più corto è quello in longitudine alla latitudine più lontana dall'equatore
+                far_lat = min(abs(lat) + (ring + 1) * self.cell_degrees, 89.9)
+                reach = ring * self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(far_lat)), 1e-6)
+                if len(best) == k and -best[0][0] <= reach:
+                    break
+                if max_radius_km is not None and reach > max_radius_km:
+                    break
+                ring += 1
+
+        return sorted((-distance, item_id) for distance, item_id in best)
+
+    @staticmethod
+    def ring_cells(center_x, center_y, ring):
+        """Celle a distanza di Chebyshev esattamente `ring` dalla cella centrale"""
+        if ring == 0:
+            yield (center_x, center_y)
+            return
+        for x in range(center_x - ring, center_x + ring + 1):
+            yield (x, center_y - ring)
+            yield (x, center_y + ring)
+        for y in range(center_y - ring + 1, center_y + ring):
+            yield (center_x - ring, y)
+            yield (center_x + ring, y)
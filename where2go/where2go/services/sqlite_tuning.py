@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def sqlite_pragma_statements(pragmas):
+    """Le istruzioni PRAGMA per il dizionario `pragmas` (nome: valore), nell'ordine dato"""
+    statements = []
+    for name, value in pragmas.items():
+        if not name.isidentifier():
+            raise ValueError(f'Nome di PRAGMA non valido: {name!r}')
+        if isinstance(value, bool) or not isinstance(value, int):
+            value = str(value)
+            if not value.isidentifier():
+                raise ValueError(f'Valore non valido per PRAGMA {name}: {value!r}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Receiver di connection_created: applica settings.SQLITE_PRAGMAS a ogni nuova
+    connessione SQLite. busy_timeout va per primo, così anche il passaggio a WAL
+    aspetta un eventuale lock invece di fallire subito.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+def get_sqlite_pragmas(connection, names=None):
+    """Valori correnti dei PRAGMA `names` (di default quelli configurati) sulla connessione"""
+    names = names or list(getattr(settings, 'SQLITE_PRAGMAS', None) or {})
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            if not name.isidentifier():
+                raise ValueError(f'Nome di PRAGMA non valido: {name!r}')
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
+
+
+def enable_sqlite_pragmas():
+    """Applica i PRAGMA alle connessioni future e a quelle già aperte"""
+    connection_created.connect(apply_sqlite_pragmas, dispatch_uid='where2go-sqlite-pragmas')
+    for connection in connections.all(initialized_only=True):
+        # Solo quelle già connesse: le altre passeranno da connection_created
+        if connection.connection is not None:
+            apply_sqlite_pragmas(None, connection)
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import record_upstream_call
+from .request_timing import record_upstream_time
+
+try:
+    import httpx
+except ImportError:  # httpx è opzionale: senza, aget() esegue get() in un thread
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Esiti registrati per ogni chiamata verso un servizio esterno
+OUTCOMES = ('ok', 'http_error', 'timeout', 'connection_error', 'circuit_open')
+
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Il circuit breaker è aperto: la chiamata non viene nemmeno tentata"""
+
+
+class CircuitBreaker:
+    """
+    Dopo `threshold` errori consecutivi il circuito si apre e le chiamate
+    falliscono subito per `reset_seconds`; poi una sola chiamata di prova
+    (half-open) decide se richiuderlo o riaprirlo.
+    """
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release_probe(self):
+        """
+        La chiamata di prova è finita con un'eccezione imprevista, senza esito:
+        la prossima chiamata ne farà un'altra, invece di trovare il circuito
+        bloccato in half-open.
+        """
+        with self.lock:
+            self.probing = False
+
+
+class RetryBudget:
+    """
+    Limita i tentativi ripetuti a una frazione (`ratio`) delle chiamate:
+    ogni chiamata deposita `ratio` gettoni, ogni ripetizione ne spende uno.
+    Quando l'upstream è degradato le ripetizioni non ne moltiplicano il carico.
+    """
+
+    def __init__(self, ratio, max_tokens):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class UpstreamClient:
+    """
+    Client HTTP condiviso verso un servizio esterno: sessione con connessioni
+    keep-alive riusate, timeout di connessione e lettura separati, ripetizioni
+    con backoff esponenziale e jitter (entro il RetryBudget) e circuit breaker.
+    Latenza ed esito di ogni chiamata finiscono in `stats`.
+    Le viste asincrone usano aget(), con le stesse regole e lo stesso breaker.
+    """
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=5, retries=2, backoff=0.2,
+                 breaker_threshold=5, breaker_reset_seconds=30, pool_size=10, retry_ratio=0.2):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+        self.budget = RetryBudget(retry_ratio, max_tokens=max(retries, 1) * 5)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+        # Un client httpx per event loop: le sue connessioni non possono passare da un loop all'altro
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'retries': 0,
+            'outcomes': dict.fromkeys(OUTCOMES, 0),
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+
+    def get(self, url, **kwargs):
+        """
+        GET verso l'upstream. Restituisce la risposta (anche con status 4xx);
+        solleva UpstreamUnavailable se il circuito è aperto, o l'eccezione di
+        requests dell'ultimo tentativo se tutti falliscono.
+        """
+        if not self.breaker.allow():
+            self.record('circuit_open', 0.0)
+            raise UpstreamUnavailable(f'{self.name}: circuit breaker open')
+
+        self.budget.deposit()
+        try:
+            return self._get_attempts(url, kwargs)
+        except BaseException:
+            # Dopo record_success/record_failure non c'è più una prova in corso:
+            # qui si arriva con il probing ancora attivo solo per le eccezioni
+            # non gestite (ChunkedEncodingError, InvalidURL, KeyboardInterrupt...)
+            self.breaker.release_probe()
+            raise
+
+    def _get_attempts(self, url, kwargs):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.Timeout as e:
+                outcome, error, response = 'timeout', e, None
+            except requests.exceptions.ConnectionError as e:
+                outcome, error, response = 'connection_error', e, None
+            else:
+                error = None
+                outcome = 'http_error' if response.status_code >= 500 else 'ok'
+            self.record(outcome, time.monotonic() - started)
+
+            delay = self.retry_delay(outcome, attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            time.sleep(delay)
+
+    async def aget(self, url, **kwargs):
+        """
+        Come get(), senza occupare un thread durante l'attesa: usa httpx se
+        installato. Gli errori di rete vengono convertiti nelle eccezioni di
+        requests, così i chiamanti gestiscono allo stesso modo entrambe le strade.
+        """
+        if httpx is None:
+            return await sync_to_async(self.get, thread_sensitive=False)(url, **kwargs)
+
+        if not self.breaker.allow():
+            self.record('circuit_open', 0.0)
+            raise UpstreamUnavailable(f'{self.name}: circuit breaker open')
+
+        self.budget.deposit()
+        try:
+            return await self._aget_attempts(url, kwargs)
+        except BaseException:
+            # Come in get(), anche per asyncio.CancelledError
+            self.breaker.release_probe()
+            raise
+
+    async def _aget_attempts(self, url, kwargs):
+        client = self.get_async_client()
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = await client.get(url, **kwargs)
+            except httpx.TimeoutException as e:
+                outcome, error, response = 'timeout', requests.exceptions.Timeout(str(e)), None
+            except httpx.TransportError as e:
+                outcome, error, response = 'connection_error', requests.exceptions.ConnectionError(str(e)), None
+            else:
+                error = None
+                outcome = 'http_error' if response.status_code >= 500 else 'ok'
+            self.record(outcome, time.monotonic() - started)
+
+            delay = self.retry_delay(outcome, attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def get_async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = self.timeout
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return client
+
+    def retry_delay(self, outcome, attempt):
+        """
+        Secondi da attendere prima di ripetere la chiamata, o None se il
+        tentativo appena registrato è l'ultimo (aggiornando il circuit breaker).
+        """
+        if outcome == 'ok':
+            self.breaker.record_success()
+            return None
+
+        if attempt >= self.retries or not self.budget.withdraw():
+            self.breaker.record_failure()
+            return None
+
+        with self.stats_lock:
+            self.stats['retries'] += 1
+        # Full jitter: attesa casuale tra 0 e backoff * 2^tentativo
+        return random.uniform(0, self.backoff * 2 ** (attempt + 1))
+
+    def record(self, outcome, latency):
+        with self.stats_lock:
+            self.stats['calls'] += 1
+            self.stats['outcomes'][outcome] += 1
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+        record_upstream_time(latency)
+        record_upstream_call(self.name, outcome, latency)
+        logger.debug('%s upstream call: %s in %.3fs', self.name, outcome, latency)
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats, outcomes=dict(self.stats['outcomes']))
+        stats['breaker'] = self.breaker.state
+        return stats
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream_client(name):
+    """Client condiviso per `name`, configurato dalle impostazioni UPSTREAM_*"""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = UpstreamClient(
+                name,
+                connect_timeout=getattr(settings, 'UPSTREAM_CONNECT_TIMEOUT', 3.05),
+                read_timeout=getattr(settings, 'UPSTREAM_READ_TIMEOUT', 5),
+                retries=getattr(settings, 'UPSTREAM_RETRIES', 2),
+                backoff=getattr(settings, 'UPSTREAM_BACKOFF', 0.2),
+                breaker_threshold=getattr(settings, 'UPSTREAM_BREAKER_THRESHOLD', 5),
+                breaker_reset_seconds=getattr(settings, 'UPSTREAM_BREAKER_RESET_SECONDS', 30),
+                pool_size=getattr(settings, 'UPSTREAM_POOL_SIZE', 10),
+            )
+        return client
+
+
+def get_upstream_stats():
+    """Statistiche di tutti i client creati in questo processo, per nome"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.get_stats() for client in clients}
@@ -0,0 +1,348 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .metrics import record_poll_vote
+from .poll_snapshot import aget_user_food_vote_ids, get_user_food_vote_ids
+from .poll_votes import apply_food_poll_votes
+
+logger = logging.getLogger(__name__)
+
+VOTE_QUEUE_PREFIX = 'where2go:vote-queue'
+
+# Le voci in cache sopravvivono a lungo a un worker che muore prima del flush
+CACHE_ENTRY_TIMEOUT = 24 * 60 * 60
+CACHE_LOCK_TIMEOUT = 30
+
+# Secondi dopo i quali un numero di sequenza mancante in cache viene considerato perso
+CACHE_GAP_TIMEOUT = 5
+
+# Lock per utente in cache: scade da solo se il worker che lo tiene muore
+CACHE_USER_LOCK_TIMEOUT = 5
+
+
+class MemoryVoteQueue:
+    """
+    Coda dei voti nel processo: per ogni utente l'ultimo stato voluto di ogni
+    categoria, quindi i click ripetuti si riducono al loro effetto netto.
+    I voti non ancora applicati si perdono se il processo muore.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Voti presi dal flush in corso: restano visibili a pending_for fino al commit
+        self._in_flight = {}
+        # Lock a strisce per utente: un toggle legge lo stato e accoda l'intenzione senza interferenze
+        self._user_locks = [threading.Lock() for _ in range(64)]
+
+    def user_lock(self, user_id):
+        return self._user_locks[user_id % len(self._user_locks)]
+
+    def add(self, user_id, category_id, wanted):
+        with self._lock:
+            self._pending.setdefault(user_id, {})[category_id] = wanted
+
+    def pending_for(self, user_id):
+        with self._lock:
+            return {**self._in_flight.get(user_id, {}), **self._pending.get(user_id, {})}
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(votes) for votes in self._pending.values()) + sum(
+                len(votes) for votes in self._in_flight.values()
+            )
+
+    def take(self):
+        """Svuota la coda; restituisce ({(user_id, category_id): voluto}, ticket per commit/abort)"""
+        with self._lock:
+            self._in_flight, self._pending = self._pending, {}
+            intents = {
+                (user_id, category_id): wanted
+                for user_id, votes in self._in_flight.items() for category_id, wanted in votes.items()
+            }
+        return intents, None
+
+    def commit(self, ticket):
+        with self._lock:
+            self._in_flight = {}
+
+    def abort(self, ticket):
+        """Rimette in coda i voti di un flush fallito, sotto a quelli arrivati nel frattempo"""
+        with self._lock:
+            for user_id, votes in self._in_flight.items():
+                self._pending[user_id] = {**votes, **self._pending.get(user_id, {})}
+            self._in_flight = {}
+
+
+class CacheVoteQueue:
+    """
+    Coda dei voti in cache, condivisa dai worker se lo è la cache: ogni voto ha
+    un numero di sequenza (cache.incr) e il worker che prende il lock applica
+    in ordine quelli tra la testa e la coda. Con una cache persistente (Redis,
+    file) i voti sopravvivono alla morte del worker che li ha ricevuti.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+        self.head_key = f'{VOTE_QUEUE_PREFIX}:head'
+        self.tail_key = f'{VOTE_QUEUE_PREFIX}:tail'
+        self.lock_key = f'{VOTE_QUEUE_PREFIX}:lock'
+        self._gap = None
+
+    def entry_key(self, seq):
+        return f'{VOTE_QUEUE_PREFIX}:{seq}'
+
+    def user_key(self, user_id):
+        return f'{VOTE_QUEUE_PREFIX}:user:{user_id}'
+
+    @contextmanager
+    def user_lock(self, user_id):
+        """
+        Lock dell'utente condiviso dai worker (cache.add): i toggle dello stesso
+        utente, anche da processi diversi, leggono e aggiornano le sue
+        intenzioni uno alla volta. Scaduto, viene tolto solo da chi lo tiene.
+        """
+        key = f'{VOTE_QUEUE_PREFIX}:user-lock:{user_id}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + CACHE_USER_LOCK_TIMEOUT * 2
+        while not self.cache.add(key, token, CACHE_USER_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Vote queue lock of user {user_id} not released')
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def next_seq(self):
+        try:
+            return self.cache.incr(self.tail_key)
+        except ValueError:
+            self.cache.add(self.tail_key, 0, None)
+            return self.cache.incr(self.tail_key)
+
+    def add(self, user_id, category_id, wanted):
+        # Chiamata con user_lock(user_id): la lettura e riscrittura della chiave dell'utente non si sovrappongono
+        seq = self.next_seq()
+        self.cache.set(self.entry_key(seq), (user_id, category_id, wanted), CACHE_ENTRY_TIMEOUT)
+        # Per la risposta ottimistica: ultimo stato voluto per categoria, con la sua sequenza
+        votes = self.cache.get(self.user_key(user_id)) or {}
+        votes[category_id] = (seq, wanted)
+        self.cache.set(self.user_key(user_id), votes, CACHE_ENTRY_TIMEOUT)
+
+    def pending_for(self, user_id):
+        values = self.cache.get_many([self.user_key(user_id), self.head_key])
+        head = values.get(self.head_key) or 0
+        votes = values.get(self.user_key(user_id)) or {}
+        return {category_id: wanted for category_id, (seq, wanted) in votes.items() if seq > head}
+
+    def pending_count(self):
+        values = self.cache.get_many([self.head_key, self.tail_key])
+        return (values.get(self.tail_key) or 0) - (values.get(self.head_key) or 0)
+
+    def take(self):
+        if not self.cache.add(self.lock_key, os.getpid(), CACHE_LOCK_TIMEOUT):
+            # Un altro worker sta già applicando la coda
+            return {}, None
+        head = self.cache.get(self.head_key) or 0
+        tail = self.cache.get(self.tail_key) or 0
+        keys = [self.entry_key(seq) for seq in range(head + 1, tail + 1)]
+        entries = self.cache.get_many(keys) if keys else {}
+
+        intents = {}
+        last = head
+        for seq in range(head + 1, tail + 1):
+            entry = entries.get(self.entry_key(seq))
+            if entry is None:
+                # Sequenza presa ma voce non ancora scritta: si riprende da qui al prossimo flush,
+                # a meno che la voce manchi da troppo (scaduta o mai scritta)
+                if self._gap is None or self._gap[0] != seq:
+                    self._gap = (seq, time.monotonic())
+                    break
+                if time.monotonic() - self._gap[1] < CACHE_GAP_TIMEOUT:
+                    break
+                logger.warning('Vote queue entry %d lost, skipping it', seq)
+            else:
+                user_id, category_id, wanted = entry
+                intents[(user_id, category_id)] = wanted
+            last = seq
+        return intents, (head, last)
+
+    def commit(self, ticket):
+        if ticket is None:
+            return
+        head, last = ticket
+        self.cache.set(self.head_key, last, None)
+        self.cache.delete_many([self.entry_key(seq) for seq in range(head + 1, last + 1)])
+        self.cache.delete(self.lock_key)
+
+    def abort(self, ticket):
+        # La testa non avanza: i voti verranno ripresi al prossimo flush
+        if ticket is not None:
+            self.cache.delete(self.lock_key)
+
+
+class VoteFlusher:
+    """Thread in background che applica la coda ogni VOTE_QUEUE_FLUSH_MS, in una transazione per flush"""
+
+    def __init__(self, queue, interval):
+        self.queue = queue
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        # Dopo un fork il thread del processo padre non esiste più nel figlio
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self.run, name='where2go-vote-flusher', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            # Come tra una richiesta e l'altra: chiude la connessione se scaduta o inutilizzabile
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Vote queue flush failed')
+
+    def flush(self):
+        """Applica i voti in coda; restituisce quanti voti sono cambiati"""
+        # Il thread e flush_vote_queue (es. all'uscita) non devono prendere la coda insieme
+        with self._flush_lock:
+            intents, ticket = self.queue.take()
+            if not intents:
+                self.queue.commit(ticket)
+                return 0
+            try:
+                changed = apply_food_poll_votes(intents)
+            except Exception:
+                self.queue.abort(ticket)
+                raise
+            self.queue.commit(ticket)
+            return changed
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def vote_queue_enabled():
+    return getattr(settings, 'VOTE_QUEUE', '') in ('memory', 'cache')
+
+
+def get_vote_flusher():
+    """Il flusher del processo, con la coda scelta da VOTE_QUEUE"""
+    global _flusher
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                if settings.VOTE_QUEUE == 'cache':
+                    queue = CacheVoteQueue(getattr(settings, 'VOTE_QUEUE_CACHE_ALIAS', 'default'))
+                else:
+                    queue = MemoryVoteQueue()
+                _flusher = VoteFlusher(queue, getattr(settings, 'VOTE_QUEUE_FLUSH_MS', 250) / 1000)
+                # Chiusura ordinata del processo: i voti ancora in coda vengono applicati
+                atexit.register(flush_vote_queue)
+    return _flusher
+
+
+def with_pending_food_votes(vote_ids, pending):
+    """I voti dell'utente come saranno dopo il flush: quelli salvati più le intenzioni in coda"""
+    votes = set(vote_ids)
+    for category_id, wanted in pending.items():
+        if wanted:
+            votes.add(category_id)
+        else:
+            votes.discard(category_id)
+    ordered = [category_id for category_id in vote_ids if category_id in votes]
+    return ordered + sorted(votes - set(ordered))
+
+
+def pending_food_votes(user_id):
+    """Le intenzioni dell'utente ancora in coda, {category_id: voluto}; {} senza coda"""
+    if not vote_queue_enabled():
+        return {}
+    return get_vote_flusher().queue.pending_for(user_id)
+
+
+def pending_food_votes_token(pending):
+    """Breve impronta delle intenzioni in coda, da aggiungere all'ETag ('' se non ce ne sono)"""
+    if not pending:
+        return ''
+    return format(zlib.crc32(repr(sorted(pending.items())).encode()), '08x')
+
+
+def get_user_food_votes_with_pending(user, pending=None):
+    """
+    I voti dell'utente con sopra quelli ancora in coda: dopo un voto accodato
+    le letture dell'utente lo riportano già, anche prima del flush.
+    `pending` va letto prima del database (come in queue_food_poll_toggle):
+    un flush che finisce in mezzo compare almeno in uno dei due.
+    """
+    if pending is None:
+        pending = pending_food_votes(user.pk)
+    return with_pending_food_votes(get_user_food_vote_ids(user), pending)
+
+
+async def aget_user_food_votes_with_pending(user, pending=None):
+    """Come get_user_food_votes_with_pending(), con l'ORM asincrono"""
+    if pending is None:
+        pending = await sync_to_async(pending_food_votes)(user.pk)
+    return with_pending_food_votes(await aget_user_food_vote_ids(user), pending)
+
+
+def queue_food_poll_toggle(user, category_id):
+    """
+    Mette in coda il toggle del voto, senza scrivere sul database, e restituisce
+    i voti dell'utente come risulteranno dopo il flush (risposta ottimistica).
+    Restituisce None se la coda è disattivata o piena (VOTE_QUEUE_MAX_PENDING):
+    allora il voto va scritto subito con toggle_food_poll_vote.
+    """
+    if not vote_queue_enabled():
+        return None
+    flusher = get_vote_flusher()
+    queue = flusher.queue
+    if queue.pending_count() >= getattr(settings, 'VOTE_QUEUE_MAX_PENDING', 10000):
+        return None
+
+    # Due click ravvicinati non devono calcolare entrambi lo stesso stato voluto
+    with queue.user_lock(user.pk):
+        vote_ids = get_user_food_votes_with_pending(user)
+        wanted = category_id not in vote_ids
+        queue.add(user.pk, category_id, wanted)
+    flusher.ensure_started()
+    record_poll_vote('food')
+    if wanted:
+        return vote_ids + [category_id]
+    return [vote_id for vote_id in vote_ids if vote_id != category_id]
+
+
+def flush_vote_queue():
+    """Applica subito i voti in coda in questo processo (usata anche all'uscita)"""
+    if _flusher is None:
+        return 0
+    try:
+        return _flusher.flush()
+    except Exception:
+        logger.exception('Vote queue flush failed')
+        return 0
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import record_cache_lookup
+from .poll_cache import arelease_cache_lock, release_cache_lock
+
+logger = logging.getLogger(__name__)
+
+# Per quanto tenere l'ultima previsione riuscita, servita quando l'upstream non risponde
+LAST_GOOD_TIMEOUT = 7 * 24 * 60 * 60
+
+
+class _Flight:
+    """Una lettura dall'upstream in corso, condivisa da tutte le richieste della stessa chiave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+# Letture in corso delle viste asincrone, per event loop e chiave
+_async_flights = {}
+
+
+def get_weather_cache():
+    return caches[getattr(settings, 'WEATHER_CACHE_ALIAS', 'default')]
+
+
+def weather_cache_key(lat, lon, friday_date):
+    return f'where2go:weather:{lat:.4f}:{lon:.4f}:{friday_date}'
+
+
+def get_cached_forecast(key, fetch):
+    """
+    Restituisce la previsione in cache per `key`, con stale-while-revalidate:
+    - fresca (meno di WEATHER_CACHE_FRESH_SECONDS): restituita così com'è;
+    - scaduta ma entro WEATHER_CACHE_STALE_SECONDS: restituita subito, mentre
+      un thread in background la aggiorna con `fetch()`;
+    - assente: viene letta con `fetch()`, una sola volta per chiave anche
+      con molte richieste concorrenti.
+    `fetch()` restituisce il dizionario della previsione; vengono messe in
+    cache solo le risposte con 'success' True. Se `fetch()` fallisce e la
+    cache è vuota si ripiega sull'ultima previsione riuscita, con 'stale' True.
+    """
+    payload = peek_cached_forecast(key, fetch)
+    if payload is not None:
+        return payload
+    record_cache_lookup('weather', 'miss')
+
+    flight, leader = _join_flight(key)
+    if leader:
+        _run_flight(key, fetch, flight, wait=True)
+    else:
+        flight.done.wait(getattr(settings, 'WEATHER_CACHE_LOCK_TIMEOUT', 30))
+    if flight.payload is None:
+        return {'success': False, 'error': 'Previsioni meteo non disponibili'}
+    return flight.payload
+
+
+def peek_cached_forecast(key, fetch):
+    """
+    La previsione in cache per `key`, fresca o scaduta (aggiornata allora in
+    background con `fetch()`), oppure None se manca: non attende mai l'upstream.
+    """
+    entry = get_weather_cache().get(key)
+    if entry is None:
+        return None
+    if time.time() - entry['fetched_at'] >= getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800):
+        record_cache_lookup('weather', 'stale')
+        refresh_forecast_in_background(key, fetch)
+    else:
+        record_cache_lookup('weather', 'hit')
+    return entry['payload']
+
+
+async def aget_cached_forecast(key, afetch, fetch):
+    """
+    Come get_cached_forecast(), per le viste asincrone: la lettura di una
+    previsione assente usa la coroutine `afetch()` senza occupare thread,
+    mentre l'aggiornamento in background resta sul thread con `fetch()`.
+    """
+    cache = get_weather_cache()
+    entry = await cache.aget(key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] >= getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800):
+            record_cache_lookup('weather', 'stale')
+            refresh_forecast_in_background(key, fetch)
+        else:
+            record_cache_lookup('weather', 'hit')
+        return entry['payload']
+    record_cache_lookup('weather', 'miss')
+
+    flight_key = (id(asyncio.get_running_loop()), key)
+    task = _async_flights.get(flight_key)
+    if task is None:
+        task = _async_flights[flight_key] = asyncio.ensure_future(_arun_flight(cache, key, afetch))
+        task.add_done_callback(lambda _: _async_flights.pop(flight_key, None))
+    payload = await asyncio.shield(task)
+    if payload is None:
+        return {'success': False, 'error': 'Previsioni meteo non disponibili'}
+    return payload
+
+
+def get_cached_forecasts(keys, fetch_many):
+    """
+    Come get_cached_forecast() per molte chiavi insieme: una sola get_many
+    sulla cache e una sola chiamata `fetch_many(chiavi)` per tutte quelle
+    assenti (le scadute vengono aggiornate in background, sempre in blocco).
+    `fetch_many()` restituisce {chiave: previsione}; restituisce {chiave: previsione}
+    con una voce per ogni chiave, con 'success' False per quelle non disponibili.
+    """
+    cache = get_weather_cache()
+    entries = cache.get_many(keys)
+    fresh_seconds = getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800)
+    now = time.time()
+
+    forecasts = {key: entry['payload'] for key, entry in entries.items()}
+    stale = sorted(key for key, entry in entries.items() if now - entry['fetched_at'] >= fresh_seconds)
+    missing = sorted(key for key in keys if key not in entries)
+    record_cache_lookup('weather', 'hit', len(entries) - len(stale))
+    record_cache_lookup('weather', 'stale', len(stale))
+    record_cache_lookup('weather', 'miss', len(missing))
+    if stale:
+        flight, leader = _join_flight(_batch_flight_key(stale))
+        if leader:
+            threading.Thread(target=_run_batch_flight, args=(stale, fetch_many, flight, False), daemon=True).start()
+
+    if missing:
+        flight, leader = _join_flight(_batch_flight_key(missing))
+        if leader:
+            _run_batch_flight(missing, fetch_many, flight, wait=True)
+        else:
+            flight.done.wait(getattr(settings, 'WEATHER_CACHE_LOCK_TIMEOUT', 30))
+        fetched = flight.payload or {}
+        for key in missing:
+            forecasts[key] = fetched.get(key) or {'success': False, 'error': 'Previsioni meteo non disponibili'}
+    return forecasts
+
+
+def refresh_forecast_in_background(key, fetch):
+    """Avvia l'aggiornamento di `key` in un thread, se non ce n'è già uno in corso"""
+    flight, leader = _join_flight(key)
+    if leader:
+        threading.Thread(target=_run_flight, args=(key, fetch, flight, False), daemon=True).start()
+
+
+def _join_flight(key):
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+
+def _run_flight(key, fetch, flight, wait):
+    cache = get_weather_cache()
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'WEATHER_CACHE_LOCK_TIMEOUT', 30)
+    try:
+        token = uuid.uuid4().hex
+        locked = cache.add(lock_key, token, lock_timeout)
+        if not locked:
+            # Un altro processo sta già leggendo questa chiave
+            if not wait:
+                return
+            flight.payload = _wait_for_forecast(cache, key, lock_timeout)
+            if flight.payload is not None:
+                return
+
+        try:
+            flight.payload = fetch()
+        except Exception:
+            logger.exception('Weather refresh failed for %s', key)
+        finally:
+            if locked:
+                release_cache_lock(cache, lock_key, token)
+
+        if flight.payload is not None and flight.payload.get('success'):
+            timeout = (
+                getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800)
+                + getattr(settings, 'WEATHER_CACHE_STALE_SECONDS', 6 * 3600)
+            )
+            cache.set(key, {'payload': flight.payload, 'fetched_at': time.time()}, timeout)
+            cache.set(f'{key}:last-good', flight.payload, LAST_GOOD_TIMEOUT)
+        elif wait:
+            last_good = cache.get(f'{key}:last-good')
+            if last_good is not None:
+                flight.payload = dict(last_good, stale=True)
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _batch_flight_key(keys):
+    return 'batch:' + ','.join(keys)
+
+
+def _run_batch_flight(keys, fetch_many, flight, wait):
+    cache = get_weather_cache()
+    try:
+        try:
+            flight.payload = fetch_many(keys)
+        except Exception:
+            logger.exception('Weather batch refresh failed for %d forecasts', len(keys))
+            flight.payload = {}
+
+        fetched_at = time.time()
+        succeeded = {key: payload for key, payload in flight.payload.items() if payload.get('success')}
+        if succeeded:
+            timeout = (
+                getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800)
+                + getattr(settings, 'WEATHER_CACHE_STALE_SECONDS', 6 * 3600)
+            )
+            cache.set_many({key: {'payload': payload, 'fetched_at': fetched_at} for key, payload in succeeded.items()}, timeout)
+            cache.set_many({f'{key}:last-good': payload for key, payload in succeeded.items()}, LAST_GOOD_TIMEOUT)
+
+        failed = [key for key in keys if key not in succeeded]
+        if wait and failed:
+            last_good = cache.get_many([f'{key}:last-good' for key in failed])
+            for key in failed:
+                if f'{key}:last-good' in last_good:
+                    flight.payload[key] = dict(last_good[f'{key}:last-good'], stale=True)
+    finally:
+        with _flights_lock:
+            _flights.pop(_batch_flight_key(keys), None)
+        flight.done.set()
+
+
+async def _arun_flight(cache, key, afetch):
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'WEATHER_CACHE_LOCK_TIMEOUT', 30)
+    payload = None
+    token = uuid.uuid4().hex
+    locked = await cache.aadd(lock_key, token, lock_timeout)
+    if not locked:
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry['payload']
+
+    try:
+        payload = await afetch()
+    except Exception:
+        logger.exception('Weather refresh failed for %s', key)
+    finally:
+        if locked:
+            await arelease_cache_lock(cache, lock_key, token)
+
+    if payload is not None and payload.get('success'):
+        timeout = (
+            getattr(settings, 'WEATHER_CACHE_FRESH_SECONDS', 1800)
+            + getattr(settings, 'WEATHER_CACHE_STALE_SECONDS', 6 * 3600)
+        )
+        await cache.aset(key, {'payload': payload, 'fetched_at': time.time()}, timeout)
+        await cache.aset(f'{key}:last-good', payload, LAST_GOOD_TIMEOUT)
+        return payload
+
+    last_good = await cache.aget(f'{key}:last-good')
+    if last_good is not None:
+        return dict(last_good, stale=True)
+    return payload
+
+
+def _wait_for_forecast(cache, key, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['payload']
+    return None
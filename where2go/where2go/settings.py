@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'where2go.middleware.MetricsMiddleware',
+    'where2go.middleware.ServerTimingMiddleware',
+    'where2go.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'where2go.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'where2go.urls'
@@ -78,6 +82,49 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep each worker thread's connection for CONN_MAX_AGE seconds,
+        # checking it is still usable before reusing it. Under ASGI requests
+        # hop between threads, so connections are closed after each request.
+        'CONN_MAX_AGE': int(os.environ.get(
+            'WHERE2GO_CONN_MAX_AGE', '0' if os.environ.get('WHERE2GO_ASYNC_VIEWS') == '1' else '60'
+        )),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when the transaction starts: a deferred
+            # transaction that reads and then writes fails with "database is
+            # locked" instead of waiting for busy_timeout.
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Tests run on a file rather than SQLite's shared in-memory database:
+        # the concurrency tests write from several threads, and the shared
+        # cache locks whole tables and fails at once instead of waiting.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Read replica: set WHERE2GO_REPLICA_DB to a copy of the database kept in
+# sync by `manage.py sync_replica` (see "Where2Go replica" below).
+REPLICA_DB = os.environ.get('WHERE2GO_REPLICA_DB')
+if REPLICA_DB:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': REPLICA_DB,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['where2go.services.replica.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; with several workers point it to a shared backend, e.g.
+#   WHERE2GO_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   WHERE2GO_CACHE_LOCATION=/var/tmp/where2go_cache
+# or django.core.cache.backends.redis.RedisCache with redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('WHERE2GO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('WHERE2GO_CACHE_LOCATION', 'where2go'),
     }
 }
 
@@ -123,4 +170,149 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Where2Go polls
+
+# How many food poll versions a client may lag behind and still receive
+# only the changed categories from /food-poll/data/?since=<version>;
+# older clients get a full snapshot.
+FOOD_POLL_DELTA_WINDOW = 500
+
+# Cache alias holding the serialized poll snapshots, keyed by poll version.
+POLL_CACHE_ALIAS = 'default'
+POLL_CACHE_TIMEOUT = 300
+
+# Seconds a request waits for another process that is already rebuilding
+# the same snapshot before building it itself.
+POLL_CACHE_LOCK_TIMEOUT = 5
+
+# Where2Go SQLite
+
+# PRAGMAs run on every new SQLite connection (services.sqlite_tuning), in
+# this order. busy_timeout (ms) makes writers wait for the lock instead of
+# failing, cache_size is in KiB when negative and mmap_size in bytes. Set
+# to {} to keep SQLite's defaults.
+# WAL lets readers run alongside the single writer, but journal_mode is
+# stored in the database file itself: it is only switched on with
+# WHERE2GO_SQLITE_WAL=1, so the db.sqlite3 tracked in git is left as it is.
+# Enable it for deployments and load tests, on a database that is not tracked.
+SQLITE_WAL = os.environ.get('WHERE2GO_SQLITE_WAL') == '1'
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    **({'journal_mode': 'WAL'} if SQLITE_WAL else {}),
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Where2Go vote queue
+
+# Write-behind food poll votes. With VOTE_QUEUE set, a vote is queued and
+# answered at once with the votes the user will have; a background thread
+# applies the queue every VOTE_QUEUE_FLUSH_MS (the maximum delay before a
+# vote is visible to others) in one transaction, keeping only the last
+# click of each user on each category, and bumps the poll version once.
+#  - '' (default): every vote is written by its own request;
+#  - 'memory': queued in the worker process. A crash loses the votes of the
+#    last VOTE_QUEUE_FLUSH_MS; a normal shutdown applies them;
+#  - 'cache': queued in the VOTE_QUEUE_CACHE_ALIAS cache. With a shared and
+#    persistent cache (Redis, files) queued votes survive a worker crash and
+#    are applied by any worker.
+# Past VOTE_QUEUE_MAX_PENDING queued votes, requests write synchronously.
+VOTE_QUEUE = os.environ.get('WHERE2GO_VOTE_QUEUE', '')
+VOTE_QUEUE_FLUSH_MS = int(os.environ.get('WHERE2GO_VOTE_QUEUE_FLUSH_MS', '250'))
+VOTE_QUEUE_MAX_PENDING = 10000
+VOTE_QUEUE_CACHE_ALIAS = 'default'
+
+# Where2Go replica
+
+# With a 'replica' database, the read-only views decorated with
+# use_read_replica (poll data, admin dashboard, statistics) read the
+# where2go models from it. The replica is used only if its last sync is at
+# most REPLICA_MAX_LAG_SECONDS old, and a client that wrote stays on the
+# primary for as long (cookie), so it always reads its own writes.
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('WHERE2GO_REPLICA_MAX_LAG', '5'))
+
+# Where2Go request timing
+
+# Add a Server-Timing header (db, upstream, view, total) to every response
+# and log requests slower than SERVER_TIMING_SLOW_MS or running at least
+# SERVER_TIMING_SLOW_QUERIES queries on the 'where2go.timing' logger.
+SERVER_TIMING = os.environ.get('WHERE2GO_SERVER_TIMING') == '1'
+SERVER_TIMING_SLOW_MS = 500
+SERVER_TIMING_SLOW_QUERIES = 30
+
+# Where2Go profiler
+
+# Off unless WHERE2GO_PROFILER=1. When on, staff users can profile any
+# request by adding ?profile (HTML report with a flame summary, top functions
+# and SQL) or ?profile=pstats (download the cProfile stats); the X-Profile
+# header works the same way.
+PROFILER = os.environ.get('WHERE2GO_PROFILER') == '1'
+
+# Where2Go metrics
+
+# Prometheus metrics at /metrics. Each worker process writes its counters to
+# a file in METRICS_DIR at most every METRICS_FLUSH_SECONDS and /metrics sums
+# them, so all workers must share the directory; clear it on each deploy.
+# Readable by staff users and by scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>"; with no token set, staff only.
+METRICS = os.environ.get('WHERE2GO_METRICS') == '1'
+METRICS_DIR = os.environ.get('WHERE2GO_METRICS_DIR')
+METRICS_FLUSH_SECONDS = 1
+METRICS_TOKEN = os.environ.get('WHERE2GO_METRICS_TOKEN')
+
+# Where2Go ASGI
+
+# Route the poll data and weather endpoints to the async views. asgi.py
+# turns this on; under WSGI the sync views stay in place.
+ASYNC_VIEWS = os.environ.get('WHERE2GO_ASYNC_VIEWS') == '1'
+
+# Where2Go restaurants
+
+# Side in degrees of the cells of the in-memory restaurant grid index
+# (0.01 is about 1.1 km north-south, 0.8 km east-west at 45°N).
+RESTAURANT_GRID_CELL_DEGREES = 0.01
+
+# Where2Go weather
+
+# Open-Meteo forecast endpoint; point it at a local stub
+# (manage.py weather_stub) to test without the real upstream.
+WEATHER_API_URL = os.environ.get('WHERE2GO_WEATHER_API_URL', 'https://api.open-meteo.com/v1/forecast')
+
+# Forecasts younger than WEATHER_CACHE_FRESH_SECONDS are served as they are;
+# for WEATHER_CACHE_STALE_SECONDS more they are still served while a
+# background thread refreshes them.
+WEATHER_CACHE_ALIAS = 'default'
+WEATHER_CACHE_FRESH_SECONDS = 30 * 60
+WEATHER_CACHE_STALE_SECONDS = 6 * 60 * 60
+
+# Venue forecasts (/weather/venues/): restaurants are grouped on a grid of
+# WEATHER_GRID_DEGREES (0.1 is about 11 km, close to Open-Meteo's own
+# resolution) and fetched with up to WEATHER_BATCH_SIZE coordinates per
+# upstream request.
+WEATHER_GRID_DEGREES = 0.1
+WEATHER_BATCH_SIZE = 100
+
+# Shared upstream HTTP clients (services.upstream): pooled keep-alive
+# connections, separate connect/read timeouts, retries with jittered
+# backoff and a circuit breaker that fails fast after repeated errors.
+UPSTREAM_CONNECT_TIMEOUT = 3.05
+UPSTREAM_READ_TIMEOUT = 5
+UPSTREAM_RETRIES = 2
+UPSTREAM_BACKOFF = 0.2
+UPSTREAM_BREAKER_THRESHOLD = 5
+UPSTREAM_BREAKER_RESET_SECONDS = 30
+UPSTREAM_POOL_SIZE = 10
+
+# Seconds a request waits for the upstream call already in flight for the
+# same forecast before giving up, and lifetime of the cache lock that keeps
+# other processes from repeating that call. It must outlast the client's
+# worst case (every attempt timing out plus the longest backoffs), or the
+# lock expires during a slow outage and another process fetches again.
+WEATHER_CACHE_LOCK_TIMEOUT = int(
+    (UPSTREAM_CONNECT_TIMEOUT + UPSTREAM_READ_TIMEOUT) * (UPSTREAM_RETRIES + 1)
+    + UPSTREAM_BACKOFF * 2 ** (UPSTREAM_RETRIES + 1)
+) + 5
@@ -0,0 +1,178 @@
+"""
+Query budgets of every named URL and how to call each one, shared by the
+query-budget tests (test_query_budgets) and the timing report of
+`manage.py check_query_budget`.
+"""
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+
+from where2go.models import Categories, FoodPoll, Restaurants, Reviews
+from where2go.views.test_views import ADMIN_SECTIONS
+from where2go.views.weather_views import LAT, LON
+
+# Maximum SQL queries per URL name, measured with every cache missing (DummyCache).
+# Every named URL in where2go/urls.py must be listed here: a new endpoint fails
+# the tests until it gets a budget. "name:variant" keys budget one URL called in
+# several ways, e.g. each admin dashboard section, on its first and a later page.
+QUERY_BUDGETS = {
+    'auth': 0,
+    'logout': 4,
+    'dashboard': 9,
+    'dashboard_state': 9,
+    'food_poll_vote': 16,
+    'food_poll_data': 6,
+    'presence_poll_vote': 16,
+    'presence_poll_data': 6,
+    'poll_stream': 2,
+    'weather_data': 2,
+    'venue_weather': 4,
+    'restaurants_nearby': 4,
+    'metrics': 2,  # 0 while METRICS is off (404 before any lookup), 2 for the session and user when on
+    'test_view': 0,  # same page shell as admin_dashboard
+    'admin_dashboard': 0,  # page shell only: the data comes from admin_dashboard_stats and admin_section
+    'admin_dashboard_stats': 6,
+    **{f'admin_section:{section}': 1 for section in ADMIN_SECTIONS},
+    **{f'admin_section:{section}:after': 1 for section in ADMIN_SECTIONS},
+    'add_category': 4,
+    'delete_category': 9,
+    'add_restaurant': 4,
+    'delete_restaurant': 6,
+    'add_user': 1,
+    'delete_user': 22,
+    'delete_review': 4,
+    'clear_all_polls': 9,
+    'get_statistics': 5,
+}
+
+# Endpoints timed by check_query_budget: the ones the dashboard hits every second or on every vote
+HOT_ENDPOINTS = ('food_poll_data', 'presence_poll_data', 'dashboard_state', 'food_poll_vote', 'presence_poll_vote', 'weather_data')
+
+
+def url_name(endpoint):
+    """URL name of a budget key ('admin_section:users:after' is a page of admin_section)"""
+    return endpoint.split(':')[0]
+
+
+def section_cursor(section):
+    """The "next" of a section's first page if it held a single row: ?after= with it asks for a later page"""
+    rows_for, newest_first = ADMIN_SECTIONS[section]
+    return rows_for({}).order_by('-id' if newest_first else 'id').values_list('id', flat=True).first()
+
+
+def endpoint_requests(fixtures):
+    """How to call each budget key: (method, reverse kwargs, query or form data, JSON body, anonymous, mutates)"""
+    sections = {}
+    for section in ADMIN_SECTIONS:
+        sections[f'admin_section:{section}'] = ('get', {'section': section}, {'limit': 50}, None, False, False)
+        sections[f'admin_section:{section}:after'] = (
+            'get', {'section': section}, {'limit': 50, 'after': section_cursor(section)}, None, False, False,
+        )
+    return {
+        **sections,
+        'auth': ('get', {}, None, None, True, False),
+        'logout': ('get', {}, None, None, False, False),
+        'dashboard': ('get', {}, None, None, False, False),
+        'dashboard_state': ('get', {}, None, None, False, False),
+        'food_poll_vote': ('post', {}, None, {'category_id': fixtures['category']}, False, True),
+        'food_poll_data': ('get', {}, None, None, False, False),
+        'presence_poll_vote': ('post', {}, None, {'presence_value': 'present'}, False, True),
+        'presence_poll_data': ('get', {}, None, None, False, False),
+        'poll_stream': ('get', {}, None, None, False, False),
+        'weather_data': ('get', {}, None, None, False, False),
+        'venue_weather': ('get', {}, None, None, False, False),
+        'restaurants_nearby': ('get', {}, {'lat': LAT, 'lon': LON, 'limit': 20}, None, False, False),
+        'metrics': ('get', {}, None, None, False, False),
+        'test_view': ('get', {}, None, None, False, False),
+        'admin_dashboard': ('get', {}, None, None, False, False),
+        'admin_dashboard_stats': ('get', {}, None, None, False, False),
+        'add_category': ('post', {}, {'category_name': 'Budget category'}, None, False, True),
+        'delete_category': ('post', {'category_id': fixtures['empty_category']}, None, None, False, True),
+        'add_restaurant': ('post', {}, {
+            'restaurant_name': 'Budget restaurant', 'restaurant_category': fixtures['category'],
+            'restaurant_latitude': LAT, 'restaurant_longitude': LON,
+        }, None, False, True),
+        'delete_restaurant': ('post', {'restaurant_id': fixtures['restaurant']}, None, None, False, True),
+        'add_user': ('post', {}, {'username': 'budget_new_user', 'password': 'budget-password'}, None, False, True),
+        'delete_user': ('post', {'user_id': fixtures['voter']}, None, None, False, True),
+        'delete_review': ('post', {'review_id': fixtures['review']}, None, None, False, True),
+        'clear_all_polls': ('post', {}, None, None, False, True),
+        'get_statistics': ('get', {}, None, None, False, False),
+    }
+
+
+def url_names():
+    return [
+        pattern.name for pattern in get_resolver().url_patterns
+        if isinstance(pattern, URLPattern) and pattern.name
+    ]
+
+
+def unbudgeted_url_names():
+    budgeted = {url_name(endpoint) for endpoint in QUERY_BUDGETS}
+    return sorted(set(url_names()) - budgeted)
+
+
+def seed_dataset(voters, prefix='budget_'):
+    """Seeds `voters` voters with seed_data (sized after them) and returns the ids the requests need"""
+    call_command(
+        'seed_data', seed=voters, users=voters, categories=max(5, voters // 20), restaurants=max(5, voters // 2),
+        reviews=voters, prefix=prefix, stdout=io.StringIO(),
+    )
+    # The delete views refuse categories with restaurants and restaurants with reviews:
+    # empty ones make sure the deletion itself is measured at every size
+    empty_category = Categories.objects.create(name=f'{prefix}empty')
+    empty_restaurant = Restaurants.objects.create(name=f'{prefix}empty', category=empty_category)
+    return {
+        'staff': User.objects.create(username=f'{prefix}staff', is_staff=True),
+        'category': Categories.objects.order_by('id').values_list('id', flat=True).first(),
+        'empty_category': Categories.objects.create(name=f'{prefix}empty_2').id,
+        'restaurant': empty_restaurant.id,
+        'voter': FoodPoll.objects.order_by('user_id').values_list('user_id', flat=True).first(),
+        'review': Reviews.objects.order_by('id').values_list('id', flat=True).first(),
+    }
+
+
+def client_for(staff, anonymous):
+    # Logged in before the capture starts: force_login's queries are not part of the request
+    client = Client()
+    if not anonymous:
+        client.force_login(staff)
+    return client
+
+
+def send(client, method, path, data, body):
+    if body is not None:
+        response = client.post(path, json.dumps(body), content_type='application/json')
+    elif method == 'post':
+        response = client.post(path, data or {})
+    else:
+        response = client.get(path, data or {})
+    # Not closed here: closing fires request_finished, whose close_old_connections would drop
+    # the connection in the middle of the test transaction (the client closes plain responses)
+    return response
+
+
+def measure_queries(fixtures, names=None):
+    """{budget key: queries of one request}; mutating requests are rolled back, so each sees the same data"""
+    requests = endpoint_requests(fixtures)
+    queries = {}
+    for name in names or QUERY_BUDGETS:
+        method, kwargs, data, body, anonymous, mutates = requests[name]
+        path = reverse(url_name(name), kwargs=kwargs)
+        with transaction.atomic():
+            if not mutates:
+                # Warm-up: per-process state such as the restaurant index is built here
+                send(client_for(fixtures['staff'], anonymous), method, path, data, body)
+            client = client_for(fixtures['staff'], anonymous)
+            with CaptureQueriesContext(connection) as captured:
+                send(client, method, path, data, body)
+            transaction.set_rollback(True)
+        queries[name] = len(captured.captured_queries)
+    return queries
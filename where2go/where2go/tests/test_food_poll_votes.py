@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from where2go.models import Categories, FoodPoll, FoodPollTally
+from where2go.services import (
+    apply_food_poll_votes, find_food_poll_tally_mismatches, poll_votes, toggle_food_poll_vote,
+)
+
+
+class ConcurrentFoodPollToggleTests(TransactionTestCase):
+    """Parallel vote toggles (simulated double-clicks) on a real, committed test database"""
+
+    users_count = 5
+    toggles = 20
+    threads = 8
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'stress_voter_{index}') for index in range(self.users_count)]
+        self.category = Categories.objects.create(name='Stress test')
+
+    def test_parallel_toggles_keep_votes_unique_and_tally_in_sync(self):
+        applied = {user.pk: 0 for user in self.users}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def toggle(user):
+            try:
+                try:
+                    barrier.wait(timeout=1)
+                except threading.BrokenBarrierError:
+                    pass
+                delta = toggle_food_poll_vote(user, self.category.id)
+                with lock:
+                    applied[user.pk] += delta
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for _ in range(self.toggles):
+                for user in self.users:
+                    executor.submit(toggle, user)
+
+        self.assertEqual(errors, [])
+        votes = list(FoodPoll.objects.filter(category=self.category).values_list('user_id', flat=True))
+        self.assertEqual(len(votes), len(set(votes)), 'duplicate votes')
+        tally = FoodPollTally.objects.filter(category=self.category).values_list('votes', flat=True).first() or 0
+        self.assertEqual(tally, len(votes))
+        for user in self.users:
+            # The applied deltas add up to the final state of each user (0 or 1 votes)
+            self.assertEqual(votes.count(user.pk), applied[user.pk], user.username)
+        self.assertEqual(find_food_poll_tally_mismatches(), {})
+
+
+class ApplyFoodPollVotesTests(TestCase):
+    """Flushes of the write-behind queue racing with a synchronous toggle of the same rows"""
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'batch_voter_{index}') for index in range(3)]
+        self.category = Categories.objects.create(name='Batch test')
+
+    def tally(self):
+        return FoodPollTally.objects.filter(category=self.category).values_list('votes', flat=True).first() or 0
+
+    def test_row_inserted_after_the_read_is_not_counted_twice(self):
+        insert = poll_votes._insert_food_poll_votes
+
+        def toggled_first(pairs):
+            # A synchronous toggle adds one of the batch's votes between the read and the insert
+            toggle_food_poll_vote(self.users[0], self.category.id)
+            return insert(pairs)
+
+        with mock.patch.object(poll_votes, '_insert_food_poll_votes', side_effect=toggled_first):
+            changed = apply_food_poll_votes({(user.pk, self.category.id): True for user in self.users})
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(FoodPoll.objects.filter(category=self.category).count(), 3)
+        self.assertEqual(self.tally(), 3)
+        self.assertEqual(find_food_poll_tally_mismatches(), {})
+
+    def test_row_deleted_after_the_read_is_not_counted_twice(self):
+        for user in self.users:
+            toggle_food_poll_vote(user, self.category.id)
+        delete = poll_votes._delete_food_poll_votes
+
+        def toggled_first(pairs):
+            # A synchronous toggle removes one of the batch's votes between the read and the delete
+            toggle_food_poll_vote(self.users[0], self.category.id)
+            return delete(pairs)
+
+        with mock.patch.object(poll_votes, '_delete_food_poll_votes', side_effect=toggled_first):
+            changed = apply_food_poll_votes({(user.pk, self.category.id): False for user in self.users})
+
+        self.assertEqual(changed, 2)
+        self.assertFalse(FoodPoll.objects.filter(category=self.category).exists())
+        self.assertEqual(self.tally(), 0)
+        self.assertEqual(find_food_poll_tally_mismatches(), {})
@@ -0,0 +1,34 @@
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+class MetricsAccessTests(TestCase):
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        settings_override = override_settings(METRICS=True, METRICS_DIR=metrics_dir.name, METRICS_TOKEN='scrape-secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse('metrics')
+
+    def test_loopback_address_alone_is_refused(self):
+        # Behind a same-host reverse proxy every client comes from 127.0.0.1
+        response = self.client.get(self.url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bearer_token_is_accepted(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_staff_user_is_accepted(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_no_token_configured_refuses_any_bearer(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from where2go.services.poll_cache import get_or_build
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'poll-cache-tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES, POLL_CACHE_ALIAS='default')
+class GetOrBuildTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        self.builds = 0
+
+    def slow_builder(self):
+        self.builds += 1
+        time.sleep(0.2)
+        return 'snapshot'
+
+    def test_concurrent_misses_build_once(self):
+        threads = [threading.Thread(target=get_or_build, args=('poll:1', self.slow_builder)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.cache.get('poll:1'), 'snapshot')
+        self.assertIsNone(self.cache.get('poll:1:lock'))
+
+    @override_settings(POLL_CACHE_LOCK_TIMEOUT=0.1)
+    def test_lock_wait_timeout_keeps_the_other_workers_lock(self):
+        # Another worker holds the build lock and never stores the value
+        self.cache.add('poll:2:lock', 'other-worker', 30)
+
+        self.assertEqual(get_or_build('poll:2', self.slow_builder), 'snapshot')
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.cache.get('poll:2:lock'), 'other-worker')
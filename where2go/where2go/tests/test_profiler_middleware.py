@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+@override_settings(PROFILER=True)
+class ProfilerMiddlewareAsyncTests(TestCase):
+    """?profile through the async middleware stack (ASGI), where request.user cannot be read synchronously"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='voter')
+        cls.staff = User.objects.create(username='staff', is_staff=True)
+
+    async def test_non_staff_profile_request_is_served_normally(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('food_poll_data'), {'profile': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    async def test_anonymous_profile_request_is_not_profiled(self):
+        response = await self.async_client.get(reverse('food_poll_data'), {'profile': 'pstats'})
+        self.assertNotIn('Content-Disposition', response)
+
+    async def test_staff_profile_request_gets_the_report(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('food_poll_data'), {'profile': 'pstats'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+    @override_settings(PROFILER=False)
+    async def test_disabled_profiler_ignores_staff_requests(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('food_poll_data'), {'profile': 'pstats'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Disposition', response)
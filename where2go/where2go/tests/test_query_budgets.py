@@ -0,0 +1,59 @@
+import logging
+import threading
+
+from django.test import TestCase, override_settings
+
+from where2go.management.commands.weather_stub import make_stub_server
+
+from .query_budgets import QUERY_BUDGETS, endpoint_requests, measure_queries, seed_dataset, unbudgeted_url_names
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every named URL against its query budget, with every cache lookup missing
+    (the worst case, independent of test order) and Open-Meteo replaced by the
+    local weather stub. The counts must not grow with the size of the data.
+    """
+
+    voters = 10
+    grown_voters = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = make_stub_server('127.0.0.1', 0)
+        threading.Thread(target=cls.stub.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.stub.shutdown)
+        cls.enterClassContext(override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+            WEATHER_API_URL=f'http://127.0.0.1:{cls.stub.server_address[1]}/v1/forecast',
+            # Votes are budgeted on the synchronous write path, not on the write-behind queue
+            VOTE_QUEUE='',
+        ))
+        # Expected 4xx answers (e.g. /metrics when disabled) would otherwise be logged for every call
+        request_logger = logging.getLogger('django.request')
+        cls.addClassCleanup(request_logger.setLevel, request_logger.level)
+        request_logger.setLevel(logging.CRITICAL)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = seed_dataset(cls.voters)
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(unbudgeted_url_names(), [])
+
+    def test_every_budget_has_a_request(self):
+        self.assertEqual(set(endpoint_requests(self.fixtures)), set(QUERY_BUDGETS))
+
+    def test_endpoints_stay_within_their_budget(self):
+        for name, count in measure_queries(self.fixtures).items():
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(count, QUERY_BUDGETS[name])
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small = measure_queries(self.fixtures)
+        seed_dataset(self.grown_voters - self.voters, prefix='budget_more_')
+        grown = measure_queries(self.fixtures)
+        for name, count in small.items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(grown[name], count, f'{self.voters} vs {self.grown_voters} voters')
@@ -0,0 +1,39 @@
+from django.contrib.auth import login
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, TestCase, override_settings
+
+from where2go.models import Categories
+from where2go.services import start_replica_routing, stop_replica_routing
+
+
+@override_settings(DATABASE_ROUTERS=['where2go.services.replica.ReplicaRouter'])
+class PrimaryPinningTests(TestCase):
+    """Only writes to data the replica serves keep the client on the primary"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='replica_voter')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.state, token = start_replica_routing(self.request)
+        self.addCleanup(stop_replica_routing, token)
+
+    def test_login_and_session_writes_do_not_pin(self):
+        self.request.session = SessionStore()
+        login(self.request, self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.request.session.save()
+        self.assertFalse(self.state.wrote)
+
+    def test_app_writes_pin(self):
+        Categories.objects.create(name='Replica test')
+        self.assertTrue(self.state.wrote)
+
+    def test_user_changes_pin(self):
+        User.objects.create(username='replica_new_user')
+        self.assertTrue(self.state.wrote)
+
+    def test_user_deletion_pins(self):
+        self.user.delete()
+        self.assertTrue(self.state.wrote)
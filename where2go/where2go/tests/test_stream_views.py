@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'stream-views-tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES, VOTE_QUEUE='')
+class PollStreamAvailabilityTests(TestCase):
+    """The dashboard only opens the SSE stream when the server can serve it (ASGI)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='stream_viewer')
+
+    def test_wsgi_dashboard_does_not_offer_the_stream(self):
+        self.client.force_login(self.user)
+        self.assertIs(self.client.get('/dashboard/').context['dashboard_state']['stream'], False)
+        self.assertEqual(self.client.get('/polls/stream/').status_code, 503)
+
+    async def test_asgi_dashboard_offers_the_stream(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/dashboard/')
+        self.assertIs(response.context['dashboard_state']['stream'], True)
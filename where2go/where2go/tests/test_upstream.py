@@ -0,0 +1,57 @@
+import asyncio
+import time
+from unittest import mock, skipIf
+
+import requests
+from django.test import SimpleTestCase
+
+from where2go.services import upstream
+from where2go.services.upstream import UpstreamClient, UpstreamUnavailable
+
+
+class HalfOpenProbeTests(SimpleTestCase):
+    """A probe that ends with an unexpected exception must not leave the breaker stuck in half-open"""
+
+    reset_seconds = 0.05
+
+    def make_client(self):
+        return UpstreamClient('test', retries=0, breaker_threshold=1, breaker_reset_seconds=self.reset_seconds)
+
+    def open_and_wait(self, client):
+        client.breaker.record_failure()
+        self.assertEqual(client.breaker.state, 'open')
+        time.sleep(self.reset_seconds * 2)
+        self.assertEqual(client.breaker.state, 'half-open')
+
+    def test_probe_raising_a_non_network_error_lets_the_breaker_close(self):
+        client = self.make_client()
+        self.open_and_wait(client)
+        ok = mock.Mock(status_code=200)
+        with mock.patch.object(client.session, 'get', side_effect=[requests.exceptions.ChunkedEncodingError(), ok]):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                client.get('http://upstream.invalid/')
+            # Without the fix this call got UpstreamUnavailable until the process restarted
+            self.assertIs(client.get('http://upstream.invalid/'), ok)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    @skipIf(upstream.httpx is None, 'httpx is not installed')
+    def test_cancelled_async_probe_lets_the_breaker_close(self):
+        client = self.make_client()
+        self.open_and_wait(client)
+
+        async def probe():
+            async_client = mock.Mock()
+            async_client.get = mock.AsyncMock(side_effect=[asyncio.CancelledError(), mock.Mock(status_code=200)])
+            with mock.patch.object(client, 'get_async_client', return_value=async_client):
+                with self.assertRaises(asyncio.CancelledError):
+                    await client.aget('http://upstream.invalid/')
+                await client.aget('http://upstream.invalid/')
+
+        asyncio.run(probe())
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_open_breaker_still_fails_fast(self):
+        client = self.make_client()
+        client.breaker.record_failure()
+        with self.assertRaises(UpstreamUnavailable):
+            client.get('http://upstream.invalid/')
@@ -0,0 +1,119 @@
+import json
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from where2go.models import Categories, FoodPoll
+from where2go.services import flush_vote_queue, get_vote_flusher, queue_food_poll_toggle, vote_queue
+from where2go.views.stream_views import build_food_event
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'vote-queue-tests'}}
+
+
+class VoteQueueTestMixin:
+    """A fresh queue per test, flushed by hand: no background thread writes to the test database"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(vote_queue.VoteFlusher, 'ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        vote_queue._flusher = None
+        self.addCleanup(setattr, vote_queue, '_flusher', None)
+
+
+@override_settings(VOTE_QUEUE='memory', CACHES=TEST_CACHES)
+class MemoryVoteQueueTests(VoteQueueTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='voter')
+        cls.pizza = Categories.objects.create(name='Pizza')
+        cls.sushi = Categories.objects.create(name='Sushi')
+
+    def test_double_click_nets_to_no_change(self):
+        self.assertEqual(queue_food_poll_toggle(self.user, self.pizza.id), [self.pizza.id])
+        self.assertEqual(queue_food_poll_toggle(self.user, self.pizza.id), [])
+        flush_vote_queue()
+        self.assertFalse(FoodPoll.objects.filter(user=self.user).exists())
+
+    def test_queued_vote_is_read_back_before_the_flush(self):
+        self.client.force_login(self.user)
+        before = self.client.get(reverse('food_poll_data'))
+        queue_food_poll_toggle(self.user, self.sushi.id)
+
+        after = self.client.get(reverse('food_poll_data'), HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()['user_votes'], [self.sushi.id])
+        state = self.client.get(reverse('dashboard_state'), {'sections': 'food'}).json()
+        self.assertEqual(state['food']['user_votes'], [self.sushi.id])
+        self.assertEqual(json.loads(build_food_event(self.user))['user_votes'], [self.sushi.id])
+        self.assertFalse(FoodPoll.objects.filter(user=self.user).exists())
+
+        flush_vote_queue()
+        self.assertTrue(FoodPoll.objects.filter(user=self.user, category=self.sushi).exists())
+        self.assertEqual(self.client.get(reverse('food_poll_data')).json()['user_votes'], [self.sushi.id])
+
+
+@override_settings(VOTE_QUEUE='cache', VOTE_QUEUE_CACHE_ALIAS='default', CACHES=TEST_CACHES)
+class CacheVoteQueueTests(VoteQueueTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='voter')
+        cls.pizza = Categories.objects.create(name='Pizza')
+
+    def setUp(self):
+        super().setUp()
+        get_vote_flusher().queue.cache.clear()
+
+    def test_double_click_nets_to_no_change(self):
+        queue_food_poll_toggle(self.user, self.pizza.id)
+        queue_food_poll_toggle(self.user, self.pizza.id)
+        self.assertEqual(get_vote_flusher().queue.pending_for(self.user.pk), {self.pizza.id: False})
+        flush_vote_queue()
+        self.assertFalse(FoodPoll.objects.filter(user=self.user).exists())
+
+
+class ConcurrentQueuedTogglesTests(VoteQueueTestMixin, TransactionTestCase):
+    """Clicks of the same user arriving together: each must see the intentions queued before it"""
+
+    clicks = 20
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='voter')
+        self.category = Categories.objects.create(name='Pizza')
+
+    def toggle_concurrently(self):
+        barrier = threading.Barrier(self.clicks)
+        errors = []
+
+        def click():
+            try:
+                barrier.wait(timeout=5)
+                queue_food_poll_toggle(self.user, self.category.id)
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click) for _ in range(self.clicks)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    @override_settings(VOTE_QUEUE='memory', CACHES=TEST_CACHES)
+    def test_memory_queue(self):
+        self.toggle_concurrently()
+        self.assertEqual(get_vote_flusher().queue.pending_for(self.user.pk), {self.category.id: False})
+
+    @override_settings(VOTE_QUEUE='cache', VOTE_QUEUE_CACHE_ALIAS='default', CACHES=TEST_CACHES)
+    def test_cache_queue(self):
+        get_vote_flusher().queue.cache.clear()
+        self.toggle_concurrently()
+        self.assertEqual(get_vote_flusher().queue.pending_for(self.user.pk), {self.category.id: False})
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from where2go.services import weather_cache_key
+from where2go.views.weather_views import LAT, LON, aget_weather_payload, get_next_friday, get_weather_payload
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'weather-cache-tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_ALIAS='default', WEATHER_CACHE_FRESH_SECONDS=1800)
+class WeatherCacheTests(SimpleTestCase):
+    """The Open-Meteo fetch is replaced by a stub: no test reaches the real upstream"""
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        self.key = weather_cache_key(LAT, LON, get_next_friday().strftime('%Y-%m-%d'))
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def stub_fetch(self, lat, lon, friday_date):
+        with self.calls_lock:
+            self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {'success': True, 'temperature': [21]}
+
+    def patch_upstream(self):
+        return mock.patch('where2go.views.weather_views.fetch_weather_payload', side_effect=self.stub_fetch)
+
+    def test_concurrent_misses_make_one_upstream_call(self):
+        results = []
+        with self.patch_upstream():
+            threads = [threading.Thread(target=lambda: results.append(get_weather_payload())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(self.started.wait(5))
+            # Let the other requests join the flight before the fetch returns
+            time.sleep(0.1)
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'success': True, 'temperature': [21]}] * 8)
+
+    def test_stale_forecast_is_served_while_refreshing(self):
+        stale = {'success': True, 'temperature': [15]}
+        self.cache.set(self.key, {'payload': stale, 'fetched_at': time.time() - 1801}, 3600)
+
+        with self.patch_upstream():
+            # The refresh is blocked upstream: both requests get the stale copy at once
+            self.assertEqual(get_weather_payload(), stale)
+            self.assertTrue(self.started.wait(5))
+            self.assertEqual(get_weather_payload(), stale)
+
+            self.release.set()
+            deadline = time.monotonic() + 5
+            while self.cache.get(self.key)['payload'] == stale and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(get_weather_payload(), {'success': True, 'temperature': [21]})
+
+    def take_over_lock(self):
+        # The fetch outlived the lock: another process took it over in the meantime
+        self.cache.set(f'{self.key}:lock', 'other-process', 60)
+        return {'success': True, 'temperature': [21]}
+
+    def test_expired_lock_taken_by_another_process_is_kept(self):
+        with mock.patch('where2go.views.weather_views.fetch_weather_payload', side_effect=lambda *args: self.take_over_lock()):
+            get_weather_payload()
+        self.assertEqual(self.cache.get(f'{self.key}:lock'), 'other-process')
+
+    def test_expired_lock_taken_by_another_process_is_kept_async(self):
+        async def afetch(*args):
+            return self.take_over_lock()
+
+        with mock.patch('where2go.views.weather_views.afetch_weather_payload', side_effect=afetch):
+            asyncio.run(aget_weather_payload())
+        self.assertEqual(self.cache.get(f'{self.key}:lock'), 'other-process')
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_ALIAS='default', VOTE_QUEUE='')
+class DashboardWeatherTests(TestCase):
+    """The dashboard embeds the forecast only when it is cached; a miss is left to the client's /weather call"""
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        self.key = weather_cache_key(LAT, LON, get_next_friday().strftime('%Y-%m-%d'))
+        self.client.force_login(User.objects.create(username='weather_viewer'))
+
+    def test_cold_cache_renders_without_calling_upstream(self):
+        with mock.patch('where2go.views.weather_views.fetch_weather_payload') as fetch:
+            response = self.client.get(reverse('dashboard'))
+        fetch.assert_not_called()
+        self.assertIsNone(response.context['dashboard_state']['weather'])
+
+    def test_cached_forecast_is_embedded(self):
+        forecast = {'success': True, 'temperature': [21]}
+        self.cache.set(self.key, {'payload': forecast, 'fetched_at': time.time()}, 3600)
+        with mock.patch('where2go.views.weather_views.fetch_weather_payload') as fetch:
+            response = self.client.get(reverse('dashboard'))
+        fetch.assert_not_called()
+        self.assertEqual(response.context['dashboard_state']['weather'], forecast)
+
+
+@override_settings(CACHES=TEST_CACHES, WEATHER_CACHE_ALIAS='default')
+class WeatherEtagTests(TestCase):
+    """The /weather ETag follows the cached forecast, and error answers never get a 304"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.key = weather_cache_key(LAT, LON, get_next_friday().strftime('%Y-%m-%d'))
+        self.client.force_login(User.objects.create(username='weather_etag_viewer'))
+
+    def cache_forecast(self, temperature):
+        caches['default'].set(self.key, {'payload': {'success': True, 'temperature': [temperature]}, 'fetched_at': time.time()}, 3600)
+
+    def test_etag_changes_with_the_forecast(self):
+        self.cache_forecast(21)
+        etag = self.client.get(reverse('weather_data'))['ETag']
+        self.assertEqual(self.client.get(reverse('weather_data'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.cache_forecast(15)
+        response = self.client.get(reverse('weather_data'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_error_answers_are_never_conditional(self):
+        error = {'success': False, 'error': 'Timeout'}
+        with mock.patch('where2go.views.weather_views.fetch_weather_payload', return_value=error):
+            first = self.client.get(reverse('weather_data'))
+            self.assertNotIn('ETag', first)
+            second = self.client.get(reverse('weather_data'), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), error)
@@ -14,17 +14,32 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from .views.views import dashboard, food_poll_vote_ajax, food_poll_data_ajax, presence_poll_vote_ajax, presence_poll_data_ajax
+from .views.views import dashboard, dashboard_state_ajax, food_poll_vote_ajax, food_poll_data_ajax, presence_poll_vote_ajax, presence_poll_data_ajax
 from .views.auth_views import auth_view, logout_view
-from .views.weather_views import get_weather_data
+from .views.weather_views import get_weather_data, get_venue_weather
+from .views.stream_views import poll_stream
+from .views.restaurant_views import restaurants_nearby
+from .views.metrics_views import metrics
+from .views.async_views import food_poll_data_async, presence_poll_data_async, get_weather_data_async
 from .views.test_views import (
-    admin_dashboard, test_view, add_category, delete_category,
+    admin_dashboard, admin_dashboard_stats, admin_section_data, test_view, add_category, delete_category,
     add_restaurant, delete_restaurant, add_user, delete_user,
     delete_review, clear_all_polls, get_statistics
 )
 
+# Under ASGI (asgi.py sets WHERE2GO_ASYNC_VIEWS) the read endpoints use the async views
+if settings.ASYNC_VIEWS:
+    food_poll_data_view, presence_poll_data_view, weather_data_view = (
+        food_poll_data_async, presence_poll_data_async, get_weather_data_async
+    )
+else:
+    food_poll_data_view, presence_poll_data_view, weather_data_view = (
+        food_poll_data_ajax, presence_poll_data_ajax, get_weather_data
+    )
+
 urlpatterns = [
     # Authenticated user URLs
     path('', auth_view, name='auth'),
@@ -32,16 +47,23 @@ urlpatterns = [
 
     # Main application URLs
     path('dashboard/', dashboard, name='dashboard'),
+    path('dashboard/state/', dashboard_state_ajax, name='dashboard_state'),
     path('food-poll/vote/', food_poll_vote_ajax, name='food_poll_vote'),
-    path('food-poll/data/', food_poll_data_ajax, name='food_poll_data'),
+    path('food-poll/data/', food_poll_data_view, name='food_poll_data'),
     path('presence-poll/vote/', presence_poll_vote_ajax, name='presence_poll_vote'),
-    path('presence-poll/data/', presence_poll_data_ajax, name='presence_poll_data'),
-    path('weather/data/', get_weather_data, name='weather_data'),
+    path('presence-poll/data/', presence_poll_data_view, name='presence_poll_data'),
+    path('polls/stream/', poll_stream, name='poll_stream'),
+    path('weather/data/', weather_data_view, name='weather_data'),
+    path('weather/venues/', get_venue_weather, name='venue_weather'),
+    path('restaurants/nearby/', restaurants_nearby, name='restaurants_nearby'),
+    path('metrics', metrics, name='metrics'),
 
 
     # Test and admin URLs
     path('test/', test_view, name='test_view'),
     path('admin-dashboard/', admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/stats/', admin_dashboard_stats, name='admin_dashboard_stats'),
+    path('admin-dashboard/sections/<str:section>/', admin_section_data, name='admin_section'),
     path('add-category/', add_category, name='add_category'),
     path('delete-category/<int:category_id>/', delete_category, name='delete_category'),
     path('add-restaurant/', add_restaurant, name='add_restaurant'),
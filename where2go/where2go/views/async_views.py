@@ -0,0 +1,98 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+
+from ..services import (
+    aget_poll_version, aget_changed_food_categories, aget_user_food_votes_with_pending, aget_user_presence_vote,
+    pending_food_votes, pending_food_votes_token,
+    aget_food_poll_data_json, aget_presence_poll_data_json,
+    aget_food_poll_compact_json, aget_presence_poll_compact_json, use_read_replica,
+)
+from .views import (
+    wants_compact_format, poll_etag, parse_since,
+    food_poll_response, food_poll_compact_response, presence_poll_response, presence_poll_compact_response,
+)
+from .weather_views import aget_weather_payload, weather_response
+
+# Versioni asincrone delle viste di lettura, usate sotto ASGI (vedi urls.py):
+# le attese su database e Open-Meteo non occupano un thread per richiesta.
+# condition() chiamerebbe la funzione ETag in modo sincrono, quindi le richieste
+# condizionali vengono gestite qui (e in weather_response) con get_conditional_response.
+
+
+@use_read_replica
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+async def food_poll_data_async(request):
+    """Come food_poll_data_ajax, con l'ORM asincrono"""
+    if request.method == 'GET':
+        user = await request.auser()
+        # I voti in coda non cambiano la versione: fanno parte dell'ETag e vanno letti prima del database
+        pending = await sync_to_async(pending_food_votes)(user.pk)
+        version = await aget_poll_version('food')
+        etag = quote_etag(poll_etag(
+            'food', version, user.pk, wants_compact_format(request), pending_food_votes_token(pending)
+        ))
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+
+        changed = None
+        try:
+            since = parse_since(request)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Versione non valida'})
+        if since is not None:
+            changed = await aget_changed_food_categories(since, version)
+
+        user_votes = await aget_user_food_votes_with_pending(user, pending)
+        if wants_compact_format(request):
+            snapshot = await aget_food_poll_compact_json(version)
+            response = food_poll_compact_response(request, snapshot, version, changed, user_votes)
+        else:
+            response = food_poll_response(await aget_food_poll_data_json(version), version, changed, user_votes)
+        response['ETag'] = etag
+        return response
+
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+
+@use_read_replica
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+async def presence_poll_data_async(request):
+    """Come presence_poll_data_ajax, con l'ORM asincrono"""
+    if request.method == 'GET':
+        user = await request.auser()
+        version = await aget_poll_version('presence')
+        etag = quote_etag(poll_etag('presence', version, user.pk, wants_compact_format(request)))
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+
+        user_vote = await aget_user_presence_vote(user)
+        if wants_compact_format(request):
+            response = presence_poll_compact_response(request, await aget_presence_poll_compact_json(version), user_vote)
+        else:
+            response = presence_poll_response(await aget_presence_poll_data_json(version), user_vote)
+        response['ETag'] = etag
+        return response
+
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+
+@login_required
+async def get_weather_data_async(request):
+    """Come get_weather_data, con la chiamata a Open-Meteo asincrona"""
+    if request.method == 'GET':
+        return weather_response(request, await aget_weather_payload())
+
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
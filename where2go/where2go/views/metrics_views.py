@@ -0,0 +1,33 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.cache import never_cache
+
+from ..services import metrics_enabled, render_metrics
+
+
+@never_cache
+def metrics(request):
+    """
+    Metriche di tutti i processi nel formato testuale di Prometheus.
+    Leggibili solo dallo staff o con l'header "Authorization: Bearer <METRICS_TOKEN>"
+    (lo scraper). L'indirizzo del client non conta: dietro un reverse proxy
+    sulla stessa macchina ogni richiesta arriverebbe da 127.0.0.1.
+    """
+    if not metrics_enabled():
+        raise Http404
+
+    if not (has_metrics_token(request) or request.user.is_staff):
+        return HttpResponseForbidden('Accesso non consentito')
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def has_metrics_token(request):
+    """La richiesta porta il token di METRICS_TOKEN? Senza token configurato, mai"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if not token or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(credentials.strip().encode(), token.encode())
@@ -0,0 +1,55 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+
+from ..models import Restaurants
+from ..services import parse_coordinates, find_nearby_restaurants
+
+# Numero di ristoranti restituiti senza ?limit=, e massimo consentito
+DEFAULT_NEARBY_LIMIT = 10
+MAX_NEARBY_LIMIT = 100
+
+
+@login_required
+def restaurants_nearby(request):
+    """
+    Ristoranti vicini a un punto, ordinati per distanza, dall'indice spaziale in memoria.
+    Parametri: ?lat=&lon= obbligatori; ?radius=<km> per tutti quelli entro il raggio
+    (al più ?limit=), altrimenti i ?limit= più vicini; ?category=<id> per una sola categoria.
+    """
+    if request.method == 'GET':
+        try:
+            latitude, longitude = parse_coordinates(request.GET.get('lat'), request.GET.get('lon'))
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Coordinate non valide'})
+
+        try:
+            radius = float(request.GET['radius']) if request.GET.get('radius') else None
+            limit = min(int(request.GET.get('limit', DEFAULT_NEARBY_LIMIT)), MAX_NEARBY_LIMIT)
+            if limit < 1:
+                raise ValueError('Limit must be positive')
+            category_id = int(request.GET['category']) if request.GET.get('category') else None
+            matches = find_nearby_restaurants(latitude, longitude, radius, limit, category_id)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Parametri non validi'})
+
+        # L'indice contiene solo ID e coordinate: i dettagli arrivano con una sola query
+        details = {
+            row['id']: row for row in Restaurants.objects.filter(
+                id__in=[restaurant_id for _, restaurant_id in matches]
+            ).values('id', 'name', 'category_id', 'category__name', 'latitude', 'longitude')
+        }
+        restaurants = [
+            {
+                'id': restaurant_id,
+                'name': details[restaurant_id]['name'],
+                'category_id': details[restaurant_id]['category_id'],
+                'category_name': details[restaurant_id]['category__name'],
+                'latitude': details[restaurant_id]['latitude'],
+                'longitude': details[restaurant_id]['longitude'],
+                'distance_km': round(distance, 3),
+            }
+            for distance, restaurant_id in matches if restaurant_id in details
+        ]
+        return JsonResponse({'success': True, 'restaurants': restaurants})
+
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
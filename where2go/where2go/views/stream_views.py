@@ -0,0 +1,111 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from ..services import (
+    broker, get_poll_version, get_poll_versions, get_user_food_votes_with_pending, get_user_presence_vote,
+    get_food_poll_data_json, get_presence_poll_data_json, SerializedJSON, layered_json,
+)
+
+# Secondi tra due commenti di keepalive, per non far chiudere la connessione ai proxy
+KEEPALIVE_INTERVAL = 15
+
+# Secondi tra due controlli delle versioni, per i voti registrati da altri processi.
+# Il broker avvisa solo gli stream dello stesso processo: tra processi diversi il
+# risveglio è un polling della tabella PollVersion (una query ogni
+# VERSION_CHECK_INTERVAL per connessione aperta), non un push.
+VERSION_CHECK_INTERVAL = 2
+
+CHANNELS = ('food', 'presence')
+
+
+@login_required
+async def poll_stream(request):
+    """
+    Stream Server-Sent Events con gli aggiornamenti dei sondaggi cibo e presenza.
+    Invia uno snapshot iniziale e poi uno nuovo solo quando un voto cambia lo stato.
+    I voti dello stesso processo arrivano subito dal broker, quelli degli altri
+    processi al successivo controllo delle versioni sul database (vedi
+    VERSION_CHECK_INTERVAL). Disponibile solo sotto ASGI: il dashboard apre lo
+    stream solo se stream_available() lo indica.
+    """
+    if not stream_available(request):
+        # Sotto WSGI lo stream terrebbe occupato un worker: il client torna al polling
+        return JsonResponse({'success': False, 'error': 'Stream disponibile solo con ASGI'}, status=503)
+
+    user = await request.auser()
+    response = StreamingHttpResponse(poll_event_stream(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_available(request):
+    """Sotto WSGI lo stream terrebbe occupato un worker per tutta la connessione"""
+    return isinstance(request, ASGIRequest)
+
+
+async def poll_event_stream(user):
+    subscription = broker.subscribe()
+    try:
+        versions = await sync_to_async(get_poll_versions)()
+        for channel in CHANNELS:
+            yield await render_poll_event(channel, user)
+
+        idle = 0
+        while True:
+            try:
+                channel = await asyncio.wait_for(subscription.queue.get(), timeout=VERSION_CHECK_INTERVAL)
+                # Più voti arrivati insieme producono un solo push per canale
+                channels = {channel} | subscription.drain()
+                current = await sync_to_async(get_poll_versions)()
+            except asyncio.TimeoutError:
+                # I voti arrivati ad altri processi non passano dal broker: confronta le versioni
+                current = await sync_to_async(get_poll_versions)()
+                channels = {channel for channel in CHANNELS if current[channel] != versions[channel]}
+
+            versions = current
+            if not channels:
+                idle += VERSION_CHECK_INTERVAL
+                if idle >= KEEPALIVE_INTERVAL:
+                    idle = 0
+                    yield ': keepalive\n\n'
+                continue
+
+            idle = 0
+            for channel in CHANNELS:
+                if channel in channels:
+                    yield await render_poll_event(channel, user)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def render_poll_event(channel, user):
+    if channel == 'food':
+        data = await sync_to_async(build_food_event)(user)
+    else:
+        data = await sync_to_async(build_presence_event)(user)
+    return f"event: {channel}\ndata: {data}\n\n"
+
+
+def build_food_event(user):
+    # Lo snapshot condiviso viene costruito una volta per versione per tutti gli stream
+    version = get_poll_version('food')
+    return layered_json({
+        'success': True,
+        'version': version,
+        'poll_data': SerializedJSON(get_food_poll_data_json(version)),
+        'user_votes': get_user_food_votes_with_pending(user),
+    })
+
+
+def build_presence_event(user):
+    version = get_poll_version('presence')
+    return layered_json({
+        'success': True,
+        'presence_data': SerializedJSON(get_presence_poll_data_json(version)),
+        'user_vote': get_user_presence_vote(user),
+    })
@@ -2,37 +2,153 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib import messages
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.http import JsonResponse
 from ..models import Categories, Restaurants, Reviews, FoodPoll, PresencePoll
+from ..services import (
+    notify_poll_change, remove_food_poll_votes_from_tallies, reset_food_poll_tallies,
+    parse_coordinates, index_restaurant, unindex_restaurant, use_read_replica,
+)
 
 
+# Admin dashboard sections loaded as JSON pages (see admin_section_data)
+DEFAULT_SECTION_LIMIT = 50
+MAX_SECTION_LIMIT = 200
+
+
+def int_param(params, name):
+    """Optional integer query parameter; ValueError if present but not an integer"""
+    return int(params[name]) if params.get(name) else None
+
+
+def category_rows(params):
+    rows = Categories.objects.values('id', 'name').annotate(restaurant_count=Count('restaurants'))
+    if params.get('q'):
+        rows = rows.filter(name__icontains=params['q'])
+    return rows
+
+
+def restaurant_rows(params):
+    rows = Restaurants.objects.values(
+        'id', 'name', 'latitude', 'longitude', 'category_id', category_name=F('category__name')
+    ).annotate(review_count=Count('reviews'))
+    if params.get('q'):
+        rows = rows.filter(name__icontains=params['q'])
+    category_id = int_param(params, 'category')
+    if category_id is not None:
+        rows = rows.filter(category_id=category_id)
+    return rows
+
+
+def user_rows(params):
+    rows = User.objects.values('id', 'username', 'email', 'date_joined', 'is_superuser')
+    if params.get('q'):
+        rows = rows.filter(Q(username__icontains=params['q']) | Q(email__icontains=params['q']))
+    return rows
+
+
+def review_rows(params):
+    rows = Reviews.objects.values(
+        'id', 'rating', 'comment', 'created_at', 'user_id', 'restaurant_id',
+        username=F('user__username'), restaurant_name=F('restaurant__name'),
+    )
+    restaurant_id = int_param(params, 'restaurant')
+    if restaurant_id is not None:
+        rows = rows.filter(restaurant_id=restaurant_id)
+    if params.get('q'):
+        rows = rows.filter(comment__icontains=params['q'])
+    return rows
+
+
+def food_poll_rows(params):
+    rows = FoodPoll.objects.values(
+        'id', 'user_id', 'category_id', username=F('user__username'), category_name=F('category__name')
+    )
+    category_id = int_param(params, 'category')
+    if category_id is not None:
+        rows = rows.filter(category_id=category_id)
+    if params.get('q'):
+        rows = rows.filter(user__username__icontains=params['q'])
+    return rows
+
+
+def presence_poll_rows(params):
+    rows = PresencePoll.objects.values('id', 'user_id', 'presence', username=F('user__username'))
+    if params.get('presence'):
+        rows = rows.filter(presence=params['presence'])
+    if params.get('q'):
+        rows = rows.filter(user__username__icontains=params['q'])
+    return rows
+
+
+# Section name: (rows with only the columns the page shows, newest first)
+ADMIN_SECTIONS = {
+    'categories': (category_rows, False),
+    'restaurants': (restaurant_rows, False),
+    'users': (user_rows, False),
+    'reviews': (review_rows, True),
+    'food_polls': (food_poll_rows, True),
+    'presence_polls': (presence_poll_rows, False),
+}
+
+
+@use_read_replica
 def admin_dashboard(request):
-    """Main admin dashboard view"""
-    # Get all data for display
-    categories = Categories.objects.all().order_by('name')
-    restaurants = Restaurants.objects.all().order_by('name')
-    users = User.objects.all()
-    reviews = Reviews.objects.all().order_by('-created_at')[:10]
-    food_polls = FoodPoll.objects.all().select_related('user', 'category').order_by('-id')
-    presence_polls = PresencePoll.objects.all().select_related('user')
-    
-    context = {
-        'categories': categories,
-        'restaurants': restaurants,
-        'users': users,
-        'reviews': reviews,
-        'food_polls': food_polls,
-        'presence_polls': presence_polls,
-        'total_categories': categories.count(),
-        'total_restaurants': restaurants.count(),
-        'total_users': users.count(),
-        'total_reviews': Reviews.objects.count(),
-        'total_food_polls': food_polls.count(),
-        'total_presence_polls': presence_polls.count(),
-        'present_votes': presence_polls.filter(presence='present').count(),
-        'absent_votes': presence_polls.filter(presence='absent').count(),
-    }
-    return render(request, 'test/test.html', context)
+    """
+    Main admin dashboard view. Only the page shell is rendered here: the
+    statistics and every section are fetched as JSON when they scroll into
+    view, so the page costs the same whatever the size of the tables.
+    """
+    return render(request, 'test/test.html')
+
+
+@use_read_replica
+def admin_dashboard_stats(request):
+    """Row counts shown at the top of the admin dashboard"""
+    presence_counts = PresencePoll.objects.aggregate(
+        present=Count('id', filter=Q(presence='present')),
+        absent=Count('id', filter=Q(presence='absent')),
+    )
+    return JsonResponse({
+        'success': True,
+        'categories': Categories.objects.count(),
+        'restaurants': Restaurants.objects.count(),
+        'users': User.objects.count(),
+        'reviews': Reviews.objects.count(),
+        'food_polls': FoodPoll.objects.count(),
+        'presence_polls': presence_counts['present'] + presence_counts['absent'],
+        'present': presence_counts['present'],
+        'absent': presence_counts['absent'],
+    })
+
+
+@use_read_replica
+def admin_section_data(request, section):
+    """
+    One page of an admin dashboard section as JSON, with keyset pagination:
+    ?after=<id> continues after the last row of the previous page (the
+    response's "next"), ?limit= sets the page size, ?q= and the section's
+    own filters (?category=, ?restaurant=, ?presence=) are applied in SQL.
+    """
+    if section not in ADMIN_SECTIONS:
+        return JsonResponse({'success': False, 'error': 'Unknown section'})
+    rows_for, newest_first = ADMIN_SECTIONS[section]
+    try:
+        after = int_param(request.GET, 'after')
+        limit = min(int(request.GET.get('limit', DEFAULT_SECTION_LIMIT)), MAX_SECTION_LIMIT)
+        if limit < 1:
+            raise ValueError('Limit must be positive')
+        rows = rows_for(request.GET)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid parameters'})
+
+    if after is not None:
+        rows = rows.filter(id__lt=after) if newest_first else rows.filter(id__gt=after)
+    # One extra row tells whether there is a next page
+    items = list(rows.order_by('-id' if newest_first else 'id')[:limit + 1])
+    next_cursor = items[limit - 1]['id'] if len(items) > limit else None
+    return JsonResponse({'success': True, 'items': items[:limit], 'next': next_cursor})
 
 
 # Category Management Views
@@ -42,7 +158,8 @@ def add_category(request):
         name = request.POST.get('category_name')
         if name:
             try:
-                Categories.objects.create(name=name)
+                category = Categories.objects.create(name=name)
+                notify_poll_change('food', [category.id])
                 messages.success(request, f'Category "{name}" added successfully!')
             except IntegrityError:
                 messages.error(request, 'Category already exists!')
@@ -63,6 +180,7 @@ def delete_category(request, category_id):
             messages.warning(request, f'Cannot delete category "{category_name}" because it has {restaurant_count} associated restaurants.')
         else:
             category.delete()
+            notify_poll_change('food', [category_id])
             messages.success(request, f'Category "{category_name}" deleted successfully!')
     return redirect('admin_dashboard')
 
@@ -73,12 +191,21 @@ def add_restaurant(request):
     if request.method == 'POST':
         name = request.POST.get('restaurant_name')
         category_id = request.POST.get('restaurant_category')
+        latitude = request.POST.get('restaurant_latitude') or None
+        longitude = request.POST.get('restaurant_longitude') or None
         
-        if name and category_id:
+        if (latitude is None) != (longitude is None):
+            messages.error(request, 'Latitude and longitude must be given together!')
+        elif name and category_id:
             try:
+                if latitude is not None:
+                    latitude, longitude = parse_coordinates(latitude, longitude)
                 category = get_object_or_404(Categories, id=category_id)
-                Restaurants.objects.create(name=name, category=category)
+                restaurant = Restaurants.objects.create(name=name, category=category, latitude=latitude, longitude=longitude)
+                index_restaurant(restaurant)
                 messages.success(request, f'Restaurant "{name}" added successfully!')
+            except ValueError:
+                messages.error(request, 'Invalid coordinates!')
             except Exception as e:
                 messages.error(request, f'Error adding restaurant: {str(e)}')
         else:
@@ -98,6 +225,7 @@ def delete_restaurant(request, restaurant_id):
             messages.warning(request, f'Cannot delete restaurant "{restaurant_name}" because it has {review_count} reviews. Delete reviews first.')
         else:
             restaurant.delete()
+            unindex_restaurant(restaurant_id)
             messages.success(request, f'Restaurant "{restaurant_name}" deleted successfully!')
     return redirect('admin_dashboard')
 
@@ -150,7 +278,12 @@ def delete_user(request, user_id):
             if review_count > 0 or poll_count > 0:
                 messages.warning(request, f'User "{username}" has {review_count} reviews and {poll_count} polls. These will also be deleted.')
             
-            user.delete()
+            with transaction.atomic():
+                voted_category_ids = list(user.foodpoll_set.values_list('category_id', flat=True))
+                user.delete()
+                remove_food_poll_votes_from_tallies(voted_category_ids)
+                notify_poll_change('food', voted_category_ids)
+                notify_poll_change('presence')
             messages.success(request, f'User "{username}" deleted successfully!')
     return redirect('admin_dashboard')
 
@@ -173,11 +306,16 @@ def clear_all_polls(request):
     """Clear all food polls"""
     if request.method == 'POST':
         poll_count = FoodPoll.objects.count()
-        FoodPoll.objects.all().delete()
+        with transaction.atomic():
+            voted_category_ids = list(FoodPoll.objects.values_list('category_id', flat=True).distinct())
+            FoodPoll.objects.all().delete()
+            reset_food_poll_tallies()
+            notify_poll_change('food', voted_category_ids)
         messages.success(request, f'Cleared {poll_count} polls successfully!')
     return redirect('admin_dashboard')
 
 
+@use_read_replica
 def get_statistics(request):
     """Get dashboard statistics"""
     stats = {
@@ -1,70 +1,155 @@
 from django.shortcuts import render, redirect
 from ..models import Categories, FoodPoll, PresencePoll
-from django.db.models import Count
 from django.contrib.auth.decorators import login_required
 
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.db import transaction
 import json
 from ..models import Categories, FoodPoll, PresencePoll
+from ..services import (
+    notify_poll_change, get_poll_version, get_poll_versions, get_changed_food_categories,
+    build_food_poll_snapshot, get_user_food_vote_ids, toggle_food_poll_vote, queue_food_poll_toggle,
+    get_user_food_votes_with_pending, pending_food_votes, pending_food_votes_token,
+    build_presence_poll_data, get_user_presence_vote,
+    get_food_poll_data_json, get_presence_poll_data_json, SerializedJSON, layered_json, layered_json_response,
+    get_food_poll_compact_json, get_presence_poll_compact_json, compact_name_fields, record_poll_vote,
+    use_read_replica,
+)
+from .weather_views import get_cached_weather_payload
+from .stream_views import stream_available
+
+# Sezioni del dashboard, nell'ordine in cui vengono restituite da /dashboard/state/
+DASHBOARD_SECTIONS = ('food', 'presence', 'weather')
+
+# Valore di ?format= che attiva il formato compatto dei sondaggi
+COMPACT_FORMAT = 'compact'
+
+def wants_compact_format(request):
+    return request.GET.get('format') == COMPACT_FORMAT
 
 @login_required
 def dashboard(request):
-    categories = Categories.objects.all()
-
     if request.method == 'POST':
         category_id = request.POST.get('category_id')
         if category_id:
             category = Categories.objects.get(id=category_id)
-            FoodPoll.objects.update_or_create(user=request.user, defaults={'category': category})
-            return redirect('poll')
+            # Come food_poll_vote_ajax: conteggi, versione e registro dei cambiamenti restano allineati
+            if queue_food_poll_toggle(request.user, category.id) is None:
+                toggle_food_poll_vote(request.user, category.id)
+            return redirect('dashboard')
 
-    vote_counts = FoodPoll.objects.values('category__name').annotate(votes=Count('category')).order_by('-votes')
+    # Stato iniziale di tutti i pannelli incorporato nella pagina: nessuna fetch al primo caricamento
+    dashboard_state = json.loads(layered_json(build_dashboard_state(request.user)))
+    # Senza stream (WSGI) la pagina non prova nemmeno ad aprirlo e resta sul polling
+    dashboard_state['stream'] = stream_available(request)
+    poll_data = dashboard_state['food']['poll_data']
+    user_votes = dashboard_state['food']['user_votes']
+    categories = [
+        {'id': int(category_id), 'name': data['category_name']}
+        for category_id, data in poll_data.items()
+    ]
+    vote_counts = sorted(
+        ({'category__name': data['category_name'], 'votes': data['count']} for data in poll_data.values() if data['count']),
+        key=lambda item: -item['votes']
+    )
 
     context = {
         'categories': categories,
         'vote_counts': vote_counts,
+        'poll_data': poll_data,
+        'user_votes': user_votes,
+        'dashboard_state': dashboard_state,
     }
     return render(request, 'dashboard/dashboard.html', context)
 
+@use_read_replica
+@login_required
+@gzip_page
+def dashboard_state_ajax(request):
+    """
+    Restituisce in una sola risposta lo stato di sondaggio cibo, sondaggio presenza
+    e meteo, ognuno con la stessa struttura del proprio endpoint.
+    Con ?sections=food,presence si limita alle sezioni indicate.
+    """
+    if request.method == 'GET':
+        sections = DASHBOARD_SECTIONS
+        if request.GET.get('sections'):
+            sections = [section for section in request.GET['sections'].split(',') if section in DASHBOARD_SECTIONS]
+        return layered_json_response(build_dashboard_state(request.user, sections))
+    
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+def build_dashboard_state(user, sections=DASHBOARD_SECTIONS):
+    """Stato del dashboard per l'utente: le sezioni dei sondaggi arrivano già serializzate dalla cache"""
+    versions = get_poll_versions()
+    state = {'success': True}
+    if 'food' in sections:
+        state['food'] = SerializedJSON(layered_json({
+            'success': True,
+            'version': versions['food'],
+            'delta': False,
+            'poll_data': SerializedJSON(get_food_poll_data_json(versions['food'])),
+            'user_votes': get_user_food_votes_with_pending(user)
+        }))
+    if 'presence' in sections:
+        state['presence'] = SerializedJSON(layered_json({
+            'success': True,
+            'presence_data': SerializedJSON(get_presence_poll_data_json(versions['presence'])),
+            'user_vote': get_user_presence_vote(user)
+        }))
+    if 'weather' in sections:
+        # Solo se già in cache: con la cache vuota (o Open-Meteo in difficoltà) la pagina
+        # non aspetta l'upstream, ed è il componente meteo a chiedere /weather
+        state['weather'] = get_cached_weather_payload()
+    return state
+
 def dashboard_view(request):
     return render(request, 'dashboard/dashboard.html')
 
 @login_required
+@gzip_page
 def food_poll_vote_ajax(request):
     """Gestisce i voti del sondaggio cibo tramite AJAX - supporta voti multipli"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             category_id = data.get('category_id')
+            user_votes = None
             
             if category_id:
                 try:
                     category = Categories.objects.get(id=category_id)
                     
-                    # Controlla se l'utente ha già votato per questa categoria
-                    existing_vote = FoodPoll.objects.filter(user=request.user, category=category).first()
-                    
-                    if existing_vote:
-                        # Se esiste già, rimuovi il voto (toggle off)
-                        existing_vote.delete()
-                    else:
-                        # Se non esiste, aggiungi il voto (toggle on)
-                        FoodPoll.objects.create(user=request.user, category=category)
+                    # Con VOTE_QUEUE il voto va in coda e la risposta riporta già i voti
+                    # dell'utente come saranno dopo il flush; altrimenti (o a coda piena)
+                    # aggiunge il voto, o lo rimuove se esiste già (toggle)
+                    user_votes = queue_food_poll_toggle(request.user, category.id)
+                    if user_votes is None:
+                        toggle_food_poll_vote(request.user, category.id)
                         
                 except Categories.DoesNotExist:
                     return JsonResponse({'success': False, 'error': 'Categoria non trovata'})
             
-            # Restituisci i dati aggiornati del sondaggio cibo
-            poll_data = get_food_poll_data_dict()
-            user_votes = get_user_food_votes(request.user)
+            if user_votes is None:
+                user_votes = get_user_food_votes_with_pending(request.user)
+            
+            # Restituisci i dati aggiornati del sondaggio cibo (e mettili in cache per i lettori)
+            version = get_poll_version('food')
+            if wants_compact_format(request):
+                return food_poll_compact_response(
+                    request, get_food_poll_compact_json(version), version, None, user_votes
+                )
             
-            return JsonResponse({
+            return layered_json_response({
                 'success': True,
-                'poll_data': poll_data,
+                'version': version,
+                'poll_data': SerializedJSON(get_food_poll_data_json(version)),
                 'user_votes': user_votes
             })
             
@@ -75,60 +160,147 @@ def food_poll_vote_ajax(request):
     
     return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
 
+def food_poll_etag(request):
+    """
+    ETag del sondaggio cibo: versione corrente più utente, dato che user_votes
+    è personale, più i voti dell'utente ancora in coda (non cambiano la versione)
+    """
+    # La versione e i voti in coda letti qui vengono riusati dalla vista
+    request.food_poll_pending = pending_food_votes(request.user.pk)
+    request.food_poll_version = get_poll_version('food')
+    return poll_etag(
+        'food', request.food_poll_version, request.user.pk, wants_compact_format(request),
+        pending_food_votes_token(request.food_poll_pending),
+    )
+
+
+def poll_etag(poll, version, user_id, compact=False, pending=''):
+    """ETag di un sondaggio per versione e utente (condiviso con le viste asincrone)"""
+    # Il formato fa parte dell'ETag: le due rappresentazioni non sono intercambiabili
+    suffix = '-compact' if compact else ''
+    if pending:
+        suffix = f'-q{pending}{suffix}'
+    return f"{poll}-{version}-{user_id}{suffix}"
+
+
+@use_read_replica
 @login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=food_poll_etag)
 def food_poll_data_ajax(request):
-    """Restituisce i dati correnti del sondaggio cibo"""
+    """
+    Restituisce i dati correnti del sondaggio cibo.
+    Con ?since=<versione> restituisce solo le categorie cambiate da quella
+    versione (delta), o lo snapshot completo se il client è troppo indietro.
+    Con ?format=compact risponde nel formato compatto (vedi food_poll_compact_response).
+    """
     if request.method == 'GET':
-        poll_data = get_food_poll_data_dict()
-        user_votes = get_user_food_votes(request.user)
-        
-        return JsonResponse({
+        # La versione va letta prima dei dati: al più un delta successivo ripete una categoria
+        version = getattr(request, 'food_poll_version', None)
+        if version is None:
+            version = get_poll_version('food')
+
+        changed = None
+        try:
+            since = parse_since(request)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Versione non valida'})
+        if since is not None:
+            changed = get_changed_food_categories(since, version)
+
+        # I voti dell'utente includono quelli ancora in coda (letti con l'ETag, prima del database)
+        user_votes = get_user_food_votes_with_pending(request.user, getattr(request, 'food_poll_pending', None))
+        if wants_compact_format(request):
+            return food_poll_compact_response(
+                request, get_food_poll_compact_json(version), version, changed, user_votes
+            )
+
+        # Lo snapshot condiviso arriva dalla cache, i voti dell'utente vengono aggiunti sopra
+        return food_poll_response(get_food_poll_data_json(version), version, changed, user_votes)
+    
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+def parse_since(request):
+    """Versione passata con ?since=, None se assente; solleva ValueError se non valida"""
+    since = request.GET.get('since')
+    return int(since) if since is not None else None
+
+def food_poll_response(poll_data_json, version, changed, user_votes):
+    """Risposta del sondaggio cibo: snapshot completo, o solo le categorie in `changed`"""
+    if changed is None:
+        return layered_json_response({
             'success': True,
-            'poll_data': poll_data,
+            'version': version,
+            'delta': False,
+            'poll_data': SerializedJSON(poll_data_json),
             'user_votes': user_votes
         })
-    
-    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
 
-def get_food_poll_data_dict():
-    """Restituisce un dizionario con i dati del sondaggio cibo"""
-    categories = Categories.objects.all()
-    poll_data = {}
-    
-    for category in categories:
-        votes = FoodPoll.objects.filter(category=category)
-        vote_count = votes.count()
-        voters = [vote.user.username for vote in votes]
-        
-        poll_data[str(category.id)] = {
-            'count': vote_count,
-            'voters': voters,
-            'category_name': category.name
-        }
-    
+    poll_data = {
+        category_id: data for category_id, data in json.loads(poll_data_json).items()
+        if int(category_id) in changed
+    }
+    return JsonResponse({
+        'success': True,
+        'version': version,
+        'delta': True,
+        'poll_data': poll_data,
+        'removed': [category_id for category_id in changed if str(category_id) not in poll_data],
+        'user_votes': user_votes
+    })
+
+def food_poll_compact_response(request, snapshot, version, changed, user_votes):
+    """
+    Risposta del sondaggio cibo nel formato compatto: 'poll' è una lista di
+    [category_id, count, [user_id, ...]] e i nomi arrivano dai dizionari
+    'categories' e 'users' (ID -> nome). Ogni dizionario ha un token: se il
+    client lo passa (?categories=<token>&users=<token>) e non è cambiato,
+    il dizionario viene omesso.
+    """
+    response = {
+        'success': True,
+        'format': COMPACT_FORMAT,
+        'version': version,
+        'delta': changed is not None,
+    }
+    if changed is None:
+        response['poll'] = SerializedJSON(snapshot['poll'])
+    else:
+        poll = [row for row in json.loads(snapshot['poll']) if row[0] in changed]
+        present = {row[0] for row in poll}
+        response['poll'] = poll
+        response['removed'] = [category_id for category_id in changed if category_id not in present]
+    response.update(compact_name_fields(snapshot, request.GET))
+    response['user_votes'] = user_votes
+    return layered_json_response(response)
+
+def get_food_poll_data_dict(category_ids=None):
+    """Restituisce un dizionario con i dati del sondaggio cibo, eventualmente limitato ad alcune categorie"""
+    poll_data, _ = build_food_poll_snapshot(category_ids=category_ids)
     return poll_data
 
 def get_user_food_votes(user):
     """Restituisce una lista degli ID delle categorie per cui l'utente ha votato nel sondaggio cibo"""
-    votes = FoodPoll.objects.filter(user=user)
-    return [vote.category.id for vote in votes]
+    return get_user_food_vote_ids(user)
 
 def get_user_food_vote(user):
     """Restituisce l'ID della categoria per cui l'utente ha votato nel sondaggio cibo, o None (mantenuto per compatibilità)"""
     try:
         vote = FoodPoll.objects.get(user=user)
-        return vote.category.id
+        return vote.category_id
     except FoodPoll.DoesNotExist:
         return None
     except FoodPoll.MultipleObjectsReturned:
         # Se ci sono voti multipli, restituisce il primo
         vote = FoodPoll.objects.filter(user=user).first()
-        return vote.category.id if vote else None
+        return vote.category_id if vote else None
 
 
 # PRESENCE POLL VIEWS
 
 @login_required
+@gzip_page
 def presence_poll_vote_ajax(request):
     """Gestisce i voti del sondaggio presenza tramite AJAX"""
     if request.method == 'POST':
@@ -136,26 +308,34 @@ def presence_poll_vote_ajax(request):
             data = json.loads(request.body)
             presence_value = data.get('presence_value')  # 'present', 'absent', or None
             
-            if presence_value in ['present', 'absent']:
-                # Aggiorna o crea il voto di presenza
-                PresencePoll.objects.update_or_create(
-                    user=request.user,
-                    defaults={'presence': presence_value}
-                )
-            elif presence_value is None:
-                # Rimuovi il voto se l'utente vuole annullare
-                PresencePoll.objects.filter(user=request.user).delete()
-            else:
+            if presence_value not in ['present', 'absent', None]:
                 return JsonResponse({'success': False, 'error': 'Valore di presenza non valido'})
+
+            with transaction.atomic():
+                if presence_value is None:
+                    # Rimuovi il voto se l'utente vuole annullare
+                    PresencePoll.objects.filter(user=request.user).delete()
+                else:
+                    # Aggiorna o crea il voto di presenza
+                    PresencePoll.objects.update_or_create(
+                        user=request.user,
+                        defaults={'presence': presence_value}
+                    )
+
+                notify_poll_change('presence')
+            record_poll_vote('presence')
             
-            # Restituisci i dati aggiornati del sondaggio presenza
-            presence_data = get_presence_poll_data_dict()
-            user_vote = get_user_presence_poll_vote(request.user)
+            # Restituisci i dati aggiornati del sondaggio presenza (e mettili in cache per i lettori)
+            version = get_poll_version('presence')
+            if wants_compact_format(request):
+                return presence_poll_compact_response(
+                    request, get_presence_poll_compact_json(version), get_user_presence_vote(request.user)
+                )
             
-            return JsonResponse({
+            return layered_json_response({
                 'success': True,
-                'presence_data': presence_data,
-                'user_vote': user_vote
+                'presence_data': SerializedJSON(get_presence_poll_data_json(version)),
+                'user_vote': get_user_presence_vote(request.user)
             })
             
         except json.JSONDecodeError:
@@ -166,51 +346,62 @@ def presence_poll_vote_ajax(request):
     return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
 
 
+def presence_poll_etag(request):
+    """ETag del sondaggio presenza: versione corrente più utente"""
+    request.presence_poll_version = get_poll_version('presence')
+    return poll_etag('presence', request.presence_poll_version, request.user.pk, wants_compact_format(request))
+
+
+@use_read_replica
 @login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=presence_poll_etag)
 def presence_poll_data_ajax(request):
-    """Restituisce i dati correnti del sondaggio presenza"""
+    """Restituisce i dati correnti del sondaggio presenza (con ?format=compact nel formato compatto)"""
     if request.method == 'GET':
-        presence_data = get_presence_poll_data_dict()
-        user_vote = get_user_presence_poll_vote(request.user)
+        version = getattr(request, 'presence_poll_version', None)
+        if version is None:
+            version = get_poll_version('presence')
+        if wants_compact_format(request):
+            return presence_poll_compact_response(
+                request, get_presence_poll_compact_json(version), get_user_presence_vote(request.user)
+            )
         
-        return JsonResponse({
-            'success': True,
-            'presence_data': presence_data,
-            'user_vote': user_vote
-        })
+        return presence_poll_response(get_presence_poll_data_json(version), get_user_presence_vote(request.user))
     
     return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
 
 
+def presence_poll_response(presence_data_json, user_vote):
+    return layered_json_response({
+        'success': True,
+        'presence_data': SerializedJSON(presence_data_json),
+        'user_vote': user_vote
+    })
+
+
+def presence_poll_compact_response(request, snapshot, user_vote):
+    """
+    Risposta del sondaggio presenza nel formato compatto: 'presence' mappa
+    'present'/'absent' a [count, [user_id, ...]], con il dizionario 'users'
+    inviato solo se il token passato dal client (?users=<token>) è cambiato.
+    """
+    response = {
+        'success': True,
+        'format': COMPACT_FORMAT,
+        'presence': SerializedJSON(snapshot['presence']),
+    }
+    response.update(compact_name_fields(snapshot, request.GET))
+    response['user_vote'] = user_vote
+    return layered_json_response(response)
+
+
 def get_presence_poll_data_dict():
     """Restituisce un dizionario con i dati del sondaggio presenza"""
-    present_votes = PresencePoll.objects.filter(presence='present')
-    absent_votes = PresencePoll.objects.filter(presence='absent')
-    
-    present_count = present_votes.count()
-    absent_count = absent_votes.count()
-    
-    present_voters = [vote.user.username for vote in present_votes]
-    absent_voters = [vote.user.username for vote in absent_votes]
-    
-    presence_data = {
-        'present': {
-            'count': present_count,
-            'voters': present_voters
-        },
-        'absent': {
-            'count': absent_count,
-            'voters': absent_voters
-        }
-    }
-    
-    return presence_data
+    return build_presence_poll_data()
 
 
 def get_user_presence_poll_vote(user):
     """Restituisce il voto di presenza dell'utente ('present', 'absent', o None)"""
-    try:
-        presence_vote = PresencePoll.objects.get(user=user)
-        return presence_vote.presence
-    except PresencePoll.DoesNotExist:
-        return None
+    return get_user_presence_vote(user)
@@ -1,8 +1,30 @@
 import requests
+from django.conf import settings
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from datetime import datetime, timedelta
+from itertools import compress
 import json
+import zlib
+
+from ..models import Restaurants
+from ..services import (
+    get_cached_forecast, peek_cached_forecast, aget_cached_forecast, get_cached_forecasts, get_upstream_client,
+    weather_cache_key, get_food_poll_winner_ids,
+)
+
+
+# Ogni quanti secondi una previsione è considerata da aggiornare (il dashboard ricarica ogni 30 minuti)
+WEATHER_REFRESH_SECONDS = 30 * 60
+
+# Coordinate di Reggio Emilia
+LAT = 44.6983
+LON = 10.6312
+
+# Ore di interesse (21:00, 22:00, 23:00 del venerdì)
+TARGET_HOURS = (21, 22, 23)
 
 
 def get_next_friday():
@@ -107,6 +129,23 @@ def get_weather_icon(weather_code, is_day=True):
     return icons.get(weather_code, "01d" if is_day else "01n")
 
 
+def weather_response(request, weather_data):
+    """
+    Risposta JSON del meteo. Le previsioni riuscite hanno un ETag ricavato dai
+    dati (cambia solo quando la previsione in cache viene aggiornata) e una
+    richiesta con lo stesso If-None-Match riceve 304. Gli errori non hanno ETag
+    né cache: il client li richiede ogni volta, finché la previsione non arriva.
+    """
+    response = JsonResponse(weather_data)
+    if not weather_data['success']:
+        return response
+    etag = quote_etag(f"weather-{zlib.crc32(response.content):08x}")
+    patch_cache_control(response, private=True, max_age=WEATHER_REFRESH_SECONDS)
+    response['ETag'] = etag
+    not_modified = get_conditional_response(request, etag=etag, response=response)
+    return not_modified if not_modified is not None else response
+
+
 @login_required
 def get_weather_data(request):
     """
@@ -114,112 +153,276 @@ def get_weather_data(request):
     Utilizza Open-Meteo API per Reggio Emilia
     """
     if request.method == 'GET':
+        return weather_response(request, get_weather_payload())
+    
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+
+@login_required
+def get_venue_weather(request):
+    """
+    Previsioni del venerdì sera per tutti i ristoranti delle categorie in testa
+    al sondaggio, in una sola risposta. I ristoranti vicini condividono la stessa
+    previsione (coordinate arrotondate a WEATHER_GRID_DEGREES), e le previsioni
+    mancanti arrivano da Open-Meteo con una sola richiesta multi-coordinata.
+    """
+    if request.method == 'GET':
+        friday_date = get_next_friday().strftime('%Y-%m-%d')
+        category_ids = get_food_poll_winner_ids()
+        venues = list(
+            Restaurants.objects.filter(
+                category_id__in=category_ids, latitude__isnull=False, longitude__isnull=False
+            ).order_by('category__name', 'name').values('id', 'name', 'category_id', 'category__name', 'latitude', 'longitude')
+        )
+
+        # Un punto della griglia per gruppo di ristoranti vicini
+        points = {}
+        for venue in venues:
+            point = snap_to_weather_grid(venue['latitude'], venue['longitude'])
+            venue['forecast'] = points.setdefault(f'{weather_cache_key(*point, friday_date)}:evening', point)
+
+        keys = sorted(points)
+        forecasts = get_cached_forecasts(
+            keys, lambda missing: fetch_weather_batch({key: points[key] for key in missing}, friday_date)
+        ) if keys else {}
+
+        return JsonResponse({
+            'success': True,
+            'date': friday_date,
+            'day_name': 'Venerdì',
+            'categories': category_ids,
+            'forecasts': {f'{lat:.4f},{lon:.4f}': forecasts[key] for key, (lat, lon) in points.items()},
+            'venues': [
+                {
+                    'id': venue['id'],
+                    'name': venue['name'],
+                    'category_id': venue['category_id'],
+                    'category_name': venue['category__name'],
+                    'latitude': venue['latitude'],
+                    'longitude': venue['longitude'],
+                    'forecast': '{:.4f},{:.4f}'.format(*venue['forecast']),
+                }
+                for venue in venues
+            ],
+        })
+
+    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
+
+
+def snap_to_weather_grid(lat, lon):
+    """Coordinate arrotondate alla griglia delle previsioni (Open-Meteo ha comunque celle di qualche km)"""
+    grid = getattr(settings, 'WEATHER_GRID_DEGREES', 0.1)
+    return round(round(lat / grid) * grid, 4), round(round(lon / grid) * grid, 4)
+
+
+def fetch_weather_batch(points, friday_date):
+    """
+    Previsioni delle ore di interesse per più punti, {chiave: (lat, lon)}:
+    una richiesta a Open-Meteo ogni WEATHER_BATCH_SIZE punti, con le coordinate
+    separate da virgole. Restituisce {chiave: colonne}, o un errore per chiave.
+    """
+    items = list(points.items())
+    batch_size = getattr(settings, 'WEATHER_BATCH_SIZE', 100)
+    forecasts = {}
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        params = weather_request_params(
+            ','.join(str(lat) for _, (lat, _) in batch),
+            ','.join(str(lon) for _, (_, lon) in batch),
+            friday_date
+        )
         try:
-            # Coordinate di Reggio Emilia
-            LAT = 44.6983
-            LON = 10.6312
-            
-            # Calcola il prossimo venerdì
-            next_friday = get_next_friday()
-            friday_date = next_friday.strftime('%Y-%m-%d')
-            
-            # URL Open-Meteo API
-            BASE_URL = "https://api.open-meteo.com/v1/forecast"
-            
-            # Parametri per la richiesta API
-            params = {
-                'latitude': LAT,
-                'longitude': LON,
-                'hourly': 'temperature_2m,weather_code,relative_humidity_2m,wind_speed_10m,apparent_temperature',
-                'start_date': friday_date,
-                'end_date': friday_date,
-                'timezone': 'Europe/Rome'
-            }
-            
-            # Chiamata API
-            response = requests.get(BASE_URL, params=params, timeout=10)
-            
+            response = get_upstream_client('open-meteo').get(settings.WEATHER_API_URL, params=params)
             if response.status_code != 200:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'API Error: {response.status_code}'
-                })
-            
+                error = {'success': False, 'error': f'API Error: {response.status_code}'}
+                forecasts.update((key, error) for key, _ in batch)
+                continue
             data = response.json()
-            
-            # Estrai i dati orari
-            hourly_data = data.get('hourly', {})
-            times = hourly_data.get('time', [])
-            temperatures = hourly_data.get('temperature_2m', [])
-            weather_codes = hourly_data.get('weather_code', [])
-            humidities = hourly_data.get('relative_humidity_2m', [])
-            wind_speeds = hourly_data.get('wind_speed_10m', [])
-            apparent_temps = hourly_data.get('apparent_temperature', [])
-            
-            # Ore di interesse (21:00, 22:00, 23:00 del venerdì)
-            target_hours = [21, 22, 23]
-            
-            forecasts = []
-            daily_temps = temperatures  # Tutte le temperature del venerdì per min/max
-            
-            # Processa ogni ora del giorno
-            for i, time_str in enumerate(times):
-                dt = datetime.fromisoformat(time_str)
-                hour = dt.hour
-                
-                # Controlla se è una delle ore di interesse
-                if hour in target_hours:
-                    # Determina se è giorno o notte per l'icona
-                    is_day = 6 <= hour <= 18
-                    
-                    forecast_data = {
-                        'datetime': time_str,
-                        'hour': f"{hour:02d}:00",
-                        'temperature': round(temperatures[i]) if i < len(temperatures) else 0,
-                        'feels_like': round(apparent_temps[i]) if i < len(apparent_temps) else 0,
-                        'description': get_weather_description(weather_codes[i] if i < len(weather_codes) else 0),
-                        'icon': get_weather_icon(weather_codes[i] if i < len(weather_codes) else 0, is_day),
-                        'humidity': round(humidities[i]) if i < len(humidities) else 0,
-                        'wind_speed': round(wind_speeds[i], 1) if i < len(wind_speeds) else 0.0
-                    }
-                    forecasts.append(forecast_data)
-            
-            # Ordina per ora
-            forecasts.sort(key=lambda x: x['hour'])
-            
-            # Calcola temperatura min/max del venerdì
-            if daily_temps:
-                min_temp = round(min(daily_temps))
-                max_temp = round(max(daily_temps))
-            else:
-                min_temp = max_temp = None
-            
-            weather_data = {
-                'success': True,
-                'date': friday_date,
-                'day_name': 'Venerdì',
-                'min_temp': min_temp,
-                'max_temp': max_temp,
-                'forecasts': forecasts,
-                'city': 'Reggio Emilia'
-            }
-            
-            return JsonResponse(weather_data)
-            
-        except requests.exceptions.RequestException as e:
-            return JsonResponse({
-                'success': False,
-                'error': f'Network error: {str(e)}'
-            })
-        except KeyError as e:
-            return JsonResponse({
-                'success': False,
-                'error': f'Data parsing error: {str(e)}'
-            })
+            # Con una sola coordinata Open-Meteo restituisce un oggetto invece di una lista
+            locations = data if isinstance(data, list) else [data]
+            for (key, _), location in zip(batch, locations):
+                forecasts[key] = dict(extract_evening_columns(location.get('hourly', {}), friday_date), success=True)
         except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'error': f'Unexpected error: {str(e)}'
-            })
-    
-    return JsonResponse({'success': False, 'error': 'Metodo non consentito'})
\ No newline at end of file
+            error = weather_error_payload(e)
+            forecasts.update((key, error) for key, _ in batch)
+    return forecasts
+
+
+def get_weather_payload():
+    """
+    Restituisce il dizionario con le previsioni del venerdì, lo stesso inviato
+    da get_weather_data; in caso di errore 'success' è False.
+    Le previsioni arrivano dalla cache: Open-Meteo viene interrogato solo quando
+    scadono, in background se ne esiste ancora una copia utilizzabile.
+    """
+    # Calcola il prossimo venerdì
+    friday_date = get_next_friday().strftime('%Y-%m-%d')
+    return get_cached_forecast(
+        weather_cache_key(LAT, LON, friday_date),
+        lambda: fetch_weather_payload(LAT, LON, friday_date)
+    )
+
+
+def get_cached_weather_payload():
+    """
+    Come get_weather_payload(), ma solo se la previsione è già in cache (anche
+    scaduta): None altrimenti, senza attendere Open-Meteo.
+    """
+    friday_date = get_next_friday().strftime('%Y-%m-%d')
+    return peek_cached_forecast(
+        weather_cache_key(LAT, LON, friday_date),
+        lambda: fetch_weather_payload(LAT, LON, friday_date)
+    )
+
+
+async def aget_weather_payload():
+    """Come get_weather_payload(), per le viste asincrone"""
+    friday_date = get_next_friday().strftime('%Y-%m-%d')
+    return await aget_cached_forecast(
+        weather_cache_key(LAT, LON, friday_date),
+        lambda: afetch_weather_payload(LAT, LON, friday_date),
+        lambda: fetch_weather_payload(LAT, LON, friday_date)
+    )
+
+
+def fetch_weather_payload(lat, lon, friday_date):
+    """Interroga Open-Meteo e restituisce le previsioni per le coordinate e il venerdì indicati"""
+    try:
+        # Chiamata API tramite il client condiviso (connessioni riusate, retry, circuit breaker)
+        response = get_upstream_client('open-meteo').get(
+            settings.WEATHER_API_URL, params=weather_request_params(lat, lon, friday_date)
+        )
+        return parse_weather_response(response, friday_date)
+    except Exception as e:
+        return weather_error_payload(e)
+
+
+async def afetch_weather_payload(lat, lon, friday_date):
+    """Come fetch_weather_payload(), senza occupare un thread durante la chiamata"""
+    try:
+        response = await get_upstream_client('open-meteo').aget(
+            settings.WEATHER_API_URL, params=weather_request_params(lat, lon, friday_date)
+        )
+        return parse_weather_response(response, friday_date)
+    except Exception as e:
+        return weather_error_payload(e)
+
+
+def weather_request_params(lat, lon, friday_date):
+    """Parametri per la richiesta API"""
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'hourly': 'temperature_2m,weather_code,relative_humidity_2m,wind_speed_10m,apparent_temperature',
+        'start_date': friday_date,
+        'end_date': friday_date,
+        'timezone': 'Europe/Rome'
+    }
+
+
+def parse_weather_response(response, friday_date):
+    """Estrae dalla risposta di Open-Meteo le previsioni delle ore di interesse"""
+    if response.status_code != 200:
+        return {
+            'success': False,
+            'error': f'API Error: {response.status_code}'
+        }
+
+    columns = extract_evening_columns(response.json().get('hourly', {}), friday_date)
+
+    # Una riga per ora, con la struttura attesa dal componente meteo del dashboard
+    forecasts = [
+        {
+            'datetime': time_str,
+            'hour': hour,
+            'temperature': temperature,
+            'feels_like': feels_like,
+            'description': description,
+            'icon': icon,
+            'humidity': humidity,
+            'wind_speed': wind_speed
+        }
+        for time_str, hour, temperature, feels_like, description, icon, humidity, wind_speed in zip(
+            columns['datetime'], columns['hours'], columns['temperature'], columns['feels_like'],
+            columns['description'], columns['icon'], columns['humidity'], columns['wind_speed']
+        )
+    ]
+
+    weather_data = {
+        'success': True,
+        'date': friday_date,
+        'day_name': 'Venerdì',
+        'min_temp': columns['min_temp'],
+        'max_temp': columns['max_temp'],
+        'forecasts': forecasts,
+        'city': 'Reggio Emilia'
+    }
+
+    return weather_data
+
+
+def extract_evening_columns(hourly_data, friday_date):
+    """
+    Previsioni delle ore di interesse in colonne (una lista per grandezza),
+    elaborate per array: maschera delle ore, selezione e conversioni su
+    ogni colonna intera invece che ora per ora.
+    """
+    times = hourly_data.get('time', [])
+    size = len(times)
+    temperatures = _pad(hourly_data.get('temperature_2m', []), size, None)
+
+    # Ore di interesse del venerdì: maschera calcolata una volta per tutte le colonne
+    hours = [datetime.fromisoformat(time_str).hour for time_str in times]
+    mask = [hour in TARGET_HOURS for hour in hours]
+
+    def select(values, default):
+        return list(compress(_pad(values, size, default), mask))
+
+    selected_hours = list(compress(hours, mask))
+    codes = select(hourly_data.get('weather_code', []), 0)
+    is_day = [6 <= hour <= 18 for hour in selected_hours]
+
+    # Tutte le temperature del venerdì per min/max
+    daily_temps = [temperature for temperature in temperatures if temperature is not None]
+
+    return {
+        'date': friday_date,
+        'datetime': list(compress(times, mask)),
+        'hours': [f"{hour:02d}:00" for hour in selected_hours],
+        'temperature': list(map(_round_or_zero, select(hourly_data.get('temperature_2m', []), 0))),
+        'feels_like': list(map(_round_or_zero, select(hourly_data.get('apparent_temperature', []), 0))),
+        'description': list(map(get_weather_description, codes)),
+        'icon': list(map(get_weather_icon, codes, is_day)),
+        'humidity': list(map(_round_or_zero, select(hourly_data.get('relative_humidity_2m', []), 0))),
+        'wind_speed': [round(speed, 1) for speed in select(hourly_data.get('wind_speed_10m', []), 0.0)],
+        'min_temp': round(min(daily_temps)) if daily_temps else None,
+        'max_temp': round(max(daily_temps)) if daily_temps else None,
+    }
+
+
+def _pad(values, size, default):
+    """Allinea una colonna alla lunghezza di 'time', come faceva il controllo i < len(...)"""
+    values = list(values[:size])
+    return values + [default] * (size - len(values))
+
+
+def _round_or_zero(value):
+    return round(value) if value is not None else 0
+
+
+def weather_error_payload(e):
+    """Dizionario di errore per un'eccezione durante la lettura delle previsioni"""
+    if isinstance(e, requests.exceptions.RequestException):
+        return {
+            'success': False,
+            'error': f'Network error: {str(e)}'
+        }
+    if isinstance(e, KeyError):
+        return {
+            'success': False,
+            'error': f'Data parsing error: {str(e)}'
+        }
+    return {
+        'success': False,
+        'error': f'Unexpected error: {str(e)}'
+    }